@@ -0,0 +1,168 @@
+"""
+End-to-end load test of the /chat streaming endpoint.
+
+Drives N concurrent /chat streams against a running routing backend and
+reports time-to-first-byte, time-to-first-token, total latency percentiles,
+tokens/sec and error rates. Run it against mock_llm.py to measure the
+backend itself without spending provider quota:
+
+    python mock_llm.py --port 8900 --rate 100 &
+    CHUTES_BASE_URL=http://127.0.0.1:8900/v1 GEMINI_BASE_URL=http://127.0.0.1:8900 \\
+        uvicorn deep_asgi:app --port 5000 &
+    python benchmarks/bench_chat.py --concurrency 32 --requests 256
+
+Tokens are counted as whitespace-separated words of the streamed content,
+which is exact for mock_llm.py and an approximation for real models.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import aiohttp
+
+
+def percentile(values, p):
+    # Nearest-rank percentile
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[int(rank) - 1]
+
+
+async def one_chat(session, url, payload):
+    result = {"ttfb": None, "ttft": None, "total": None, "tokens": 0, "frames": 0, "error": None}
+    start = time.perf_counter()
+    try:
+        async with session.post(url, json=payload) as response:
+            if response.status != 200:
+                await response.read()
+                result["error"] = f"http_{response.status}"
+                return result
+            content = []
+            buffer = b""
+            async for data in response.content.iter_any():
+                if result["ttfb"] is None:
+                    result["ttfb"] = time.perf_counter() - start
+                buffer += data
+                *lines, buffer = buffer.split(b"\n")
+                for line in lines:
+                    if not line.strip():
+                        continue
+                    frame = json.loads(line)
+                    result["frames"] += 1
+                    if "error" in frame:
+                        # Keep the first error; the stream carries on with other models
+                        result["error"] = result["error"] or "stream_error"
+                    elif "content" in frame and not frame.get("separator"):
+                        if result["ttft"] is None:
+                            result["ttft"] = time.perf_counter() - start
+                        content.append(frame["content"])
+            result["tokens"] = len("".join(content).split())
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        result["error"] = type(e).__name__
+    finally:
+        result["total"] = time.perf_counter() - start
+    return result
+
+
+async def run(args):
+    url = args.url.rstrip("/") + "/chat"
+    models = [{"value": model, "maxTokens": args.max_tokens} for model in args.model]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+        async def limited():
+            payload = {
+                "message": args.message,
+                "model": models,
+                "chat_id": str(uuid.uuid4()),
+                "parallel": args.parallel,
+            }
+            if args.coalesce_ms is not None:
+                payload["coalesce_ms"] = args.coalesce_ms
+            async with semaphore:
+                return await one_chat(session, url, payload)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(limited() for _ in range(args.requests)))
+        wall = time.perf_counter() - start
+    return results, wall
+
+
+def summarize(results, wall):
+    ok = [r for r in results if r["error"] is None]
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    def spread(key, rows):
+        values = [r[key] * 1000 for r in rows if r[key] is not None]
+        return {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+
+    tokens = sum(r["tokens"] for r in results)
+    stream_rates = [r["tokens"] / (r["total"] - r["ttft"]) for r in ok if r["ttft"] is not None and r["total"] > r["ttft"]]
+    return {
+        "requests": len(results),
+        "ok": len(ok),
+        "error_rate": (len(results) - len(ok)) / len(results) if results else 0,
+        "errors": errors,
+        "wall_s": wall,
+        "requests_per_s": len(results) / wall if wall else 0,
+        "ttfb_ms": spread("ttfb", results),
+        "ttft_ms": spread("ttft", results),
+        "latency_ms": spread("total", ok),
+        "tokens": tokens,
+        "tokens_per_s": tokens / wall if wall else 0,
+        "stream_tokens_per_s": {f"p{p}": percentile(stream_rates, p) for p in (50, 5)},
+        "frames_per_request": sum(r["frames"] for r in results) / len(results) if results else 0,
+    }
+
+
+def print_report(report):
+    def fmt(value):
+        return "-" if value is None else f"{value:,.1f}"
+
+    print(f"requests: {report['requests']}  ok: {report['ok']}  "
+          f"error rate: {report['error_rate']:.2%}  wall: {report['wall_s']:.2f} s  "
+          f"({report['requests_per_s']:.1f} req/s)")
+    for name in ("ttfb_ms", "ttft_ms", "latency_ms"):
+        row = report[name]
+        print(f"{name:>12}: p50 {fmt(row['p50']):>9}  p95 {fmt(row['p95']):>9}  p99 {fmt(row['p99']):>9}")
+    print(f"      tokens: {report['tokens']:,}  aggregate {report['tokens_per_s']:,.0f} tokens/s  "
+          f"per stream p50 {fmt(report['stream_tokens_per_s']['p50'])}  p5 {fmt(report['stream_tokens_per_s']['p5'])}")
+    print(f"      frames: {report['frames_per_request']:.1f} per request")
+    for kind, count in sorted(report["errors"].items()):
+        print(f"       error: {kind} x{count}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--model", action="append", help="model to request (repeat for multi-model chats)")
+    parser.add_argument("--parallel", action="store_true", help="stream multiple models concurrently")
+    parser.add_argument("--message", default="Write a short story about a lighthouse.")
+    parser.add_argument("--max-tokens", type=int, default=1024)
+    parser.add_argument("--coalesce-ms", type=float, default=None)
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    args.model = args.model or ["deepseek-ai/DeepSeek-R1"]
+
+    results, wall = asyncio.run(run(args))
+    report = summarize(results, wall)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Load test of the Django chats API: sync (WSGI) views against async (ASGI) views.
+
+Logs in (signing the user up first if needed), seeds a few chats with
+messages, then drives concurrent full history loads mixed with message saves
+against one set of chats endpoints and reports latency percentiles,
+throughput and errors. Run it once per deployment mode, e.g.:
+
+    # sync DRF views under a threaded WSGI server
+    gunicorn taskPlanning.wsgi -w 1 --threads 8 -b 127.0.0.1:8000 &
+    python benchmarks/bench_django.py --prefix /api/chats/
+
+    # async views under an ASGI server
+    uvicorn taskPlanning.asgi:application --port 8000 &
+    python benchmarks/bench_django.py --prefix /api/chats-async/
+
+or once per database connection mode (DB_POOL=none / persistent / pool in
+the server's environment), e.g. with --write-ratio 1 to measure saves only.
+The server's connection statistics (/api/db-pool-stats/) are reported too.
+
+Histories are served from the cache once loaded. Start the server with
+CACHE_BACKEND=django.core.cache.backends.dummy.DummyCache to measure the
+database path.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import aiohttp
+import yarl
+
+from bench_chat import percentile
+
+
+class Session:
+    def __init__(self, session, url):
+        self.session = session
+        self.url = url.rstrip("/")
+        self.origin = yarl.URL(self.url)
+
+    def headers(self):
+        cookie = self.session.cookie_jar.filter_cookies(self.origin).get("csrftoken")
+        return {"X-CSRFToken": cookie.value} if cookie else {}
+
+    async def request(self, method, path, **kwargs):
+        async with self.session.request(method, self.url + path, headers=self.headers(), **kwargs) as response:
+            body = await response.read()
+            return response.status, body
+
+    async def login(self, username, password):
+        await self.request("GET", "/api/users/csrf/")
+        credentials = {"username": username, "password": password}
+        status, _ = await self.request("POST", "/api/users/login/", json=credentials)
+        if status == 401:
+            await self.request("POST", "/api/users/signup/", json={**credentials, "name": "Bench User"})
+            status, _ = await self.request("POST", "/api/users/login/", json=credentials)
+        if status != 200:
+            raise SystemExit(f"login failed with HTTP {status}")
+
+
+async def seed(client, prefix, chats, messages):
+    chat_ids = [str(uuid.uuid4()) for _ in range(chats)]
+    for chat_id in chat_ids:
+        batch = [
+            {
+                "chat_id": chat_id,
+                "chat_name": "bench",
+                "message_id": str(uuid.uuid4()),
+                "message": {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " * 20},
+            }
+            for i in range(messages)
+        ]
+        status, body = await client.request("POST", prefix + "save-chat-batch/", json={"messages": batch})
+        if status != 200:
+            raise SystemExit(f"seeding failed with HTTP {status}: {body[:200]!r}")
+    return chat_ids
+
+
+async def one_request(client, prefix, chat_ids, write_ratio):
+    chat_id = random.choice(chat_ids)
+    if random.random() < write_ratio:
+        kind = "save"
+        message = {"role": "user", "content": "benchmark message"}
+        request = client.request("POST", prefix + "save-chat/", json={
+            "chat_id": chat_id, "message": message, "message_id": str(uuid.uuid4()),
+        })
+    else:
+        kind = "history"
+        request = client.request("GET", f"{prefix}get-chat-history/{chat_id}/")
+
+    start = time.perf_counter()
+    try:
+        status, body = await request
+        error = None if status == 200 else f"http_{status}"
+        if error is None and kind == "history":
+            json.loads(body)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        error = type(e).__name__
+    return {"kind": kind, "latency": time.perf_counter() - start, "error": error}
+
+
+async def run(args):
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    # unsafe: keep cookies for IP-address hosts like 127.0.0.1
+    jar = aiohttp.CookieJar(unsafe=True)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector, cookie_jar=jar) as session:
+        client = Session(session, args.url)
+        await client.login(args.username, args.password)
+        chat_ids = await seed(client, args.prefix, args.chats, args.messages)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def limited():
+            async with semaphore:
+                return await one_request(client, args.prefix, chat_ids, args.write_ratio)
+
+        _, before = await client.request("GET", "/api/db-pool-stats/")
+        start = time.perf_counter()
+        results = await asyncio.gather(*(limited() for _ in range(args.requests)))
+        wall = time.perf_counter() - start
+        _, after = await client.request("GET", "/api/db-pool-stats/")
+
+        for chat_id in chat_ids:
+            await client.request("DELETE", f"{args.prefix}delete-chat/{chat_id}/")
+    return results, wall, db_stats(before, after)
+
+
+def db_stats(before, after):
+    """The server's connection counters over the run (they are per process)."""
+    try:
+        before, after = json.loads(before), json.loads(after)
+    except ValueError:
+        return None
+    stats = {"mode": after["mode"], "connections_opened": after["connections_opened"] - before["connections_opened"]}
+    if after["pool"] and before["pool"]:
+        for key in ("requests_num", "requests_queued", "requests_wait_ms", "requests_errors", "connections_lost"):
+            stats[key] = after["pool"].get(key, 0) - before["pool"].get(key, 0)
+        stats["pool_size"] = after["pool"].get("pool_size")
+    return stats
+
+
+def summarize(results, wall, prefix, db=None):
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+    report = {
+        "prefix": prefix,
+        "requests": len(results),
+        "error_rate": sum(errors.values()) / len(results) if results else 0,
+        "errors": errors,
+        "wall_s": wall,
+        "requests_per_s": len(results) / wall if wall else 0,
+        "db": db,
+    }
+    for kind in ("history", "save"):
+        values = [r["latency"] * 1000 for r in results if r["kind"] == kind and r["error"] is None]
+        report[f"{kind}_ms"] = {f"p{p}": percentile(values, p) for p in (50, 95, 99)}
+        report[f"{kind}_count"] = len(values)
+    return report
+
+
+def print_report(report):
+    def fmt(value):
+        return "-" if value is None else f"{value:,.1f}"
+
+    print(f"{report['prefix']}  requests: {report['requests']}  error rate: {report['error_rate']:.2%}  "
+          f"wall: {report['wall_s']:.2f} s  ({report['requests_per_s']:.1f} req/s)")
+    for kind in ("history", "save"):
+        row = report[f"{kind}_ms"]
+        print(f"{kind:>9} x{report[f'{kind}_count']:<5}: p50 {fmt(row['p50']):>9}  "
+              f"p95 {fmt(row['p95']):>9}  p99 {fmt(row['p99']):>9} ms")
+    for kind, count in sorted(report["errors"].items()):
+        print(f"    error: {kind} x{count}")
+    db = report["db"]
+    if db:
+        line = f"       db: mode {db['mode']}  connections opened {db['connections_opened']}"
+        if "requests_num" in db:
+            queued = db["requests_queued"]
+            line += (f"  checkouts {db['requests_num']}  waited {queued}"
+                     f" (avg {db['requests_wait_ms'] / queued if queued else 0:.1f} ms)"
+                     f"  timeouts {db['requests_errors']}  pool size {db['pool_size']}")
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--prefix", default="/api/chats/", help="/api/chats/ (sync) or /api/chats-async/")
+    parser.add_argument("--username", default="bench")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--messages", type=int, default=200, help="messages per seeded chat")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--write-ratio", type=float, default=0.1, help="share of requests that save a message")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args()
+    if not args.prefix.endswith("/"):
+        args.prefix += "/"
+
+    results, wall, db = asyncio.run(run(args))
+    report = summarize(results, wall, args.prefix, db)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
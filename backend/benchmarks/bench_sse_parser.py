@@ -0,0 +1,116 @@
+"""
+Micro-benchmark: incremental SSE parser vs. the previous line-by-line path.
+
+Builds a synthetic OpenAI-style stream, cuts it into network-sized reads and
+runs both parsing paths over it, including the per-token frame serialization.
+
+    python benchmarks/bench_sse_parser.py --tokens 20000 --read-size 1024
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from sse_parser import JSON_BACKEND, SSEParser, dumps  # noqa: E402
+
+
+def build_stream(tokens):
+    events = [b'data: {"id":"x","choices":[{"index":0,"delta":{"role":"assistant","content":""}}]}\n\n']
+    for i in range(tokens):
+        chunk = {
+            "id": "chatcmpl-bench",
+            "object": "chat.completion.chunk",
+            "created": 1700000000,
+            "model": "deepseek-ai/DeepSeek-R1",
+            "choices": [{"index": 0, "delta": {"content": f" tok{i}"}, "logprobs": None, "finish_reason": None}],
+        }
+        events.append(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+    events.append(b"data: [DONE]\n\n")
+    return b"".join(events)
+
+
+def split_reads(stream, read_size):
+    # Network reads rarely line up with event boundaries
+    rng = random.Random(0)
+    reads = []
+    i = 0
+    while i < len(stream):
+        n = rng.randint(read_size // 2, read_size * 3 // 2)
+        reads.append(stream[i:i + n])
+        i += n
+    return reads
+
+
+def legacy_lines(reads):
+    # aiohttp's `async for line in response.content` yields complete lines
+    return b"".join(reads).splitlines(keepends=True)
+
+
+def legacy_path(lines):
+    # The previous per-line code in invoke_chute
+    out = []
+    for line in lines:
+        line = line.decode("utf-8").strip()
+        if line.startswith("data: "):
+            data = line[6:]
+            if data == "[DONE]":
+                break
+            try:
+                chunk = json.loads(data)
+                if chunk and "choices" in chunk and len(chunk["choices"]) > 0:
+                    content = chunk["choices"][0].get("delta", {}).get("content", "")
+                    if content:
+                        out.append(json.dumps({"content": content}) + "\n")
+            except Exception as e:
+                out.append(json.dumps({"error": f"Error parsing chunk: {str(e)}"}) + "\n")
+    return out
+
+
+def parser_path(reads):
+    out = []
+    parser = SSEParser()
+    for data in reads:
+        for content in parser.feed(data):
+            if type(content) is str:
+                out.append(dumps({"content": content}) + "\n")
+        if parser.done:
+            break
+    return out
+
+
+def bench(fn, arg, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(arg)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tokens", type=int, default=20000)
+    parser.add_argument("--read-size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    stream = build_stream(args.tokens)
+    reads = split_reads(stream, args.read_size)
+    lines = legacy_lines(reads)
+
+    legacy_time, legacy_out = bench(legacy_path, lines, args.repeat)
+    parser_time, parser_out = bench(parser_path, reads, args.repeat)
+    assert len(legacy_out) == len(parser_out) == args.tokens
+
+    print(f"stream: {args.tokens} tokens, {len(stream) / 1024:.0f} KiB in {len(reads)} reads; json backend: {JSON_BACKEND}")
+    for name, elapsed in (("legacy", legacy_time), ("sse_parser", parser_time)):
+        print(f"{name:>12}: {elapsed * 1000:8.1f} ms  {args.tokens / elapsed:12,.0f} tokens/s")
+    print(f"     speedup: {legacy_time / parser_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Authentication and chat ownership checks for the routing backend.
+
+The routing backend has no users of its own. Requests are authenticated with
+the Django session cookie, which the browser sends along since both backends
+are served from the same host: the session is checked against the Django
+backend's session-check endpoint and the result is cached for a short time.
+
+A chat is only served to the user it belongs to. Its owner is read from the
+`chats_chats` table; a chat that has not been saved yet belongs to the user
+who created it with /new-chat (or who used it first).
+
+ROUTING_AUTH=0 turns the checks off, e.g. to benchmark against mock_llm.py.
+Requests are then anonymous, and nothing is read from or written to the
+database on their behalf.
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+import uuid
+
+import requests
+
+ENABLED = os.environ.get("ROUTING_AUTH", "1") != "0"
+DJANGO_URL = os.environ.get("DJANGO_URL", "http://localhost:8000").rstrip("/")
+SESSION_COOKIE = os.environ.get("DJANGO_SESSION_COOKIE", "sessionid")
+# Seconds a checked session is trusted before Django is asked again
+SESSION_CACHE_SECONDS = float(os.environ.get("SESSION_CACHE_SECONDS", 30))
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", 10000))
+SESSION_CHECK_TIMEOUT = float(os.environ.get("SESSION_CHECK_TIMEOUT", 5))
+CHAT_OWNER_CACHE_SIZE = int(os.environ.get("CHAT_OWNER_CACHE_SIZE", 100000))
+
+
+def valid_chat_id(chat_id):
+    try:
+        uuid.UUID(str(chat_id))
+    except ValueError:
+        return False
+    return True
+
+
+class SessionAuth:
+    """Maps Django session keys to user ids, asking the Django backend."""
+
+    def __init__(self, url=DJANGO_URL, ttl=SESSION_CACHE_SECONDS, max_entries=SESSION_CACHE_SIZE,
+                 timeout=SESSION_CHECK_TIMEOUT):
+        self.url = f"{url}/api/users/session-check/"
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def user_id(self, session_key):
+        """The id of the session's user, or None if it is not logged in."""
+        if not session_key:
+            return None
+        with self._lock:
+            entry = self._sessions.get(session_key)
+            if entry is not None and entry[0] > time.monotonic():
+                return entry[1]
+
+        try:
+            response = requests.get(self.url, cookies={SESSION_COOKIE: session_key}, timeout=self.timeout)
+            user_id = response.json().get("user_id") if response.status_code == 200 else None
+        except (requests.RequestException, ValueError) as e:
+            # Not cached: the next request asks again
+            print(f"Session check failed: {e}")
+            return None
+
+        with self._lock:
+            self._sessions[session_key] = (time.monotonic() + self.ttl, user_id)
+            self._sessions.move_to_end(session_key)
+            while len(self._sessions) > self.max_entries:
+                self._sessions.popitem(last=False)
+        return user_id
+
+
+class ChatAccess:
+    """
+    Decides whether a user may use a chat. `owner(chat_id)` returns the
+    user id stored for the chat, or None if it has no row (None when the
+    database is not configured).
+    """
+
+    def __init__(self, owner=None, max_chats=CHAT_OWNER_CACHE_SIZE):
+        self.owner = owner
+        self.max_chats = max_chats
+        # chat_id -> user_id; a chat never changes hands
+        self._owners = OrderedDict()
+        self._lock = threading.Lock()
+
+    def claim(self, chat_id, user_id):
+        """Record a new chat as the user's."""
+        with self._lock:
+            self._remember(chat_id, user_id)
+
+    def allowed(self, chat_id, user_id):
+        if not valid_chat_id(chat_id):
+            return False
+        chat_id = str(chat_id)
+        with self._lock:
+            owner = self._owners.get(chat_id)
+            if owner is not None:
+                self._owners.move_to_end(chat_id)
+                return owner == user_id
+
+        if self.owner is not None:
+            try:
+                owner = self.owner(chat_id)
+            except Exception as e:
+                print(f"Chat owner lookup failed for chat {chat_id}: {e}")
+                return False
+
+        with self._lock:
+            if owner is None:
+                # Not saved yet: the chat is the first user's to use it
+                owner = self._owners.get(chat_id, user_id)
+            self._remember(chat_id, owner)
+        return owner == user_id
+
+    def _remember(self, chat_id, user_id):
+        self._owners[str(chat_id)] = user_id
+        self._owners.move_to_end(str(chat_id))
+        while len(self._owners) > self.max_chats:
+            self._owners.popitem(last=False)
@@ -0,0 +1,258 @@
+"""
+Token-budgeted context window for the model requests.
+
+Long chats are not sent to the model in full. The history is fitted into a
+per-model prompt budget: the system prompt and the most recent turns are kept
+verbatim, and older turns are replaced by a rolling summary. Summaries are
+cached per chat (and optionally persisted to CONTEXT_SUMMARY_DIR) so they are
+only extended when enough new turns have fallen out of the window.
+"""
+from collections import OrderedDict, deque
+import hashlib
+import json
+import os
+import threading
+
+# Context window (in tokens) of each supported model
+MODEL_CONTEXT_WINDOWS = {
+    "deepseek-ai/DeepSeek-R1": 163840,
+    "deepseek-ai/DeepSeek-R1-0528": 163840,
+    "deepseek-ai/DeepSeek-V3-0324": 163840,
+    "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B": 32768,
+    "gemini-2.5-flash-preview-05-20": 1048576,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+# Upper bound for the prompt regardless of the model's window (cost control)
+PROMPT_BUDGET = int(os.environ.get("CONTEXT_PROMPT_BUDGET", 32000))
+# Share of the budget reserved for verbatim recent turns
+RECENT_SHARE = float(os.environ.get("CONTEXT_RECENT_SHARE", 0.6))
+# Always keep at least this many recent messages verbatim
+MIN_RECENT_MESSAGES = int(os.environ.get("CONTEXT_MIN_RECENT_MESSAGES", 4))
+SUMMARY_DIR = os.environ.get("CONTEXT_SUMMARY_DIR", "")
+SUMMARY_CACHE_SIZE = int(os.environ.get("CONTEXT_SUMMARY_CACHE_SIZE", 1000))
+
+MESSAGE_OVERHEAD_TOKENS = 4
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+
+
+def estimate_tokens(text):
+    """
+    Fast local token estimate: ~4 characters per token for ASCII text and
+    one token per non-ASCII character (CJK, emoji, ...).
+    """
+    if not text:
+        return 0
+    length = len(text)
+    ascii_length = len(text.encode("ascii", "ignore"))
+    return (ascii_length + 3) // 4 + (length - ascii_length)
+
+
+def message_tokens(message):
+    return estimate_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD_TOKENS
+
+
+def prompt_budget(model, max_tokens):
+    # Whatever the window leaves after reserving room for the answer
+    window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+    return max(1024, min(PROMPT_BUDGET, window - max_tokens))
+
+
+def fingerprint(messages):
+    digest = hashlib.sha1()
+    for message in messages:
+        digest.update(message.get("role", "").encode("utf-8"))
+        digest.update(str(message.get("content", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    """
+    LRU of chat_id -> {"covered": n, "fingerprint": ..., "summary": ...}
+    where the summary covers the first n non-system messages of the chat.
+    """
+
+    def __init__(self, max_entries=SUMMARY_CACHE_SIZE, directory=SUMMARY_DIR):
+        self.max_entries = max_entries
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, chat_id):
+        name = hashlib.sha1(str(chat_id).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, chat_id):
+        with self._lock:
+            entry = self._entries.get(chat_id)
+            if entry is not None:
+                self._entries.move_to_end(chat_id)
+                return entry
+        if self.directory:
+            try:
+                with open(self._path(chat_id), encoding="utf-8") as f:
+                    entry = json.load(f)
+            except (OSError, ValueError):
+                return None
+            self._remember(chat_id, entry)
+            return entry
+        return None
+
+    def set(self, chat_id, entry):
+        self._remember(chat_id, entry)
+        if self.directory:
+            with open(self._path(chat_id), "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+
+    def _remember(self, chat_id, entry):
+        with self._lock:
+            self._entries[chat_id] = entry
+            self._entries.move_to_end(chat_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class ContextManager:
+    """
+    Fits a chat history into a model's prompt budget.
+    `summarize(previous_summary, messages)` is a coroutine returning the
+    summary of the previous summary plus the given messages.
+    """
+
+    def __init__(self, summarize=None, cache=None):
+        self.summarize = summarize
+        self.cache = cache or SummaryCache()
+        self.requests = 0
+        self.trimmed_requests = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.summaries_built = 0
+        self.summary_cache_hits = 0
+        self.recent = deque(maxlen=100)
+        self._lock = threading.Lock()
+
+    async def fit(self, chat_id, messages, model, max_tokens):
+        budget = prompt_budget(model, max_tokens)
+        tokens = [message_tokens(message) for message in messages]
+        total = sum(tokens)
+        if total <= budget:
+            self._record(chat_id, model, budget, total, total, 0, False)
+            return messages
+
+        # The latest non-empty system prompt is always kept verbatim
+        system = None
+        for message in reversed(messages):
+            if message.get("role") == "system" and message.get("content"):
+                system = message
+                break
+        turns = [(m, t) for m, t in zip(messages, tokens) if m.get("role") != "system"]
+        system_tokens = message_tokens(system) if system else 0
+
+        # Recent turns, newest first, until their share of the budget is used
+        recent_budget = max(0, int(budget * RECENT_SHARE) - system_tokens)
+        split = len(turns)
+        used = 0
+        while split > 0:
+            cost = turns[split - 1][1]
+            if len(turns) - split >= MIN_RECENT_MESSAGES and used + cost > recent_budget:
+                break
+            used += cost
+            split -= 1
+
+        older = [m for m, _ in turns[:split]]
+        summary, carried, cached = await self._summary(chat_id, older, budget - system_tokens - used)
+
+        fitted = [system] if system else []
+        if summary:
+            fitted.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+        fitted.extend(carried)
+        fitted.extend(m for m, _ in turns[split:])
+
+        # Still too large (huge recent messages): drop the oldest verbatim turns
+        fitted_tokens = sum(message_tokens(m) for m in fitted)
+        start = 1 if system else 0
+        if summary:
+            start += 1
+        while fitted_tokens > budget and len(fitted) - start > 1:
+            fitted_tokens -= message_tokens(fitted.pop(start))
+
+        self._record(chat_id, model, budget, total, fitted_tokens, len(older) - len(carried), cached)
+        return fitted
+
+    async def _summary(self, chat_id, older, room):
+        """
+        Return (summary, carried, from_cache) for the `older` messages, where
+        `carried` are older messages kept verbatim after the summary. A cached
+        summary is reused as long as the messages it does not cover still fit
+        into `room`; otherwise it is extended with just those messages.
+        """
+        if not older or self.summarize is None:
+            return None, [], False
+
+        entry = self.cache.get(chat_id)
+        covered = 0
+        previous = ""
+        if entry and entry["covered"] <= len(older) and entry["fingerprint"] == fingerprint(older[:entry["covered"]]):
+            covered = entry["covered"]
+            previous = entry["summary"]
+        if entry and covered:
+            carried = older[covered:]
+            if estimate_tokens(previous) + sum(message_tokens(m) for m in carried) <= room:
+                with self._lock:
+                    self.summary_cache_hits += 1
+                return previous, carried, True
+
+        try:
+            summary = await self.summarize(previous, older[covered:])
+        except Exception as e:
+            print(f"Context summary failed for chat {chat_id}: {e}")
+            # Fall back to the (possibly stale) cached summary, or to truncation
+            return previous or None, [], bool(previous)
+        if not summary:
+            return previous or None, [], bool(previous)
+
+        # Keep the summary within what is left of the budget
+        if estimate_tokens(summary) > room > 0:
+            summary = summary[: room * 4]
+
+        self.cache.set(chat_id, {
+            "covered": len(older),
+            "fingerprint": fingerprint(older),
+            "summary": summary,
+        })
+        with self._lock:
+            self.summaries_built += 1
+        return summary, [], False
+
+    def _record(self, chat_id, model, budget, tokens_in, tokens_out, summarized, cached):
+        with self._lock:
+            self.requests += 1
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            if tokens_out < tokens_in:
+                self.trimmed_requests += 1
+            self.recent.append({
+                "chat_id": chat_id,
+                "model": model,
+                "budget": budget,
+                "tokens_in": tokens_in,
+                "tokens_out": tokens_out,
+                "tokens_saved": tokens_in - tokens_out,
+                "summarized_messages": summarized,
+                "summary_cached": cached,
+            })
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "trimmed_requests": self.trimmed_requests,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": self.tokens_in - self.tokens_out,
+                "summaries_built": self.summaries_built,
+                "summary_cache_hits": self.summary_cache_hits,
+                "recent_requests": list(self.recent),
+            }
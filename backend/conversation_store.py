@@ -0,0 +1,166 @@
+"""
+In-process conversation store keyed by chat_id.
+
+Keeps the message history of the most recently used chats in memory so that
+concurrent users do not share a single history, and so that switching back to
+a chat does not require the client to upload its history again. The store is
+bounded by a message and a byte budget; least recently used chats are evicted
+first.
+"""
+from collections import OrderedDict
+import os
+import threading
+
+MAX_CHATS = int(os.environ.get("CONVERSATION_STORE_MAX_CHATS", 1000))
+MAX_MESSAGES = int(os.environ.get("CONVERSATION_STORE_MAX_MESSAGES", 50000))
+MAX_BYTES = int(os.environ.get("CONVERSATION_STORE_MAX_BYTES", 64 * 1024 * 1024))
+
+
+def message_size(message):
+    # Approximate memory footprint of a message: the size of its text
+    return len(str(message.get("content", "")).encode("utf-8"))
+
+
+class Conversation:
+    __slots__ = ("messages", "nbytes", "revision")
+
+    def __init__(self):
+        self.messages = []
+        self.nbytes = 0
+        self.revision = 0
+
+    def append(self, message):
+        size = message_size(message)
+        self.messages.append(message)
+        self.nbytes += size
+        return size
+
+
+class ConversationStore:
+    """
+    LRU map of chat_id -> Conversation with a global message/byte budget.
+    All methods are thread safe; lists handed out are copies.
+    """
+
+    def __init__(self, max_chats=MAX_CHATS, max_messages=MAX_MESSAGES, max_bytes=MAX_BYTES):
+        self.max_chats = max_chats
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self._chats = OrderedDict()
+        self._lock = threading.RLock()
+        self._messages = 0
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Incremented on every write; tells whether a chat changed since a revision was read
+        self._revision = 0
+
+    def __contains__(self, chat_id):
+        with self._lock:
+            return chat_id in self._chats
+
+    def touch(self, chat_id):
+        """Mark the chat as recently used. Returns whether it is cached."""
+        with self._lock:
+            if chat_id not in self._chats:
+                self.misses += 1
+                return False
+            self.hits += 1
+            self._chats.move_to_end(chat_id)
+            return True
+
+    def get(self, chat_id):
+        """Return a copy of the chat's messages, or None if it is not cached."""
+        with self._lock:
+            conversation = self._chats.get(chat_id)
+            if conversation is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._chats.move_to_end(chat_id)
+            return list(conversation.messages)
+
+    def messages(self, chat_id):
+        """Return a copy of the chat's messages (empty if it is not cached)."""
+        return self.get(chat_id) or []
+
+    def last_message(self, chat_id):
+        with self._lock:
+            conversation = self._chats.get(chat_id)
+            if conversation is None or not conversation.messages:
+                return None
+            return conversation.messages[-1]
+
+    def revision(self, chat_id):
+        """Return the chat's current revision, or None if it is not cached."""
+        with self._lock:
+            conversation = self._chats.get(chat_id)
+            return None if conversation is None else conversation.revision
+
+    def append(self, chat_id, message):
+        self.extend(chat_id, [message])
+
+    def extend(self, chat_id, messages):
+        """Append messages to the chat. Returns the chat's new revision."""
+        with self._lock:
+            conversation = self._entry(chat_id)
+            for message in messages:
+                self._bytes += conversation.append(message)
+                self._messages += 1
+            self._revision += 1
+            conversation.revision = self._revision
+            self._evict(keep=chat_id)
+            return conversation.revision
+
+    def replace(self, chat_id, messages):
+        """Set the chat's full history, e.g. when it is loaded from the database."""
+        with self._lock:
+            self.discard(chat_id)
+            return self.extend(chat_id, messages)
+
+    def discard(self, chat_id):
+        with self._lock:
+            conversation = self._chats.pop(chat_id, None)
+            if conversation is not None:
+                self._messages -= len(conversation.messages)
+                self._bytes -= conversation.nbytes
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "chats": len(self._chats),
+                "messages": self._messages,
+                "bytes": self._bytes,
+                "max_chats": self.max_chats,
+                "max_messages": self.max_messages,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+            }
+
+    def _entry(self, chat_id):
+        conversation = self._chats.get(chat_id)
+        if conversation is None:
+            conversation = self._chats[chat_id] = Conversation()
+        self._chats.move_to_end(chat_id)
+        return conversation
+
+    def _over_budget(self):
+        return (
+            len(self._chats) > self.max_chats
+            or self._messages > self.max_messages
+            or self._bytes > self.max_bytes
+        )
+
+    def _evict(self, keep):
+        # Evict least recently used chats, but never the one being written
+        while self._over_budget() and len(self._chats) > 1:
+            chat_id = next(iter(self._chats))
+            if chat_id == keep:
+                break
+            self.discard(chat_id)
+            self.evictions += 1
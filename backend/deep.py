@@ -1,186 +1,439 @@
 from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
-import aiohttp
 import asyncio
-import json
 from dotenv import load_dotenv
 import os
 from google import genai
-from google.genai import types
+from google.genai import errors, types
 import uuid
+from loop_bridge import BackgroundLoop, get_session
+from conversation_store import ConversationStore
+from context_window import ContextManager
+from sse_parser import SSEParser, dumps, loads
+from frame_coalescer import coalesce_frames, coalesce_options
+from title_service import TitleService
+from gemini_sessions import GeminiSessionCache
+from history_hydration import HistoryHydrator
+import chat_access
+from chat_access import ChatAccess, SessionAuth
+from message_writer import MessageWriter, persist_response
+import metrics
 
 load_dotenv()
 
-app = Flask(__name__)
 # Update CORS to allow both localhost:5174 and standard React development port
-CORS(app, origins=["http://localhost:5173", "http://localhost:3000", "http://127.0.0.1:5173", "http://127.0.0.1:3000", "http://localhost:5174", "http://127.0.1:5174"])
+CORS_ORIGINS = ["http://localhost:5173", "http://localhost:3000", "http://127.0.0.1:5173", "http://127.0.0.1:3000", "http://localhost:5174", "http://127.0.1:5174"]
 
-supported_models = ["deepseek-ai/DeepSeek-R1", "deepseek-ai/DeepSeek-R1-0528", "deepseek-ai/DeepSeek-V3-0324", "gemini-2.5-flash-preview-05-20", "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"]
+app = Flask(__name__)
+# Credentials: requests carry the Django session cookie (see chat_access)
+CORS(app, origins=CORS_ORIGINS, supports_credentials=True)
 
-# Store chat histories
-chat_histories = {}
+supported_models = ["deepseek-ai/DeepSeek-R1", "deepseek-ai/DeepSeek-R1-0528", "deepseek-ai/DeepSeek-V3-0324", "gemini-2.5-flash-preview-05-20", "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"]
 
 # Initialize Gemini client once
 gemini_api_token = os.environ.get("GEMINI_API_KEY", "")
-gemini_client = genai.Client(api_key=gemini_api_token)
-gemini_chat = None  # global chat
+# GEMINI_BASE_URL points the client at another endpoint (e.g. mock_llm.py)
+gemini_base_url = os.environ.get("GEMINI_BASE_URL", "")
+gemini_client = genai.Client(
+    api_key=gemini_api_token,
+    http_options=types.HttpOptions(base_url=gemini_base_url) if gemini_base_url else None,
+)
+# Gemini chat sessions reused across turns, keyed by chat, model and config
+gemini_sessions = GeminiSessionCache()
+
+# Per-chat message histories, keyed by chat_id
+conversations = ConversationStore()
+# Loads histories of chats that are not in memory straight from the Django database
+history_hydrator = HistoryHydrator(conversations)
+# Persists assistant responses to the Django database in the background
+message_writer = MessageWriter()
+# Requests are authenticated with the Django session; chats are only served to their owner
+sessions = SessionAuth()
+chat_owners = ChatAccess(history_hydrator.loader.owner)
+
+# Any OpenAI-compatible endpoint can stand in for Chutes (e.g. mock_llm.py)
+CHUTES_BASE_URL = os.environ.get("CHUTES_BASE_URL", "https://llm.chutes.ai/v1").rstrip("/")
+CHUTES_URL = f"{CHUTES_BASE_URL}/chat/completions"
+TITLE_MODEL = "gemini-2.5-flash-preview-05-20"
+SUMMARY_MODEL = os.environ.get("CONTEXT_SUMMARY_MODEL", "gemini-2.5-flash-preview-05-20")
+
+# One event loop + pooled aiohttp session shared by all Flask request threads.
+# The ASGI entry point (deep_asgi.py) runs the same coroutines on its own loop.
+background_loop = BackgroundLoop(name="model-streams")
+
+
+# ---------------------------------------------------------------------------
+# Shared request handling (used by both the Flask and the ASGI entry points)
+# ---------------------------------------------------------------------------
+
+def encode_frame(frame):
+    # One NDJSON line per frame
+    return dumps(frame) + "\n"
+
+async def ndjson_stream(frames):
+    async for frame in frames:
+        yield encode_frame(frame)
+
+def model_config(model_entry):
+    # Map the frontend's model settings onto the config used by invoke_*
+    return {
+        "system_prompt": model_entry.get("systemPrompt", ""),
+        "temperature": model_entry.get("temperature", 0.7),
+        "max_tokens": model_entry.get("maxTokens", 16384),
+        "top_p": model_entry.get("topP", 1.0),
+        "min_p": model_entry.get("minP", 0.0),
+    }
+
+def request_user(session_key):
+    """
+    Authenticate a request by its Django session cookie. Returns
+    (user_id, error, status), error being None when the request may go on.
+    With ROUTING_AUTH=0 every request is anonymous (user_id None).
+    """
+    if not chat_access.ENABLED:
+        return None, None, 200
+    user_id = sessions.user_id(session_key)
+    if user_id is None:
+        return None, "Authentication required", 401
+    return user_id, None, 200
+
+def authorize_chat(session_key, chat_id):
+    """Like request_user, and also check that the chat is the user's."""
+    user_id, error, status = request_user(session_key)
+    if error or user_id is None:
+        return user_id, error, status
+    if not chat_access.valid_chat_id(chat_id):
+        return user_id, "Invalid chat ID", 400
+    if not chat_owners.allowed(chat_id, user_id):
+        return user_id, "You don't have access to this chat", 403
+    return user_id, None, 200
+
+def new_chat_id(user_id):
+    chat_id = str(uuid.uuid4())
+    if user_id is not None:
+        chat_owners.claim(chat_id, user_id)
+    return chat_id
+
+def validate_chat_request(data):
+    """
+    Validate a /chat payload. Returns an error message or None.
+    """
+    user_message = data.get("message")
+    modelsList = data.get("model")
+
+    if not modelsList or len(modelsList) == 0:
+        return "At least one model is required"
+    for model in modelsList:
+        if model.get("value", "") not in supported_models:
+            return f"Model {model.get('value', '')} not supported"
+    if not user_message:
+        return "Message is required"
+    return None
+
+def start_chat_turn(data, user_id=None):
+    """
+    Record the user's turn in the history and return the async frame generator
+    that streams every requested model's response. The responses are saved
+    for `user_id`, the chat's owner (not at all for anonymous requests).
+    With "parallel": true all models run concurrently (see generate_parallel).
+    """
+    user_message = data.get("message")
+    modelsList = data.get("model")
+    chat_id = data.get("chat_id")
+
+    config = model_config(modelsList[0])
 
-active_chat_history = []
+    # print(f"Received message: {user_message} for {len(modelsList)} models, chat_id: {chat_id}")
+
+    # Add user message to history once
+    last_message = conversations.last_message(chat_id)
+    if last_message is None or last_message.get("content") != config.get("system_prompt", ""):
+        conversations.append(chat_id, {"role": "system", "content": config.get("system_prompt", "")})
+    conversations.append(chat_id, {"role": "user", "content": user_message})
+
+    message_ids = response_message_ids(data.get("message_ids"), len(modelsList))
+    if data.get("parallel") and len(modelsList) > 1:
+        return generate_parallel(user_message, modelsList, chat_id, user_id, message_ids)
+    return generate_multi_model(user_message, modelsList, chat_id, user_id, message_ids)
+
+def response_message_ids(requested, count):
+    # The client may choose the ids of the responses it displays; the rest are generated
+    requested = requested if isinstance(requested, list) else []
+    message_ids = []
+    for i in range(count):
+        try:
+            message_ids.append(str(uuid.UUID(str(requested[i]))))
+        except (IndexError, ValueError):
+            message_ids.append(str(uuid.uuid4()))
+    return message_ids
+
+def persisting(user_id):
+    return message_writer.enabled and user_id is not None
+
+def persisted(frames, chat_id, user_id, message_ids, index, model_entry):
+    """Save the model's response to the user's chat as it streams (see message_writer)."""
+    if not persisting(user_id):
+        return frames
+    # Same text the frontend displays and used to save
+    prefix = f"**{model_entry.get('name') or f'Model {index + 1}'}:**\n"
+    return persist_response(frames, message_writer, chat_id, user_id, message_ids[index], prefix)
+
+async def generate_multi_model(user_message, modelsList, chat_id, user_id, message_ids):
+    # Process first model normally
+    first_model = modelsList[0].get("value", "")
+    config = model_config(modelsList[0])
+    if first_model.split("-")[0] == "deepseek":
+        response_generator = invoke_chute(user_message, first_model, chat_id, config)
+    elif first_model.split("-")[0] == "gemini":
+        response_generator = invoke_gemini(user_message, first_model, chat_id, config)
+    else:
+        yield {"error": f"Unsupported model: {first_model}"}
+        return
+
+    # Stream the first model's response
+    async for frame in persisted(response_generator, chat_id, user_id, message_ids, 0, modelsList[0]):
+        yield frame
+
+    # Process remaining models sequentially
+    for index, current_model_config in enumerate(modelsList[1:], start=1):
+        current_model = current_model_config.get("value", "")
+        current_config = model_config(current_model_config)
+
+        # Add delimiter between model responses (never merged with other content)
+        yield {"content": f"\n\n--- Response from {current_model} ---\n\n", "separator": True}
+
+        # Route to appropriate _next function
+        if current_model.split("-")[0] == "deepseek":
+            next_response = invoke_chute_next(user_message, current_model, chat_id, current_config)
+        elif current_model.split("-")[0] == "gemini":
+            next_response = invoke_gemini_next(user_message, current_model, chat_id, current_config)
+        else:
+            yield {"error": f"Unsupported model: {current_model}"}
+            continue
+
+        # Stream the current model's response
+        async for frame in persisted(next_response, chat_id, user_id, message_ids, index, current_model_config):
+            yield frame
+
+    if persisting(user_id):
+        # Tells the client it doesn't need to save the responses itself
+        yield {"persisted": True, "message_ids": message_ids}
+
+async def generate_parallel(user_message, modelsList, chat_id, user_id, message_ids):
+    """
+    Start every model at once and interleave their frames as they arrive.
+    Each frame is tagged with "model_index" and "model", and each model's
+    stream ends with a {"done": true} frame, preceded by an error frame if
+    the model failed. Every model answers the same history independently, so
+    total time is that of the slowest model. The responses are appended to
+    the chat history in model order.
+    """
+    frames = asyncio.Queue()
+    responses = [""] * len(modelsList)
+
+    async def run(index, model_entry):
+        model = model_entry.get("value", "")
+        tag = {"model_index": index, "model": model}
+        try:
+            config = model_config(model_entry)
+            if model.split("-")[0] == "deepseek":
+                response_generator = invoke_chute(user_message, model, chat_id, config, record=False)
+            elif model.split("-")[0] == "gemini":
+                response_generator = invoke_gemini(user_message, model, chat_id, config, record=False)
+            else:
+                await frames.put({**tag, "error": f"Unsupported model: {model}"})
+                return
+
+            async for frame in persisted(response_generator, chat_id, user_id, message_ids, index, model_entry):
+                responses[index] += frame.get("content", "")
+                await frames.put({**tag, **frame})
+        except Exception as e:
+            # Report the failure on this model's stream; the others carry on
+            print(f"Model {model} failed in parallel mode: {e}")
+            await frames.put({**tag, "error": str(e)})
+        finally:
+            await frames.put({**tag, "done": True})
+
+    tasks = [asyncio.create_task(run(i, entry)) for i, entry in enumerate(modelsList)]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            frame = await frames.get()
+            if frame.get("done"):
+                remaining -= 1
+            yield frame
+    finally:
+        # Stop the other models if the client went away
+        for task in tasks:
+            task.cancel()
+
+    conversations.extend(chat_id, [
+        {"role": "assistant", "content": response} for response in responses if response
+    ])
+    if persisting(user_id):
+        yield {"persisted": True, "message_ids": message_ids}
+
+def switch_active_chat(chat_id, user_id):
+    # Histories are kept per chat, so nothing has to be cleared. Chats that are
+    # not in memory are loaded from the database; the client only needs to
+    # upload the history when that is not possible ("cached" is false).
+    source = history_hydrator.hydrate(chat_id, user_id)
+    return {"message": "Switched to chat history", "chat_id": chat_id, "cached": source is not None, "source": source}
+
+def receive_chat_history(chat_id, history):
+    # print(f"Received chat history: {history}")
+
+    # The uploaded history replaces whatever was cached for the chat
+    conversations.replace(chat_id, history or [])
+
+    return {"message": "Chat history received"}
+
+def lookup_chat_history(chat_id):
+    if not chat_id:
+        return None
+    return conversations.get(chat_id)
+
+async def summarize_turns(previous_summary, messages):
+    # Rolling summary used by the context window for turns that no longer fit
+    transcript = "\n\n".join(f"{m.get('role', '')}: {m.get('content', '')}" for m in messages)
+    if previous_summary:
+        transcript = f"Previous summary:\n{previous_summary}\n\nNew messages:\n{transcript}"
+    response = await gemini_client.aio.models.generate_content(
+        model=SUMMARY_MODEL,
+        config=types.GenerateContentConfig(
+            system_instruction="Summarize this conversation for an assistant that will continue it. "
+                               "Keep facts, decisions, open questions and user preferences. Be concise."
+        ),
+        contents=transcript
+    )
+    return response.text
+
+# Fits each chat's history into the model's prompt budget
+context_window = ContextManager(summarize=summarize_turns)
+
+async def generate_chat_name(prompt):
+    response = await gemini_client.aio.models.generate_content(
+        model=TITLE_MODEL,
+        config= types.GenerateContentConfig(
+            system_instruction="Your job is to create a small 4-5 word Chat Title based on the prompt"
+        ),
+        contents=prompt
+    )
+    return response.text
+
+async def generate_chat_names(prompts):
+    # One upstream call for a micro-batch of title requests
+    numbered = "\n\n".join(f"Prompt {i + 1}:\n{prompt}" for i, prompt in enumerate(prompts))
+    response = await gemini_client.aio.models.generate_content(
+        model=TITLE_MODEL,
+        config=types.GenerateContentConfig(
+            system_instruction="Your job is to create a small 4-5 word Chat Title for each of the numbered prompts. "
+                               "Answer with a JSON array of strings, one title per prompt, in order.",
+            response_mime_type="application/json",
+        ),
+        contents=numbered
+    )
+    return loads(response.text)
+
+# Cached, single-flight (and optionally batched) title generation
+title_service = TitleService(generate_chat_name, generate_chat_names)
+
+
+# ---------------------------------------------------------------------------
+# Flask routes
+# ---------------------------------------------------------------------------
 
 @app.route("/switch-chat", methods=["POST"])
 def switch_chat():
     data = request.get_json()
-    chat_id = data.get("chat_id")
-    
-    #remove all chat histories except the active one
-    active_chat_history.clear()
-    
-    return jsonify({"message": "Switched to chat history", "chat_id": chat_id})
+    user_id, error, status = authorize_chat(request.cookies.get(chat_access.SESSION_COOKIE), data.get("chat_id"))
+    if error:
+        return jsonify({"error": error}), status
+    return jsonify(switch_active_chat(data.get("chat_id"), user_id))
 
 @app.route("/send-chat-history", methods=["POST"])
 def send_chat_history():
     data = request.get_json()
-    history = data.get("messages")
-    # print(f"Received chat history: {history}")
+    _, error, status = authorize_chat(request.cookies.get(chat_access.SESSION_COOKIE), data.get("chat_id"))
+    if error:
+        return jsonify({"error": error}), status
+    return jsonify(receive_chat_history(data.get("chat_id"), data.get("messages")))
+
+@app.route("/store-stats", methods=["GET"])
+def store_stats():
+    return jsonify(conversations.stats())
+
+@app.route("/context-stats", methods=["GET"])
+def context_stats():
+    return jsonify(context_window.stats())
+
+@app.route("/title-stats", methods=["GET"])
+def title_stats():
+    return jsonify(title_service.stats())
 
-    # receive the active chat history
-    active_chat_history.extend(history)
-    print(len(active_chat_history), "messages in active chat history")
+@app.route("/gemini-session-stats", methods=["GET"])
+def gemini_session_stats():
+    return jsonify(gemini_sessions.stats())
 
-    return jsonify({"message": "Chat history received"})
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route("/get-chat-name", methods=["POST"])
 def get_chat_name():
     data = request.get_json()
-    print(data)
     prompt = data.get("message")
-    model = "gemini-2.5-flash-preview-05-20"
-    response = gemini_client.models.generate_content(
-        model=model,
-        config= types.GenerateContentConfig(
-            system_instruction="Your job is to create a small 4-5 word Chat Title based on the prompt"
-        ),
-        contents=prompt
-    )
-    
-    return jsonify({"chat_name": response.text})
+    chat_name = background_loop.run(title_service.title(prompt))
+
+    return jsonify({"chat_name": chat_name})
 
 @app.route("/new-chat", methods=["POST"])
 def create_new_chat():
     data = request.get_json()
     model = data.get("model")
-    
+
     if model not in supported_models:
         return jsonify({"error": "Model not supported"}), 400
-    
-    chat_id = str(uuid.uuid4())
-    # chat_histories[chat_id] = []
-    
-    # For Gemini, create and store the chat object
-    # if model.split("-")[0] == "gemini":
-        # gemini_chats[chat_id] = gemini_client.chats.create(model=model)
-    
-    return jsonify({"chat_id": chat_id})
+
+    user_id, error, status = request_user(request.cookies.get(chat_access.SESSION_COOKIE))
+    if error:
+        return jsonify({"error": error}), status
+
+    return jsonify({"chat_id": new_chat_id(user_id)})
 
 @app.route("/chat", methods=["POST"])
 def route_to_model():
     data = request.get_json()
-    user_message = data.get("message")
-    modelsList = data.get("model")
-    chat_id = data.get("chat_id")
-    
-    if not modelsList or len(modelsList) == 0:
-        return jsonify({"error": "At least one model is required"}), 400
-    
-    # Get the first model configuration
-    first_model = modelsList[0]
-    model = first_model.get("value", "")
-    config = {
-        "system_prompt": first_model.get("systemPrompt", ""),
-        "temperature": first_model.get("temperature", 0.7),
-        "max_tokens": first_model.get("maxTokens", 16384),
-        "top_p": first_model.get("topP", 1.0),
-        "min_p": first_model.get("minP", 0.0),
-    }
 
-    print("DEBUGGING LENGTH OF ACTIVE CHAT HISTORY:", len(active_chat_history))
-    # print(f"Received message: {user_message} for {len(modelsList)} models, chat_id: {chat_id}")
-    
-    for model in modelsList:
-        if model.get("value", "") not in supported_models:
-            return jsonify({"error": f"Model {model.get('value', '')} not supported"}), 400
-    if not user_message:
-        return jsonify({"error": "Message is required"}), 400
-    
-    # Add user message to history once
-    if len(active_chat_history) == 0 or active_chat_history[-1].get("content") != config.get("system_prompt", ""):
-        active_chat_history.append({"role": "system", "content": config.get("system_prompt", "")})
-    active_chat_history.append({"role": "user", "content": user_message})
-    
-    def generate_multi_model():
-        # Process first model normally
-        if model.get("value").split("-")[0] == "deepseek":
-            response_generator = invoke_chute(user_message, model.get("value"), chat_id, config)
-        elif model.get("value").split("-")[0] == "gemini":
-            response_generator = invoke_gemini(user_message, model.get("value"), chat_id, config)
-        else:
-            yield json.dumps({"error": f"Unsupported model: {model}"} + "\n")
-            return
-        
-        # Stream the first model's response
-        for chunk in response_generator.response:
-            yield chunk
-        
-        if len(modelsList) > 1:
-            # Process remaining models sequentially
-            for i in range(1, len(modelsList)):
-                current_model_config = modelsList[i]
-                current_model = current_model_config.get("value", "")
-                current_config = {
-                    "system_prompt": current_model_config.get("systemPrompt", ""),
-                    "temperature": current_model_config.get("temperature", 0.7),
-                    "max_tokens": current_model_config.get("maxTokens", 16384),
-                    "top_p": current_model_config.get("topP", 1.0),
-                    "min_p": current_model_config.get("minP", 0.0),
-                }
-
-                # if current_model not in supported_models:
-                    # yield json.dumps({"error": f"Model {current_model} not supported"}) + "\n"
-                    # continue
-
-                # Add delimiter between model responses
-                yield json.dumps({"content": f"\n\n--- Response from {current_model} ---\n\n"}) + "\n"
-
-                # Route to appropriate _next function
-                if current_model.split("-")[0] == "deepseek":
-                    next_response = invoke_chute_next(user_message, current_model, chat_id, current_config)
-                elif current_model.split("-")[0] == "gemini":
-                    next_response = invoke_gemini_next(user_message, current_model, chat_id, current_config)
-                else:
-                    yield json.dumps({"error": f"Unsupported model: {current_model}"}) + "\n"
-                    continue
-                
-                # Stream the current model's response
-                for chunk in next_response.response:
-                    # print(chunk)
-                    yield chunk
-    
-    return Response(stream_with_context(generate_multi_model()), content_type='application/json')
-
-def invoke_chute(message, model, chat_id, config):
-    # print(f"Invoking chute with message: {message}, model: {model}, chat_id: {chat_id}, config: {config}")
+    error = validate_chat_request(data)
+    if error:
+        return jsonify({"error": error}), 400
+    user_id, error, status = authorize_chat(request.cookies.get(chat_access.SESSION_COOKIE), data.get("chat_id"))
+    if error:
+        return jsonify({"error": error}), status
+
+    # The async generators run on the shared background loop
+    frames = ndjson_stream(coalesce_frames(start_chat_turn(data, user_id), **coalesce_options(data)))
+    return Response(stream_with_context(background_loop.iterate(frames)), content_type='application/json')
+
+
+# ---------------------------------------------------------------------------
+# Model providers. Each invoke_* function is an async generator of frames.
+# ---------------------------------------------------------------------------
+
+def chute_headers():
     # Get API token from environment variable
     api_token = os.environ.get("CHUTES_API_TOKEN", "")
-    
-    headers = {
+
+    return {
         "Authorization": f"Bearer {api_token}",
         "Content-Type": "application/json"
     }
-    
-    # Use the full chat history instead of just the last message
-    body = {
+
+def chute_body(model, messages, config):
+    return {
         "model": model,
-        "messages": active_chat_history,
+        "messages": messages,
         "stream": True,
         "max_tokens": config.get("max_tokens", 16384),
         "temperature": config.get("temperature", 0.7),
@@ -188,318 +441,183 @@ def invoke_chute(message, model, chat_id, config):
         "min_p": config.get("min_p", 0.0),
     }
 
-    def generate():
-        full_response = ""
-        
-        async def stream_async():
-            nonlocal full_response
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        "https://llm.chutes.ai/v1/chat/completions", 
-                        headers=headers,
-                        json=body
-                    ) as response:
-                        if response.status != 200:
-                            error = await response.text()
-                            yield json.dumps({"error": f"API error: {error}"}) + "\n"
-                            return
-                            
-                        # Process the stream directly instead of collecting chunks
-                        async for line in response.content:
-                            line = line.decode("utf-8").strip()
-                            if line.startswith("data: "):
-                                data = line[6:]
-                                if data == "[DONE]":
-                                    break
-                                try:
-                                    chunk = json.loads(data)
-                                    if chunk and "choices" in chunk and len(chunk["choices"]) > 0:
-                                        content = chunk["choices"][0].get("delta", {}).get("content", "")
-                                        if content:
-                                            full_response += content
-                                            # Yield each chunk immediately
-                                            yield json.dumps({"content": content}) + "\n"
-                                            # Force flush to ensure immediate delivery
-                                            await asyncio.sleep(0)
-                                except Exception as e:
-                                    yield json.dumps({"error": f"Error parsing chunk: {str(e)}"}) + "\n"
-            except Exception as e:
-                yield json.dumps({"error": f"Connection error: {str(e)}"}) + "\n"
-        
-        # Create a new event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Get an async generator from our coroutine
-            async_gen = stream_async()
-            
-            # Iterate through the generator and yield each chunk
-            while True:
-                try:
-                    # Run until next yield point and get the value
-                    chunk = loop.run_until_complete(async_gen.__anext__())
-                    yield chunk
-                except StopAsyncIteration:
-                    # Generator is exhausted
+async def stream_chute(headers, body, chat_id, record=True):
+    """
+    Stream a Chutes completion over the keep-alive session of the running loop.
+    Yields frames and (if record) appends the full response to the chat's history.
+    """
+    parts = []
+    tracker = metrics.track_stream("chutes", body.get("model", ""))
+    try:
+        session = await get_session()
+        async with session.post(
+            CHUTES_URL,
+            headers=headers,
+            json=body
+        ) as response:
+            tracker.connected()
+            if response.status != 200:
+                error = await response.text()
+                tracker.error("api_error")
+                yield {"error": f"API error: {error}"}
+                return
+
+            # Parse the raw byte stream incrementally, one network read at a time
+            parser = SSEParser()
+            async for data in response.content.iter_any():
+                for content in parser.feed(data):
+                    if type(content) is str:
+                        parts.append(content)
+                        tracker.chunk(content)
+                        yield {"content": content}
+                    else:
+                        tracker.error("parse_error")
+                        yield {"error": f"Error parsing chunk: {content}"}
+                if parser.done:
                     break
-                    
-            # After streaming completes, add the full response to chat history
-            if full_response:
-                active_chat_history.append({"role": "assistant", "content": full_response})
-        finally:
-            loop.close()
-    
-    return Response(stream_with_context(generate()), content_type='application/json')
+            for content in parser.flush():
+                if type(content) is str:
+                    parts.append(content)
+                    tracker.chunk(content)
+                    yield {"content": content}
+    except Exception as e:
+        tracker.error("connection_error")
+        yield {"error": f"Connection error: {str(e)}"}
+    finally:
+        tracker.finish()
+
+    # After streaming completes, add the full response to chat history
+    full_response = "".join(parts)
+    if full_response and record:
+        conversations.append(chat_id, {"role": "assistant", "content": full_response})
+
+async def invoke_chute(message, model, chat_id, config, record=True):
+    # print(f"Invoking chute with message: {message}, model: {model}, chat_id: {chat_id}, config: {config}")
+    # Send the chat history, fitted into the model's token budget
+    messages = await context_window.fit(chat_id, conversations.messages(chat_id), model, config.get("max_tokens", 16384))
+    body = chute_body(model, messages, config)
+    async for frame in stream_chute(chute_headers(), body, chat_id, record):
+        yield frame
 
 def invoke_chute_next(message, model, chat_id, config):
-    # Get API token from environment variable
-    api_token = os.environ.get("CHUTES_API_TOKEN", "")
-    
-    headers = {
-        "Authorization": f"Bearer {api_token}",
-        "Content-Type": "application/json"
-    }
-    
     history = []
     history.append({"role": "system", "content": config.get("system_prompt", "")})
     history.append({"role": "user", "content": message})
-    history.append(active_chat_history[-1]) 
+    history.append(conversations.last_message(chat_id))
 
-    # Use the full chat history instead of just the last message
-    body = {
-        "model": model,
-        "messages": history,
-        "stream": True,
-        "max_tokens": config.get("max_tokens", 16384),
-        "temperature": config.get("temperature", 0.7),
-        "top_p": config.get("top_p", 1.0),
-        "min_p": config.get("min_p", 0.0),
-    }
+    body = chute_body(model, history, config)
+    return stream_chute(chute_headers(), body, chat_id)
 
-    def generate():
-        full_response = ""
-        
-        async def stream_async():
-            nonlocal full_response
-            try:
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        "https://llm.chutes.ai/v1/chat/completions", 
-                        headers=headers,
-                        json=body
-                    ) as response:
-                        if response.status != 200:
-                            error = await response.text()
-                            yield json.dumps({"error": f"API error: {error}"}) + "\n"
-                            return
-                            
-                        # Process the stream directly instead of collecting chunks
-                        async for line in response.content:
-                            line = line.decode("utf-8").strip()
-                            if line.startswith("data: "):
-                                data = line[6:]
-                                if data == "[DONE]":
-                                    break
-                                try:
-                                    chunk = json.loads(data)
-                                    # print(chunk)
-                                    if chunk and "choices" in chunk and len(chunk["choices"]) > 0:
-                                        content = chunk["choices"][0].get("delta", {}).get("content", "")
-                                        if content:
-                                            full_response += content
-                                            # Yield each chunk immediately
-                                            # print(content)
-                                            yield json.dumps({"content": content}) + "\n"
-                                            # Force flush to ensure immediate delivery
-                                            await asyncio.sleep(0)
-                                except Exception as e:
-                                    yield json.dumps({"error": f"Error parsing chunk: {str(e)}"}) + "\n"
-            except Exception as e:
-                yield json.dumps({"error": f"Connection error: {str(e)}"}) + "\n"
-        
-        # Create a new event loop
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        
-        try:
-            # Get an async generator from our coroutine
-            async_gen = stream_async()
-            
-            # Iterate through the generator and yield each chunk
-            while True:
-                try:
-                    # Run until next yield point and get the value
-                    chunk = loop.run_until_complete(async_gen.__anext__())
-                    yield chunk
-                except StopAsyncIteration:
-                    # Generator is exhausted
-                    break
-                    
-            # After streaming completes, add the full response to chat history
-            if full_response:
-                active_chat_history.append({"role": "assistant", "content": full_response})
-        finally:
-            loop.close()
-    
-    return Response(stream_with_context(generate()), content_type='application/json')
+def gemini_config(config):
+    return types.GenerateContentConfig(
+        system_instruction=config.get("system_prompt", ""),
+        temperature=config.get("temperature", 0.7),
+        max_output_tokens=config.get("max_tokens", 16384),
+        top_p=config.get("top_p", 1.0),
+    )
 
-def invoke_gemini(message, model, chat_id, config):
-    def generate():
-        full_response = ""
-        try:
-            # Convert chat history to Google's content format
-            history = []
-            for msg in active_chat_history:
-                # print(msg)
-                role = msg["role"]
-                content = msg["content"]
-                
-                if role == "assistant":
-                    role = "model"
-
-                # Skip the current user message since we'll send it separately
-                if role == "user" and content == message and msg == active_chat_history[-1]:
-                    continue
-
-                if role == "system":
-                    # System messages are not sent in the chat history
-                    continue
-                    
-                # Convert to Google's format
-                part = types.Part(text=content)
-                content_entry = types.Content(role=role, parts=[part])
-
-                history.append(content_entry)
-            
-            if history:
-                chat = gemini_client.chats.create(
-                    model = model,
-                    history = history,
-                    config= types.GenerateContentConfig(
-                        system_instruction=config.get("system_propmt", ""),
-                        temperature=config.get("temperature", 0.7),
-                        max_output_tokens=config.get("max_tokens", 16384),
-                        top_p=config.get("top_p", 1.0),
-                    )
-                )
-            else:
-                chat = gemini_client.chats.create(
-                    model=model,
-                    config = types.GenerateContentConfig(
-                        system_instruction=config.get("system_prompt", ""),
-                        temperature=config.get("temperature", 0.7),
-                        max_output_tokens=config.get("max_tokens", 16384),
-                        top_p=config.get("top_p", 1.0),
-                    )
-                )
-            global gemini_chat
-            gemini_chat = chat
-            
-            # Send message and stream response
-            # print(history, message)
-            print(len(history), "messages in history")
-            response = chat.send_message_stream(message=message)
-            for chunk in response:
-                if chunk.text:
-                    full_response += chunk.text
-                    yield json.dumps({"content": chunk.text}) + "\n"
-            
-            # After streaming completes, add the response to chat history
-            if full_response:
-                active_chat_history.append({"role": "assistant", "content": full_response})
-                
-        except Exception as e:
-            yield json.dumps({"error": f"Gemini API error: {str(e)}"}) + "\n"
-    
-    return Response(stream_with_context(generate()), content_type='application/json')
+def to_gemini_history(messages, message):
+    # Convert chat history to Google's content format
+    history = []
+    for i, msg in enumerate(messages):
+        role = msg["role"]
+        content = msg["content"]
+
+        if role == "assistant":
+            role = "model"
+
+        # Skip the current user message since we'll send it separately
+        if role == "user" and content == message and i == len(messages) - 1:
+            continue
+
+        if role == "system":
+            # System messages are not sent in the chat history
+            continue
+
+        # Convert to Google's format
+        part = types.Part(text=content)
+        history.append(types.Content(role=role, parts=[part]))
+    return history
+
+async def stream_gemini(chat, model, prompt, chat_id, record=True):
+    full_response = ""
+    tracker = metrics.track_stream("gemini", model)
+    try:
+        # Send message and stream response
+        stream = await chat.send_message_stream(message=prompt)
+        tracker.connected()
+        async for chunk in stream:
+            if chunk.text:
+                full_response += chunk.text
+                tracker.chunk(chunk.text)
+                yield {"content": chunk.text}
+
+    except Exception as e:
+        tracker.error("api_error" if isinstance(e, errors.APIError) else "connection_error")
+        yield {"error": f"Gemini API error: {str(e)}"}
+    finally:
+        tracker.finish()
+
+    # After streaming completes, add the response to chat history
+    if full_response and record:
+        conversations.append(chat_id, {"role": "assistant", "content": full_response})
+
+def create_gemini_chat(model, config, history):
+    return gemini_client.aio.chats.create(
+        model=model,
+        history=history,
+        config=gemini_config(config),
+    )
+
+async def invoke_gemini(message, model, chat_id, config, record=True):
+    messages = await context_window.fit(chat_id, conversations.messages(chat_id), model, config.get("max_tokens", 16384))
+
+    # Reuse the chat's Gemini session; only messages it hasn't seen are converted
+    history = messages[:-1] if messages and messages[-1].get("role") == "user" else messages
+    key = (chat_id, model, tuple(sorted(config.items())))
+    session = gemini_sessions.checkout(
+        key,
+        history,
+        lambda contents: create_gemini_chat(model, config, contents),
+        lambda new_messages: to_gemini_history(new_messages, None),
+    )
+
+    full_response = ""
+    failed = False
+    completed = False
+    try:
+        async for frame in stream_gemini(session.chat, model, message, chat_id, record):
+            if "error" in frame:
+                failed = True
+            full_response += frame.get("content", "")
+            yield frame
+        completed = True
+    finally:
+        # The session only recorded the turn if the stream ran to the end
+        if completed and full_response and not failed:
+            gemini_sessions.commit(session, messages, {"role": "assistant", "content": full_response})
+        else:
+            gemini_sessions.discard(key, session)
 
 def invoke_gemini_next(message, model, chat_id, config):
-    def generate():
-        full_response = ""
-        try:
-            # Convert chat history to Google's content format
-            needed_active_chat_history = []
-            needed_active_chat_history.append({"role": "user", "content": message})
-            needed_active_chat_history.append(active_chat_history[-1])
-            history = []
-            for msg in needed_active_chat_history:
-                # print(msg)
-                role = msg["role"]
-                content = msg["content"]
-                
-                if role == "assistant":
-                    role = "model"
-
-                # Skip the current user message since we'll send it separately
-                if role == "user" and content == message and msg == active_chat_history[-1]:
-                    continue
-
-                if role == "system":
-                    # System messages are not sent in the chat history
-                    continue
-                    
-                # Convert to Google's format
-                part = types.Part(text=content)
-                content_entry = types.Content(role=role, parts=[part])
-
-                history.append(content_entry)
-            
-            if history:
-                chat = gemini_client.chats.create(
-                    model = model,
-                    history = history,
-                    config= types.GenerateContentConfig(
-                        system_instruction=config.get("system_prompt", ""),
-                        temperature=config.get("temperature", 0.7),
-                        max_output_tokens=config.get("max_tokens", 16384),
-                        top_p=config.get("top_p", 1.0),
-                    )
-                )
-            else:
-                chat = gemini_client.chats.create(
-                    model=model,
-                    config = types.GenerateContentConfig(
-                        system_instruction=config.get("system_prompt", ""),
-                        temperature=config.get("temperature", 0.7),
-                        max_output_tokens=config.get("max_tokens", 16384),
-                        top_p=config.get("top_p", 1.0),
-                    )
-                )
-            global gemini_chat
-            gemini_chat = chat
-            
-            # Send message and stream response
-            # print(history, message)
-            print(len(history), "messages in history")
-            response = chat.send_message_stream(message="Generate the response based on the instructions and the history.")
-            for chunk in response:
-                if chunk.text:
-                    full_response += chunk.text
-                    yield json.dumps({"content": chunk.text}) + "\n"
-            
-            # After streaming completes, add the response to chat history
-            if full_response:
-                active_chat_history.append({"role": "assistant", "content": full_response})
-                
-        except Exception as e:
-            yield json.dumps({"error": f"Gemini API error: {str(e)}"}) + "\n"
-    
-    return Response(stream_with_context(generate()), content_type='application/json')
+    needed_active_chat_history = []
+    needed_active_chat_history.append({"role": "user", "content": message})
+    needed_active_chat_history.append(conversations.last_message(chat_id))
+    history = to_gemini_history(needed_active_chat_history, message)
+    chat = create_gemini_chat(model, config, history)
+    return stream_gemini(chat, model, "Generate the response based on the instructions and the history.", chat_id)
 
 @app.route("/fetch-messages/<chat_id>", methods=["GET"])
 def get_chat_history(chat_id):
-    chatID = chat_id
-    
-    if not chatID or chatID not in chat_histories:
-        # print(chatID, "not in ", chat_histories)
+    _, error, status = authorize_chat(request.cookies.get(chat_access.SESSION_COOKIE), chat_id)
+    if error:
+        return jsonify({"error": error}), status
+    history = lookup_chat_history(chat_id)
+    if history is None:
         return jsonify({"error": "Invalid chat ID"}), 400
-    
-    history = chat_histories[chatID].copy()
 
     # Return the chat history for the specified chat ID
     return jsonify({"messages": history})
 
 if __name__ == "__main__":
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True)
@@ -0,0 +1,144 @@
+"""
+ASGI entry point for the model routing backend.
+
+Serves the same routes as the Flask app in deep.py, but streams the model
+responses natively on the server's event loop instead of holding one worker
+thread per chat. Run it with:
+
+    uvicorn deep_asgi:app --port 5000
+"""
+from contextlib import asynccontextmanager
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from chat_access import SESSION_COOKIE
+import deep
+from loop_bridge import close_session
+import metrics
+
+
+async def request_user(request):
+    # Asks the Django backend (blocking client)
+    return await run_in_threadpool(deep.request_user, request.cookies.get(SESSION_COOKIE))
+
+async def authorize_chat(request, chat_id):
+    # Asks the Django backend and the database (blocking clients)
+    return await run_in_threadpool(deep.authorize_chat, request.cookies.get(SESSION_COOKIE), chat_id)
+
+async def switch_chat(request):
+    data = await request.json()
+    user_id, error, status = await authorize_chat(request, data.get("chat_id"))
+    if error:
+        return JSONResponse({"error": error}, status_code=status)
+    # May read the history from the database (blocking driver)
+    return JSONResponse(await run_in_threadpool(deep.switch_active_chat, data.get("chat_id"), user_id))
+
+async def send_chat_history(request):
+    data = await request.json()
+    _, error, status = await authorize_chat(request, data.get("chat_id"))
+    if error:
+        return JSONResponse({"error": error}, status_code=status)
+    return JSONResponse(deep.receive_chat_history(data.get("chat_id"), data.get("messages")))
+
+async def store_stats(request):
+    return JSONResponse(deep.conversations.stats())
+
+async def context_stats(request):
+    return JSONResponse(deep.context_window.stats())
+
+async def title_stats(request):
+    return JSONResponse(deep.title_service.stats())
+
+async def gemini_session_stats(request):
+    return JSONResponse(deep.gemini_sessions.stats())
+
+async def metrics_endpoint(request):
+    return Response(metrics.registry.render(), headers={"Content-Type": metrics.CONTENT_TYPE})
+
+async def get_chat_name(request):
+    data = await request.json()
+    chat_name = await deep.title_service.title(data.get("message"))
+    return JSONResponse({"chat_name": chat_name})
+
+async def create_new_chat(request):
+    data = await request.json()
+    model = data.get("model")
+
+    if model not in deep.supported_models:
+        return JSONResponse({"error": "Model not supported"}, status_code=400)
+
+    user_id, error, status = await request_user(request)
+    if error:
+        return JSONResponse({"error": error}, status_code=status)
+
+    return JSONResponse({"chat_id": deep.new_chat_id(user_id)})
+
+async def route_to_model(request):
+    data = await request.json()
+
+    error = deep.validate_chat_request(data)
+    if error:
+        return JSONResponse({"error": error}, status_code=400)
+    user_id, error, status = await authorize_chat(request, data.get("chat_id"))
+    if error:
+        return JSONResponse({"error": error}, status_code=status)
+
+    turn = deep.start_chat_turn(data, user_id)
+    frames = deep.ndjson_stream(deep.coalesce_frames(turn, **deep.coalesce_options(data)))
+    return StreamingResponse(frames, media_type="application/json")
+
+async def get_chat_history(request):
+    _, error, status = await authorize_chat(request, request.path_params["chat_id"])
+    if error:
+        return JSONResponse({"error": error}, status_code=status)
+    history = deep.lookup_chat_history(request.path_params["chat_id"])
+    if history is None:
+        return JSONResponse({"error": "Invalid chat ID"}, status_code=400)
+
+    return JSONResponse({"messages": history})
+
+
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    # Release the pooled upstream connections of this loop
+    await close_session()
+    # Write the responses that are still queued
+    await run_in_threadpool(deep.message_writer.close)
+
+
+app = Starlette(
+    routes=[
+        Route("/switch-chat", switch_chat, methods=["POST"]),
+        Route("/send-chat-history", send_chat_history, methods=["POST"]),
+        Route("/store-stats", store_stats, methods=["GET"]),
+        Route("/context-stats", context_stats, methods=["GET"]),
+        Route("/title-stats", title_stats, methods=["GET"]),
+        Route("/gemini-session-stats", gemini_session_stats, methods=["GET"]),
+        Route("/metrics", metrics_endpoint, methods=["GET"]),
+        Route("/get-chat-name", get_chat_name, methods=["POST"]),
+        Route("/new-chat", create_new_chat, methods=["POST"]),
+        Route("/chat", route_to_model, methods=["POST"]),
+        Route("/fetch-messages/{chat_id}", get_chat_history, methods=["GET"]),
+    ],
+    middleware=[
+        Middleware(
+            CORSMiddleware,
+            allow_origins=deep.CORS_ORIGINS,
+            allow_methods=["*"],
+            allow_headers=["*"],
+            allow_credentials=True,
+        ),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host="127.0.0.1", port=5000)
@@ -0,0 +1,126 @@
+"""
+Coalescing of streamed content frames.
+
+Upstream models emit one delta per token, and writing each of them to the
+client as its own NDJSON line means a very large number of tiny writes. This
+stage merges consecutive {"content": ...} frames into one frame and flushes it
+when a time window elapses or the buffered text reaches a size threshold.
+The frame format is unchanged: merged frames are ordinary content frames.
+"""
+import asyncio
+import os
+
+# Defaults, overridable per request ("coalesce_ms" / "coalesce_bytes")
+DEFAULT_WINDOW_MS = float(os.environ.get("STREAM_COALESCE_MS", 30))
+DEFAULT_MAX_BYTES = int(os.environ.get("STREAM_COALESCE_BYTES", 4096))
+MAX_WINDOW_MS = 1000
+MAX_BYTES_LIMIT = 1024 * 1024
+
+# Keys that may accompany "content" in a mergeable frame (parallel mode tags)
+_TAG_KEYS = ("model_index", "model")
+_MERGEABLE_KEYS = {"content", *_TAG_KEYS}
+
+_END = object()
+
+
+def coalesce_options(data):
+    """Read the coalescing options of a /chat payload, clamped to sane limits."""
+    try:
+        window_ms = float(data.get("coalesce_ms", DEFAULT_WINDOW_MS))
+        max_bytes = int(data.get("coalesce_bytes", DEFAULT_MAX_BYTES))
+    except (TypeError, ValueError):
+        window_ms, max_bytes = DEFAULT_WINDOW_MS, DEFAULT_MAX_BYTES
+    return {
+        "window_ms": min(max(window_ms, 0), MAX_WINDOW_MS),
+        "max_bytes": min(max(max_bytes, 0), MAX_BYTES_LIMIT),
+    }
+
+
+def _mergeable(frame):
+    return "content" in frame and frame.keys() <= _MERGEABLE_KEYS
+
+
+async def coalesce_frames(frames, window_ms=DEFAULT_WINDOW_MS, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Merge consecutive content frames of the same stream (same parallel-mode
+    tag) and yield them every `window_ms` or once `max_bytes` characters are
+    buffered. The first content frame of each stream is sent immediately so
+    time-to-first-token is not delayed. Any other frame (errors, separators,
+    "done" markers) flushes the pending content of its stream first.
+    A window of 0 disables coalescing.
+    """
+    if window_ms <= 0:
+        async for frame in frames:
+            yield frame
+        return
+
+    window = window_ms / 1000
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for frame in frames:
+                await queue.put(frame)
+        except Exception as e:
+            await queue.put(e)
+        finally:
+            await queue.put(_END)
+
+    producer = asyncio.create_task(pump())
+    pending = {}   # tag -> list of content strings
+    sizes = {}     # tag -> buffered characters
+    started = set()
+    deadline = None
+
+    def flush(tag):
+        parts = pending.pop(tag, None)
+        sizes.pop(tag, None)
+        if not parts:
+            return None
+        frame = dict(zip(_TAG_KEYS, tag)) if tag else {}
+        frame["content"] = "".join(parts)
+        return frame
+
+    try:
+        while True:
+            timeout = None if deadline is None else max(0, deadline - loop.time())
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                # Window elapsed: flush everything that is buffered
+                for tag in list(pending):
+                    yield flush(tag)
+                deadline = None
+                continue
+
+            if item is _END or isinstance(item, Exception):
+                for tag in list(pending):
+                    yield flush(tag)
+                if item is not _END:
+                    raise item
+                return
+
+            tag = tuple(item[key] for key in _TAG_KEYS if key in item)
+            if not _mergeable(item):
+                merged = flush(tag)
+                if merged:
+                    yield merged
+                yield item
+                # Send the next content right away (e.g. the next model's first token)
+                started.discard(tag)
+                continue
+
+            if tag not in started:
+                started.add(tag)
+                yield item
+                continue
+
+            pending.setdefault(tag, []).append(item["content"])
+            sizes[tag] = sizes.get(tag, 0) + len(item["content"])
+            if sizes[tag] >= max_bytes:
+                yield flush(tag)
+            elif deadline is None:
+                deadline = loop.time() + window
+    finally:
+        producer.cancel()
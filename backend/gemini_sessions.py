@@ -0,0 +1,131 @@
+"""
+Per-chat Gemini chat sessions that are reused across turns.
+
+A Gemini chat object keeps its own converted history. Instead of converting the
+whole chat history and creating a new session on every turn, sessions are kept
+in a bounded LRU keyed by (chat_id, model, config). On a plain follow-up turn
+the chat has already recorded the previous message and reply itself, so the
+cached chat object is used as is and only the new message is sent.
+
+google-genai has no public way to add contents to a chat other than sending a
+user message, so when other messages were added since the last turn (e.g.
+another model answered in between) the chat is recreated from its own, already
+converted history plus just those messages; older messages are still not
+converted again.
+
+A session is rebuilt from scratch whenever the history it was built from no
+longer matches (e.g. the context window replaced old turns with a summary, or
+another model answered in between).
+"""
+from collections import OrderedDict
+import os
+import threading
+
+MAX_SESSIONS = int(os.environ.get("GEMINI_SESSION_CACHE_SIZE", 256))
+# Leading messages (system prompt, context summary) that must stay unchanged
+HEAD_LENGTH = 2
+
+
+class GeminiSession:
+    __slots__ = ("chat", "head", "synced", "last", "busy")
+
+    def __init__(self, chat, head, synced, last):
+        self.chat = chat
+        self.head = head
+        # Number of chat-history messages the session has seen, and the last one
+        self.synced = synced
+        self.last = last
+        # A session serves one turn at a time
+        self.busy = False
+
+    def matches(self, messages):
+        if len(messages) < self.synced or messages[:len(self.head)] != self.head:
+            return False
+        return self.synced == 0 or messages[self.synced - 1] == self.last
+
+
+class GeminiSessionCache:
+    def __init__(self, max_sessions=MAX_SESSIONS):
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.appended = 0
+
+    def checkout(self, key, messages, create_chat, convert):
+        """
+        Return a session whose history covers `messages` (the chat history
+        before the message being sent). `create_chat(history)` builds a new
+        Gemini chat and `convert(messages)` turns chat messages into Gemini
+        contents.
+        """
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                if session.busy:
+                    # Same chat/model already streaming: use a throwaway session
+                    self.misses += 1
+                    return GeminiSession(create_chat(convert(messages)), None, 0, None)
+                session.busy = True
+
+        if session is not None and session.matches(messages):
+            new_contents = convert(messages[session.synced:])
+            if new_contents:
+                # Messages the chat hasn't seen (not a plain follow-up): the API
+                # can't append them, so recreate it from its converted history
+                session.chat = create_chat(session.chat.get_history() + new_contents)
+            self._synced(session, messages)
+            with self._lock:
+                self.hits += 1
+                self.appended += len(new_contents)
+            return session
+
+        with self._lock:
+            if session is None:
+                self.misses += 1
+            else:
+                self.rebuilds += 1
+        session = GeminiSession(create_chat(convert(messages)), messages[:HEAD_LENGTH], 0, None)
+        session.busy = True
+        self._synced(session, messages)
+        with self._lock:
+            self._sessions[key] = session
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return session
+
+    def commit(self, session, messages, reply):
+        """
+        Record a completed turn: the session now also holds the user message
+        (the last of `messages`) and the model's reply, which the caller
+        appends to the chat history.
+        """
+        session.synced = len(messages) + 1
+        session.last = reply
+        session.busy = False
+
+    def discard(self, key, session):
+        """Drop a session whose turn failed; its history is no longer known."""
+        with self._lock:
+            if self._sessions.get(key) is session:
+                del self._sessions[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "hits": self.hits,
+                "misses": self.misses,
+                "rebuilds": self.rebuilds,
+                "appended_messages": self.appended,
+            }
+
+    @staticmethod
+    def _synced(session, messages):
+        session.synced = len(messages)
+        session.last = messages[-1] if messages else None
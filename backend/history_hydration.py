@@ -0,0 +1,245 @@
+"""
+Server-side hydration of chat histories from the Django message store.
+
+When a chat is switched to and it is not in the in-memory ConversationStore,
+its messages are read directly from the `chats_messages` table (the Django
+`Messages` model) in keyset-paginated batches, instead of the browser
+downloading the history from Django and uploading it again.
+
+A per-chat watermark (time_sent, id) of the last row read is kept, so a warm
+chat that has not been written to locally since it was loaded is topped up
+with only the rows saved after the watermark (e.g. from another device).
+Chats that did change locally are authoritative in memory and are not queried.
+
+Uses the DB_* settings of the Django backend. Hydration is disabled when
+psycopg2 is not installed, DB_NAME is not set, or HISTORY_HYDRATION=0; the
+client then uploads the history as before. Anonymous requests (ROUTING_AUTH=0)
+are never hydrated.
+"""
+from collections import OrderedDict
+import os
+import threading
+import time
+import weakref
+
+try:
+    import psycopg2
+    import psycopg2.pool
+except ImportError:
+    psycopg2 = None
+
+import metrics
+
+ENABLED = os.environ.get("HISTORY_HYDRATION", "1") != "0"
+PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", 500))
+POOL_SIZE = int(os.environ.get("HISTORY_DB_POOL_SIZE", 4))
+# Minimum seconds between top-up queries for the same warm chat
+REFRESH_INTERVAL = float(os.environ.get("HISTORY_REFRESH_INTERVAL", 30))
+MAX_WATERMARKS = int(os.environ.get("HISTORY_MAX_WATERMARKS", 10000))
+
+# Only the user's own chats; messages of deleted chats stay in the table until they are purged
+_OWN_CHAT = """EXISTS (
+        SELECT 1 FROM chats_chats AS c
+        WHERE c.chat_id = chats_messages.chat_id AND c.user_id = %s AND c.deleted_at IS NULL
+    )"""
+_FIRST_PAGE = f"""
+    SELECT id, time_sent, message FROM chats_messages
+    WHERE chat_id = %s AND {_OWN_CHAT}
+    ORDER BY time_sent, id
+    LIMIT %s
+"""
+_NEXT_PAGE = f"""
+    SELECT id, time_sent, message FROM chats_messages
+    WHERE chat_id = %s AND (time_sent, id) > (%s, %s) AND {_OWN_CHAT}
+    ORDER BY time_sent, id
+    LIMIT %s
+"""
+_CHAT_OWNER = "SELECT user_id FROM chats_chats WHERE chat_id = %s"
+
+hydrations = metrics.registry.counter(
+    "history_hydrations_total", "Chat switches by where the history came from.", ("source",))
+rows_loaded = metrics.registry.counter(
+    "history_rows_loaded_total", "Message rows read from the database.")
+load_seconds = metrics.registry.histogram(
+    "history_load_seconds", "Time to read a chat's (new) messages from the database.")
+
+
+def database_settings():
+    return {
+        "dbname": os.environ.get("DB_NAME", ""),
+        "user": os.environ.get("DB_USER", ""),
+        "password": os.environ.get("DB_PASSWORD", ""),
+        "host": os.environ.get("DB_HOST", ""),
+        "port": os.environ.get("DB_PORT", ""),
+    }
+
+
+def to_chat_message(message):
+    # Rows hold the {"role", "content"} objects saved by the frontend
+    if not isinstance(message, dict) or "role" not in message:
+        return None
+    return {"role": message["role"], "content": message.get("content", "")}
+
+
+class MessageLoader:
+    """Reads chat messages from Postgres over a small thread-safe connection pool."""
+
+    def __init__(self, settings=None, pool_size=POOL_SIZE, page_size=PAGE_SIZE):
+        self.settings = {k: v for k, v in (settings or database_settings()).items() if v}
+        self.pool_size = pool_size
+        self.page_size = page_size
+        self._pool = None
+        self._lock = threading.Lock()
+
+    @property
+    def available(self):
+        return psycopg2 is not None and bool(self.settings.get("dbname"))
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = psycopg2.pool.ThreadedConnectionPool(1, self.pool_size, **self.settings)
+            return self._pool
+
+    def load(self, chat_id, user_id, after=None):
+        """
+        Return (messages, watermark) for the chat's rows after `after`
+        (a (time_sent, id) pair, or None for all rows), provided the chat is
+        the user's. The watermark is that of the last row read, or `after` if
+        there were none.
+        """
+        pool = self._get_pool()
+        connection = pool.getconn()
+        broken = False
+        messages = []
+        watermark = after
+        try:
+            connection.set_session(readonly=True, autocommit=True)
+            with connection.cursor() as cursor:
+                while True:
+                    if watermark is None:
+                        cursor.execute(_FIRST_PAGE, (str(chat_id), user_id, self.page_size))
+                    else:
+                        cursor.execute(
+                            _NEXT_PAGE, (str(chat_id), watermark[0], watermark[1], user_id, self.page_size))
+                    rows = cursor.fetchall()
+                    for row_id, time_sent, message in rows:
+                        message = to_chat_message(message)
+                        if message is not None:
+                            messages.append(message)
+                    if rows:
+                        watermark = (rows[-1][1], rows[-1][0])
+                    if len(rows) < self.page_size:
+                        break
+        except psycopg2.Error:
+            broken = connection.closed != 0
+            raise
+        finally:
+            pool.putconn(connection, close=broken)
+        return messages, watermark
+
+    def owner(self, chat_id):
+        """The id of the user the chat belongs to, or None if it is not saved."""
+        if not self.available:
+            return None
+        pool = self._get_pool()
+        connection = pool.getconn()
+        broken = False
+        try:
+            connection.set_session(readonly=True, autocommit=True)
+            with connection.cursor() as cursor:
+                cursor.execute(_CHAT_OWNER, (str(chat_id),))
+                row = cursor.fetchone()
+        except psycopg2.Error:
+            broken = connection.closed != 0
+            raise
+        finally:
+            pool.putconn(connection, close=broken)
+        return row[0] if row else None
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+
+
+class HistoryHydrator:
+    def __init__(self, store, loader=None, refresh_interval=REFRESH_INTERVAL, enabled=ENABLED):
+        self.store = store
+        self.loader = loader or MessageLoader()
+        self.refresh_interval = refresh_interval
+        self.enabled = enabled and self.loader.available
+        # chat_id -> (watermark, store revision after loading, time of the last check)
+        self._watermarks = OrderedDict()
+        self._lock = threading.Lock()
+        # A chat's lock lives as long as a thread holds or waits on it
+        self._chat_locks = weakref.WeakValueDictionary()
+
+    def hydrate(self, chat_id, user_id):
+        """
+        Make sure the chat's history is in the store. Returns where it came
+        from: "memory", "database", "refreshed", or None when the history is
+        not available here (hydration disabled or the database failed).
+        Only the user's own chat is read from the database; the caller
+        checks that the user may use the chat at all (see chat_access).
+        """
+        if not chat_id:
+            return None
+        if not self.enabled or user_id is None:
+            source = "memory" if self.store.touch(chat_id) else None
+            hydrations.inc(source=source or "unavailable")
+            return source
+
+        # One load per chat at a time; concurrent switches wait for it
+        with self._lock:
+            chat_lock = self._chat_locks.get(chat_id)
+            if chat_lock is None:
+                chat_lock = self._chat_locks[chat_id] = threading.Lock()
+        try:
+            with chat_lock:
+                source = self._hydrate(chat_id, user_id)
+        except Exception as e:
+            print(f"History hydration failed for chat {chat_id}: {e}")
+            source = "memory" if chat_id in self.store else None
+        hydrations.inc(source=source or "unavailable")
+        return source
+
+    def _hydrate(self, chat_id, user_id):
+        revision = self.store.revision(chat_id)
+        with self._lock:
+            entry = self._watermarks.get(chat_id)
+
+        if revision is not None:
+            self.store.touch(chat_id)
+            # Changed locally since it was loaded (or never loaded): memory is authoritative
+            if entry is None or entry[1] != revision:
+                return "memory"
+            watermark, _, checked = entry
+            if time.monotonic() - checked < self.refresh_interval:
+                return "memory"
+            messages, watermark = self._load(chat_id, user_id, watermark)
+            if not messages or self.store.revision(chat_id) != revision:
+                # Nothing new, or a turn was written meanwhile and memory is ahead
+                self._remember(chat_id, watermark, revision)
+                return "memory"
+            self._remember(chat_id, watermark, self.store.extend(chat_id, messages))
+            return "refreshed"
+
+        messages, watermark = self._load(chat_id, user_id, None)
+        self._remember(chat_id, watermark, self.store.replace(chat_id, messages))
+        return "database"
+
+    def _load(self, chat_id, user_id, after):
+        start = time.perf_counter()
+        messages, watermark = self.loader.load(chat_id, user_id, after)
+        load_seconds.observe(time.perf_counter() - start)
+        rows_loaded.inc(len(messages))
+        return messages, watermark
+
+    def _remember(self, chat_id, watermark, revision):
+        with self._lock:
+            self._watermarks[chat_id] = (watermark, revision, time.monotonic())
+            self._watermarks.move_to_end(chat_id)
+            while len(self._watermarks) > MAX_WATERMARKS:
+                self._watermarks.popitem(last=False)
@@ -0,0 +1,144 @@
+"""
+Long-lived asyncio event loop shared by the Flask request threads.
+
+Flask handles every request on a plain thread, but the upstream model APIs are
+streamed with aiohttp. Instead of creating (and tearing down) an event loop and
+a ClientSession for every request, a single loop runs on a daemon thread and
+owns one pooled, keep-alive ClientSession. Request threads hand it coroutines
+and async generators and consume the results through a thread-safe queue.
+"""
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import weakref
+
+import aiohttp
+
+# Connection pool limits for the shared ClientSession (per process)
+POOL_LIMIT = int(os.environ.get("CHUTES_POOL_LIMIT", 100))
+POOL_LIMIT_PER_HOST = int(os.environ.get("CHUTES_POOL_LIMIT_PER_HOST", 32))
+KEEPALIVE_TIMEOUT = float(os.environ.get("CHUTES_KEEPALIVE_TIMEOUT", 75))
+
+_DONE = object()
+
+# One pooled session per event loop (aiohttp sessions are bound to their loop)
+_sessions = weakref.WeakKeyDictionary()
+
+
+def create_client_session():
+    """
+    Create a ClientSession with a keep-alive connection pool.
+    Must be called from inside the event loop that will use the session.
+    """
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        ttl_dns_cache=300,
+    )
+    return aiohttp.ClientSession(connector=connector)
+
+
+async def get_session():
+    """Return the pooled ClientSession of the running event loop."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = _sessions[loop] = create_client_session()
+    return session
+
+
+async def close_session():
+    """Close the pooled ClientSession of the running event loop, if any."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+class BackgroundLoop:
+    """
+    An event loop running forever on a daemon thread.
+    The loop is started lazily on first use and stopped at interpreter exit.
+    Coroutines running on it share the loop's pooled session (get_session()).
+    """
+
+    def __init__(self, name="background-loop"):
+        self.name = name
+        self._loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name=self.name, daemon=True)
+        self._thread.start()
+        ready.wait()
+        self._loop = loop
+        atexit.register(self.close)
+
+    def submit(self, coro):
+        """Schedule a coroutine on the loop and return a concurrent Future."""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run a coroutine on the loop and block the calling thread for its result."""
+        return self.submit(coro).result(timeout)
+
+    def iterate(self, async_gen):
+        """
+        Drive an async generator on the loop and yield its items synchronously.
+        If the consumer stops early (e.g. the client disconnected), the
+        producing task is cancelled so the upstream stream is released.
+        """
+        items = queue.Queue()
+
+        async def pump():
+            try:
+                async for item in async_gen:
+                    items.put(item)
+            except Exception as e:
+                items.put(e)
+            finally:
+                items.put(_DONE)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                item = items.get()
+                if item is _DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def close(self):
+        if self._loop is None or self._loop.is_closed():
+            return
+
+        try:
+            self.run(close_session(), timeout=5)
+        except Exception:
+            pass
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop.close()
@@ -0,0 +1,312 @@
+"""
+Write-behind persistence of assistant responses into the Django message store.
+
+The routing backend hands completed responses (and, while a response is still
+streaming, periodic partial checkpoints) to a bounded queue. A background
+thread drains the queue and writes batches into `chats_messages`: rows are
+keyed by (chat_id, message_id), so a checkpoint is inserted once and then
+updated in place by later checkpoints and the final response. Every message
+is written on behalf of a user, and only into a chat of that user's: rows of
+other users' chats are neither inserted nor updated, whatever ids the client
+sent. Messages whose chat row does not exist yet are retried with the next
+batches. In the same transaction the written chats'
+message counters (`message_count`, `total_bytes`, `last_message_at`) are
+adjusted by what the batch added, and their `history_version` is bumped so the
+Django backend's history cache does not serve them stale.
+
+Uses the same DB_* settings as history_hydration.py and is disabled when the
+database is not configured or WRITE_BEHIND=0. Pending messages are flushed on
+shutdown.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+
+try:
+    import psycopg2
+    import psycopg2.extras
+except ImportError:
+    psycopg2 = None
+
+from history_hydration import database_settings
+import metrics
+
+ENABLED = os.environ.get("WRITE_BEHIND", "1") != "0"
+QUEUE_SIZE = int(os.environ.get("WRITE_BEHIND_QUEUE_SIZE", 10000))
+BATCH_SIZE = int(os.environ.get("WRITE_BEHIND_BATCH_SIZE", 200))
+FLUSH_INTERVAL = float(os.environ.get("WRITE_BEHIND_FLUSH_INTERVAL", 0.5))
+MAX_RETRIES = int(os.environ.get("WRITE_BEHIND_MAX_RETRIES", 5))
+# Seconds between partial checkpoints of a streaming response (0 disables)
+CHECKPOINT_INTERVAL = float(os.environ.get("WRITE_BEHIND_CHECKPOINT_SECONDS", 5))
+
+# Both return (message_id, chat_id, messages added, bytes added, time_sent of
+# the new message), sizes being those of the JSON text as in the Django
+# backend's chats/counters.py
+_UPDATE = """
+    UPDATE chats_messages AS m SET message = v.message::jsonb
+    FROM (VALUES %s) AS v(chat_id, user_id, message_id, message), chats_chats AS c, chats_messages AS old
+    WHERE m.chat_id = v.chat_id::uuid AND m.message_id = v.message_id::uuid
+      AND c.chat_id = m.chat_id AND c.user_id = v.user_id::integer AND c.deleted_at IS NULL
+      AND old.id = m.id
+    RETURNING m.message_id::text, m.chat_id::text, 0,
+              octet_length(m.message::text) - octet_length(old.message::text), NULL::timestamptz
+"""
+_INSERT = """
+    INSERT INTO chats_messages (user_id, chat_id, message, message_id, time_sent)
+    SELECT c.user_id, c.chat_id, v.message::jsonb, v.message_id::uuid, now()
+    FROM (VALUES %s) AS v(chat_id, user_id, message_id, message)
+    JOIN chats_chats AS c
+      ON c.chat_id = v.chat_id::uuid AND c.user_id = v.user_id::integer AND c.deleted_at IS NULL
+    RETURNING message_id::text, chat_id::text, 1, octet_length(message::text), time_sent
+"""
+# Also invalidates the chats' cached histories in the Django backend
+_COUNT_MESSAGES = """
+    UPDATE chats_chats AS c SET
+        message_count = c.message_count + v.messages,
+        total_bytes = c.total_bytes + v.bytes,
+        last_message_at = GREATEST(c.last_message_at, v.last_message_at::timestamptz),
+        history_version = c.history_version + 1
+    FROM (VALUES %s) AS v(chat_id, messages, bytes, last_message_at)
+    WHERE c.chat_id = v.chat_id::uuid
+"""
+
+_STOP = object()
+
+writes = metrics.registry.counter(
+    "write_behind_messages_total", "Write-behind message writes by outcome.", ("outcome",))
+queue_depth = metrics.registry.gauge(
+    "write_behind_queue_depth", "Messages waiting in the write-behind queue.")
+flush_seconds = metrics.registry.histogram(
+    "write_behind_flush_seconds", "Time to write one batch to the database.")
+
+
+class PendingMessage:
+    __slots__ = ("chat_id", "user_id", "message_id", "message", "attempts")
+
+    def __init__(self, chat_id, user_id, message_id, message):
+        self.chat_id = str(chat_id)
+        self.user_id = int(user_id)
+        self.message_id = str(message_id)
+        self.message = message
+        self.attempts = 0
+
+    @property
+    def key(self):
+        return (self.message_id, self.chat_id)
+
+    def values(self):
+        return (self.chat_id, self.user_id, self.message_id, psycopg2.extras.Json(self.message))
+
+
+def chat_counters(rows):
+    """
+    Sum the rows returned by _UPDATE and _INSERT into (chat_id, messages,
+    bytes, latest time_sent) per chat, in chat_id order so that concurrent
+    writers lock the chat rows in the same order.
+    """
+    chats = {}
+    for _, chat_id, added, size, time_sent in rows:
+        messages, total, last = chats.get(chat_id, (0, 0, None))
+        if time_sent is not None and (last is None or time_sent > last):
+            last = time_sent
+        chats[chat_id] = (messages + added, total + (size or 0), last)
+    return [(chat_id, *chats[chat_id]) for chat_id in sorted(chats)]
+
+
+class MessageWriter:
+    def __init__(self, settings=None, queue_size=QUEUE_SIZE, batch_size=BATCH_SIZE,
+                 flush_interval=FLUSH_INTERVAL, max_retries=MAX_RETRIES, enabled=ENABLED):
+        self.settings = {k: v for k, v in (settings or database_settings()).items() if v}
+        self.enabled = enabled and psycopg2 is not None and bool(self.settings.get("dbname"))
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._connection = None
+        self._lock = threading.Lock()
+        self._closed = False
+        # Messages waiting for their chat row, retried with the next batches
+        self._deferred = {}
+
+    def submit(self, chat_id, user_id, message_id, message):
+        """
+        Queue a message for writing into the user's chat; never blocks.
+        Returns False when the writer is disabled, there is no user or the
+        queue is full (the message is dropped).
+        """
+        if not self.enabled or self._closed or user_id is None:
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait(PendingMessage(chat_id, user_id, message_id, message))
+        except queue.Full:
+            writes.inc(outcome="dropped")
+            return False
+        queue_depth.inc()
+        return True
+
+    def close(self, timeout=10):
+        """Flush everything that is queued and stop the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="message-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            batch = {}
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = None
+            # Collect what is queued, up to one batch
+            while item is not None:
+                if item is _STOP:
+                    stopping = True
+                else:
+                    queue_depth.dec()
+                    # Later checkpoints of the same message replace earlier ones
+                    batch[item.key] = item
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if stopping:
+                # Drain the rest of the queue before exiting
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if item is not _STOP:
+                        queue_depth.dec()
+                        batch[item.key] = item
+
+            for key, item in self._deferred.items():
+                batch.setdefault(key, item)
+            self._deferred = {}
+            if batch:
+                self._write_with_retry(list(batch.values()))
+        if self._deferred:
+            print(f"Write-behind: dropping {len(self._deferred)} messages whose chat was not found")
+            writes.inc(len(self._deferred), outcome="failed")
+        self._disconnect()
+
+    def _write_with_retry(self, items):
+        for attempt in range(self.max_retries + 1):
+            try:
+                start = time.perf_counter()
+                missing = self._write(items)
+                flush_seconds.observe(time.perf_counter() - start)
+                break
+            except psycopg2.OperationalError as e:
+                # Connection problems: reconnect with backoff
+                print(f"Write-behind flush failed (attempt {attempt + 1}): {e}")
+                self._disconnect()
+                if attempt < self.max_retries:
+                    time.sleep(min(30, 0.5 * 2 ** attempt))
+            except psycopg2.Error as e:
+                print(f"Write-behind flush failed, dropping {len(items)} messages: {e}")
+                self._rollback()
+                writes.inc(len(items), outcome="failed")
+                return
+        else:
+            writes.inc(len(items), outcome="failed")
+            return
+
+        writes.inc(len(items) - len(missing), outcome="written")
+        for item in missing:
+            item.attempts += 1
+            if item.attempts > self.max_retries:
+                print(f"Write-behind: chat {item.chat_id} of user {item.user_id} not found, "
+                      f"dropping message {item.message_id}")
+                writes.inc(outcome="failed")
+            else:
+                self._deferred[item.key] = item
+
+    def _write(self, items):
+        """
+        Update existing rows, insert the rest; returns the items whose chat
+        does not exist (or is not their user's).
+        """
+        connection = self._connect()
+        with connection.cursor() as cursor:
+            rows = psycopg2.extras.execute_values(
+                cursor, _UPDATE, [item.values() for item in items], fetch=True)
+            updated = {(row[0], row[1]) for row in rows}
+            new_items = [item for item in items if item.key not in updated]
+            if new_items:
+                rows += psycopg2.extras.execute_values(
+                    cursor, _INSERT, [item.values() for item in new_items], fetch=True)
+            written = {(row[0], row[1]) for row in rows}
+            counters = chat_counters(rows)
+            if counters:
+                psycopg2.extras.execute_values(cursor, _COUNT_MESSAGES, counters)
+        connection.commit()
+        return [item for item in items if item.key not in written]
+
+    def _connect(self):
+        if self._connection is None or self._connection.closed:
+            self._connection = psycopg2.connect(**self.settings)
+        return self._connection
+
+    def _rollback(self):
+        try:
+            if self._connection is not None and not self._connection.closed:
+                self._connection.rollback()
+        except psycopg2.Error:
+            self._disconnect()
+
+    def _disconnect(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except psycopg2.Error:
+                pass
+            self._connection = None
+
+
+async def persist_response(frames, writer, chat_id, user_id, message_id, prefix="",
+                           checkpoint_interval=CHECKPOINT_INTERVAL):
+    """
+    Pass a model's frames through and hand its response to `writer`, to be
+    saved in the user's chat: a partial checkpoint every `checkpoint_interval`
+    seconds while it streams, and the final text when it ends (also when the
+    client disconnects mid-stream).
+    """
+    parts = []
+    last_checkpoint = time.monotonic()
+
+    def submit():
+        writer.submit(chat_id, user_id, message_id, {"role": "assistant", "content": prefix + "".join(parts)})
+
+    try:
+        async for frame in frames:
+            content = frame.get("content")
+            if content and not frame.get("separator"):
+                parts.append(content)
+                if checkpoint_interval > 0 and time.monotonic() - last_checkpoint >= checkpoint_interval:
+                    last_checkpoint = time.monotonic()
+                    submit()
+            yield frame
+    finally:
+        if parts:
+            submit()
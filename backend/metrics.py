@@ -0,0 +1,220 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters, gauges and histograms with labels, kept in memory and rendered by
+the /metrics route of deep.py / deep_asgi.py. Everything is guarded by one
+lock because the metrics are updated from the Flask request threads and from
+the background event loop alike.
+
+`track_stream(provider, model)` instruments one upstream model stream:
+connect time, time to first token, total generation time, chunks and tokens
+emitted, error categories and the number of streams in flight.
+"""
+import threading
+import time
+
+from context_window import estimate_tokens
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+
+_lock = threading.Lock()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+
+    def _key(self, labels):
+        if labels.keys() != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with _lock:
+            items = sorted(self._values.items())
+            lines.extend(self._render_samples(items))
+        return lines
+
+    def _render_samples(self, items):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            self._values[key] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket (non-cumulative) counts, sum, count
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+
+    def _render_samples(self, items):
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+_STREAM_LABELS = ("provider", "model")
+
+upstream_requests = registry.counter(
+    "llm_upstream_requests_total", "Model streams started.", _STREAM_LABELS)
+upstream_errors = registry.counter(
+    "llm_upstream_errors_total", "Model stream errors by category.", _STREAM_LABELS + ("category",))
+streams_in_flight = registry.gauge(
+    "llm_streams_in_flight", "Model streams currently open.", _STREAM_LABELS)
+connect_seconds = registry.histogram(
+    "llm_upstream_connect_seconds", "Time until the upstream accepted the request and started the stream.",
+    _STREAM_LABELS)
+first_token_seconds = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first content chunk arrived.", _STREAM_LABELS)
+generation_seconds = registry.histogram(
+    "llm_generation_seconds", "Total time of a model stream.", _STREAM_LABELS)
+chunks_emitted = registry.counter(
+    "llm_chunks_total", "Content chunks streamed to clients.", _STREAM_LABELS)
+tokens_emitted = registry.counter(
+    "llm_tokens_total", "Estimated tokens streamed to clients.", _STREAM_LABELS)
+response_tokens = registry.histogram(
+    "llm_response_tokens", "Estimated tokens per model response.", _STREAM_LABELS, SIZE_BUCKETS)
+
+
+class StreamTracker:
+    """Records the metrics of one model stream. Use `track_stream` to create it."""
+
+    __slots__ = ("labels", "start", "first_token", "tokens", "finished")
+
+    def __init__(self, provider, model):
+        self.labels = {"provider": provider, "model": model}
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.tokens = 0
+        self.finished = False
+        upstream_requests.inc(**self.labels)
+        streams_in_flight.inc(**self.labels)
+
+    def connected(self):
+        connect_seconds.observe(time.perf_counter() - self.start, **self.labels)
+
+    def chunk(self, content):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            first_token_seconds.observe(self.first_token - self.start, **self.labels)
+        tokens = estimate_tokens(content)
+        self.tokens += tokens
+        chunks_emitted.inc(**self.labels)
+        tokens_emitted.inc(tokens, **self.labels)
+
+    def error(self, category):
+        upstream_errors.inc(category=category, **self.labels)
+
+    def finish(self):
+        if self.finished:
+            return
+        self.finished = True
+        streams_in_flight.dec(**self.labels)
+        generation_seconds.observe(time.perf_counter() - self.start, **self.labels)
+        response_tokens.observe(self.tokens, **self.labels)
+
+
+def track_stream(provider, model):
+    return StreamTracker(provider, model)
@@ -0,0 +1,199 @@
+"""
+Local stand-in for the upstream model APIs, for load tests without quota.
+
+Serves an OpenAI-compatible /v1/chat/completions endpoint (Chutes) and the
+Gemini generateContent / streamGenerateContent endpoints. Responses are
+lorem-ipsum tokens streamed at a configurable rate, after a configurable
+first-token latency, with optional per-token jitter and error injection.
+
+    python mock_llm.py --port 8900 --rate 50 --latency-ms 300 --error-rate 0.01
+
+Point deep.py at it with:
+
+    CHUTES_BASE_URL=http://127.0.0.1:8900/v1
+    GEMINI_BASE_URL=http://127.0.0.1:8900
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from aiohttp import web
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor "
+    "incididunt ut labore et dolore magna aliqua ut enim ad minim veniam quis nostrud"
+).split()
+
+
+class MockOptions:
+    def __init__(self, tokens=200, rate=50.0, latency_ms=200.0, jitter_ms=0.0,
+                 error_rate=0.0, drop_rate=0.0, malformed_rate=0.0, seed=None):
+        # Tokens per response (capped by the request's max_tokens)
+        self.tokens = tokens
+        # Tokens per second; 0 streams as fast as possible
+        self.rate = rate
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        # Share of requests answered with HTTP 500
+        self.error_rate = error_rate
+        # Share of streams cut off half way (no [DONE] / finish reason)
+        self.drop_rate = drop_rate
+        # Share of chunks sent as invalid JSON
+        self.malformed_rate = malformed_rate
+        self.random = random.Random(seed)
+
+
+def _tokens(options, max_tokens):
+    count = options.tokens
+    if max_tokens:
+        count = min(count, int(max_tokens))
+    return [(" " if i else "") + WORDS[i % len(WORDS)] for i in range(count)]
+
+
+async def _paced(options, tokens):
+    """Yield tokens on schedule: first after `latency`, then at `rate`."""
+    start = time.monotonic()
+    await asyncio.sleep(options.latency)
+    interval = 1 / options.rate if options.rate > 0 else 0
+    for i, token in enumerate(tokens):
+        if interval or options.jitter:
+            # Schedule against the start time so the rate does not drift
+            due = start + options.latency + i * interval + options.random.uniform(0, options.jitter)
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        yield token
+
+
+def _fail(options):
+    return options.error_rate and options.random.random() < options.error_rate
+
+
+def _drop_after(options, count):
+    if options.drop_rate and options.random.random() < options.drop_rate:
+        return count // 2
+    return None
+
+
+async def _sse_response(request):
+    response = web.StreamResponse(headers={
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+    })
+    await response.prepare(request)
+    return response
+
+
+async def chat_completions(request):
+    options = request.app["options"]
+    body = await request.json()
+    if _fail(options):
+        return web.json_response({"error": {"message": "Injected upstream error"}}, status=500)
+
+    model = body.get("model", "mock")
+    tokens = _tokens(options, body.get("max_tokens"))
+    if not body.get("stream"):
+        await asyncio.sleep(options.latency + (len(tokens) / options.rate if options.rate > 0 else 0))
+        return web.json_response({
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                         "finish_reason": "stop"}],
+        })
+
+    response = await _sse_response(request)
+    drop_after = _drop_after(options, len(tokens))
+    created = int(time.time())
+    index = 0
+    async for token in _paced(options, tokens):
+        if index == drop_after:
+            return response
+        if options.malformed_rate and options.random.random() < options.malformed_rate:
+            await response.write(b'data: {"choices": [{"delta": {"content": \n\n')
+        else:
+            chunk = {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            await response.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+        index += 1
+    await response.write(b"data: [DONE]\n\n")
+    await response.write_eof()
+    return response
+
+
+def _gemini_chunk(model, text, finished=False, tokens=0):
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    chunk = {"candidates": [candidate], "modelVersion": model}
+    if finished:
+        candidate["finishReason"] = "STOP"
+        chunk["usageMetadata"] = {"candidatesTokenCount": tokens, "totalTokenCount": tokens}
+    return chunk
+
+
+async def gemini(request):
+    # Paths look like /v1beta/models/<model>:streamGenerateContent?alt=sse
+    options = request.app["options"]
+    model, _, method = request.match_info["target"].partition(":")
+    if method not in ("generateContent", "streamGenerateContent"):
+        return web.json_response({"error": {"code": 404, "message": f"Unknown method {method}"}}, status=404)
+    body = await request.json()
+    if _fail(options):
+        return web.json_response({"error": {"code": 500, "message": "Injected upstream error", "status": "INTERNAL"}},
+                                 status=500)
+
+    config = body.get("generationConfig") or {}
+    tokens = _tokens(options, config.get("maxOutputTokens"))
+    if method == "generateContent":
+        await asyncio.sleep(options.latency + (len(tokens) / options.rate if options.rate > 0 else 0))
+        return web.json_response(_gemini_chunk(model, "".join(tokens), True, len(tokens)))
+
+    response = await _sse_response(request)
+    drop_after = _drop_after(options, len(tokens))
+    index = 0
+    async for token in _paced(options, tokens):
+        if index == drop_after:
+            return response
+        last = index == len(tokens) - 1
+        chunk = _gemini_chunk(model, token, last, len(tokens))
+        await response.write(b"data: " + json.dumps(chunk).encode("utf-8") + b"\r\n\r\n")
+        index += 1
+    await response.write_eof()
+    return response
+
+
+def create_app(options=None):
+    app = web.Application()
+    app["options"] = options or MockOptions()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/{version}/models/{target}", gemini)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per response")
+    parser.add_argument("--rate", type=float, default=50, help="tokens per second (0: unthrottled)")
+    parser.add_argument("--latency-ms", type=float, default=200, help="delay before the first token")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random extra delay per token")
+    parser.add_argument("--error-rate", type=float, default=0, help="share of requests failing with HTTP 500")
+    parser.add_argument("--drop-rate", type=float, default=0, help="share of streams cut off half way")
+    parser.add_argument("--malformed-rate", type=float, default=0, help="share of chunks sent as invalid JSON")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    options = MockOptions(args.tokens, args.rate, args.latency_ms, args.jitter_ms,
+                          args.error_rate, args.drop_rate, args.malformed_rate, args.seed)
+    web.run_app(create_app(options), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Incremental parser for OpenAI-style streaming responses.
+
+Works on the raw bytes received from the upstream API (Server-Sent Events with
+`data: {...}` lines, or plain NDJSON) and extracts only
+`choices[0].delta.content` from each chunk. Lines are split on bytes, never
+decoded as a whole, and chunks without a "content" key are skipped without
+being parsed.
+
+orjson is used for (de)serialization when it is installed; set
+SSE_JSON_BACKEND=json to force the standard library.
+"""
+import json
+import os
+
+JSON_BACKEND = os.environ.get("SSE_JSON_BACKEND", "auto")
+
+if JSON_BACKEND in ("auto", "orjson"):
+    try:
+        import orjson
+    except ImportError:
+        if JSON_BACKEND == "orjson":
+            raise
+        orjson = None
+else:
+    orjson = None
+
+if orjson is not None:
+    JSON_BACKEND = "orjson"
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+else:
+    JSON_BACKEND = "json"
+    _decode = json.JSONDecoder().decode
+    dumps = json.JSONEncoder().encode
+
+    def loads(data):
+        # Accepts bytes or str like orjson.loads. Skips json.loads' encoding
+        # detection; upstream payloads are UTF-8
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode("utf-8")
+        return _decode(data)
+
+
+_CONTENT_KEY = b'"content"'
+
+
+class SSEParseError(ValueError):
+    pass
+
+
+class SSEParser:
+    """
+    Feed it raw bytes as they arrive; it returns the content deltas of every
+    complete event. Malformed events are returned as SSEParseError instances
+    in place of their content so the caller can report them and carry on.
+    """
+
+    __slots__ = ("_buffer", "done")
+
+    def __init__(self):
+        self._buffer = b""
+        self.done = False
+
+    def feed(self, data):
+        if self.done:
+            return []
+        buffer = self._buffer + data if self._buffer else data
+        lines = buffer.split(b"\n")
+        self._buffer = lines.pop()
+
+        items = []
+        for line in lines:
+            if line.startswith(b"data:"):
+                payload = line[5:].strip()
+            elif line.startswith(b"{"):
+                # NDJSON stream
+                payload = line.strip()
+            else:
+                # Blank separator lines, comments (": ping") and other fields
+                continue
+
+            if payload == b"[DONE]":
+                self.done = True
+                break
+            if _CONTENT_KEY not in payload:
+                continue
+            try:
+                content = loads(payload)["choices"][0]["delta"].get("content")
+            except (ValueError, KeyError, IndexError, TypeError, AttributeError) as e:
+                items.append(SSEParseError(f"{e}: {payload[:200]!r}"))
+                continue
+            if content:
+                items.append(content)
+        return items
+
+    def flush(self):
+        """Parse a trailing event that was not terminated by a newline."""
+        if not self._buffer:
+            return []
+        return self.feed(b"\n")
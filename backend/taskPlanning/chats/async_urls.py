@@ -0,0 +1,11 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('save-chat/', async_views.save_chat_history, name='async_save_chat_history'),
+    path('save-chat-batch/', async_views.save_chat_history_batch, name='async_save_chat_history_batch'),
+    path('get-chat-history/<str:chat_id>/', async_views.get_chat_history, name='async_get_chat_history'),
+    path('get-chat-ids/', async_views.get_chat_ids, name='async_get_chat_ids'),
+    path('delete-chat/<str:chat_id>/', async_views.delete_chat, name='async_delete_chat'),
+    path('save-chat-name/<str:chat_id>/', async_views.set_chat_name, name='async_set_chat_name'),
+]
@@ -0,0 +1,247 @@
+"""
+Async versions of the chats endpoints, served under /api/chats-async/.
+
+They take the same parameters and return the same responses as the views in
+views.py, whose query and response helpers they share, but use Django's async
+ORM. Under an ASGI server (`uvicorn taskPlanning.asgi:application`) a request
+that waits on the database or streams a long history does not tie up a
+worker thread. Writes that need a transaction run through sync_to_async.
+
+DRF's @api_view only wraps sync views, so these are plain Django views: the
+session user comes from request.auser() and unsafe methods are checked by the
+CSRF middleware, as SessionAuthentication does for the DRF views.
+"""
+from functools import wraps
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+
+from . import cache as chat_cache
+from . import views
+from .models import Chats
+
+
+def async_login_required(view):
+    """Pass the session user to the view, or answer 403 like IsAuthenticated."""
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({"detail": "Authentication credentials were not provided."}, status=403)
+        return await view(request, user, *args, **kwargs)
+    return wrapper
+
+
+def request_data(request):
+    """The JSON object in the request body, or None if there is none."""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@require_http_methods(["POST"])
+@async_login_required
+async def save_chat_history(request, user):
+    """
+    Save chat history to the database.
+    """
+    data = request_data(request)
+    if data is None:
+        return JsonResponse({"error": "Invalid JSON body"}, status=400)
+    chat_id = data.get("chat_id")
+    message = data.get("message")
+
+    if not chat_id or not message:
+        return JsonResponse({"error": "Chat ID and message are required"}, status=400)
+
+    try:
+        created = await sync_to_async(views.save_message)(
+            user, chat_id, data.get("chat_name"), message, data.get("message_id")
+        )
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if created:
+        await chat_cache.ainvalidate_chat_list(user.id)
+
+    return JsonResponse({"message": "Chat history saved successfully"})
+
+
+@require_http_methods(["POST"])
+@async_login_required
+async def save_chat_history_batch(request, user):
+    """
+    Save many messages, for one or more chats, in a single transaction
+    (see views.save_chat_history_batch).
+    """
+    data = request_data(request)
+    try:
+        chat_names, messages = views.parse_message_batch(user, data.get("messages") if data else None)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        if not await sync_to_async(views.save_message_batch)(user, chat_names, messages):
+            return JsonResponse({"error": "You don't have access to this chat"}, status=400)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    await chat_cache.ainvalidate_chat_list(user.id)
+    return JsonResponse({"message": "Chat history saved successfully", "saved": len(messages)})
+
+
+@require_http_methods(["GET"])
+@async_login_required
+async def get_chat_history(request, user, chat_id):
+    """
+    Retrieve all chat history for a specific id, streamed from an async
+    server-side cursor, or one page of it (see views.get_chat_history).
+    """
+    if any(key in request.GET for key in ("limit", "before", "after")):
+        try:
+            params = views.history_page_params(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            rows = [row async for row in views.history_page_rows(chat_id, *params)]
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+        return views.history_page_response(rows, user, *params)
+
+    try:
+        chat = await views.chat_history_state(chat_id).afirst()
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if chat is None or not chat[2]:
+        return JsonResponse({"error": "Chat doesn't exist or has no messages"})
+    if chat[0] != user.id:
+        return JsonResponse({"error": "You don't have access to this chat"}, status=400)
+
+    validators = views.history_validators(user, chat)
+    response = views.not_modified(request, validators)
+    if response is not None:
+        return response
+    cached = await chat_cache.aget_chat_history(user.id, chat_id, chat[1])
+    if cached is not None:
+        return views.with_validators(HttpResponse(cached, content_type="application/json"), validators)
+
+    try:
+        rows = views.chat_history_rows(chat_id, named=True).aiterator(chunk_size=views.HISTORY_CHUNK_SIZE)
+        first = await anext(rows, None)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if first is None:
+        return JsonResponse({"error": "Chat doesn't exist or has no messages"})
+
+    body = chat_cache.acache_chat_history(stream_chat_history(first, rows), user.id, chat_id, chat[1])
+    return views.with_validators(StreamingHttpResponse(body, content_type="application/json"), validators)
+
+
+async def stream_chat_history(first, rows):
+    """views.stream_chat_history over an async iterator."""
+    encode = DjangoJSONEncoder().encode
+    parts = ["[", views.encode_history_row(encode, first)]
+    async for row in rows:
+        parts.append(", ")
+        parts.append(views.encode_history_row(encode, row))
+        if len(parts) >= views.HISTORY_CHUNK_SIZE:
+            yield "".join(parts)
+            parts = []
+    parts.append("]")
+    yield "".join(parts)
+
+
+@require_http_methods(["GET"])
+@async_login_required
+async def get_chat_ids(request, user):
+    """
+    Retrieve all chats for a user, one page of them or the changes since a
+    watermark (see views.get_chat_ids).
+    """
+    if any(key in request.GET for key in ("since", "limit", "cursor", "sort")):
+        if "since" in request.GET:
+            parse, query, respond = views.chat_changes_params, views.chat_changes_rows, views.chat_changes_response
+            extra = (request.GET["since"],)
+        else:
+            parse, query, respond = views.chat_ids_page_params, views.chat_ids_page_rows, views.chat_ids_page_response
+            extra = ()
+        try:
+            params = parse(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        try:
+            rows = [row async for row in query(user, *params)]
+        except Exception as e:
+            return JsonResponse({"error": str(e)}, status=500)
+        return respond(rows, *extra, *params)
+
+    try:
+        state = await views.chat_list_state(user).aaggregate(chat_count=Count('*'), last_change=Max('updated_at'))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    validators = views.chat_list_validators(user, state)
+    response = views.not_modified(request, validators)
+    if response is not None:
+        return response
+
+    cached, version = await chat_cache.aget_chat_list(user.id)
+    if cached is not None:
+        return views.with_validators(HttpResponse(cached, content_type="application/json"), validators)
+
+    try:
+        response = views.chat_list_response([row async for row in views.chat_list_rows(user)])
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    await chat_cache.aset_chat_list(user.id, version, response.content.decode())
+    return views.with_validators(response, validators)
+
+
+@require_http_methods(["DELETE"])
+@async_login_required
+async def delete_chat(request, user, chat_id):
+    """
+    Delete a specific chat by ID (soft delete, see views.delete_chat).
+    """
+    try:
+        if not await sync_to_async(views.soft_delete_chat)(user, chat_id):
+            return JsonResponse({"error": "Chat doesn't exist or you don't have access"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    await chat_cache.ainvalidate_chat_list(user.id)
+    return JsonResponse({"message": "Chat deleted successfully"}, status=200)
+
+
+@require_http_methods(["PUT"])
+@async_login_required
+async def set_chat_name(request, user, chat_id):
+    """
+    Set or update the name of a chat.
+    """
+    data = request_data(request)
+    chat_name = data.get("chat_name") if data else None
+
+    if not chat_name:
+        return JsonResponse({"error": "Chat name is required"}, status=400)
+
+    try:
+        chat = await Chats.objects.aget(chat_id=chat_id, user=user, deleted_at__isnull=True)
+        chat.chat_name = chat_name
+        await chat.asave()
+    except Chats.DoesNotExist:
+        return JsonResponse({"error": "Chat not found or you don't have access"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    await chat_cache.ainvalidate_chat_list(user.id)
+    return JsonResponse({"message": "Chat name updated successfully"}, status=200)
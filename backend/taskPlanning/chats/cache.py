@@ -0,0 +1,169 @@
+"""
+Read-through cache of chat lists and chat histories.
+
+Entries live in the configured Django cache (see CACHES in settings.py):
+local memory or files for a single node, redis or any other Django backend
+for shared deployments.
+
+- The chat list of a user is cached under a key that includes a per-user
+  version token, which is replaced when one of the user's chats is created,
+  renamed or deleted. A list read before the change is stored under the old
+  token, so it can not overwrite the invalidation.
+- A chat history is cached under a key that includes the chat's
+  `history_version`, which is bumped in the database by every write to the
+  chat's messages along with its counters (see chats/counters.py), including
+  the routing backend's write-behind. Reading the
+  version costs one lookup of the chat row (which also checks ownership);
+  old versions are never read again and expire.
+
+Cache failures are counted and treated as misses. Hit/miss counters are kept
+per process and reported by the cache-stats endpoint. The a-prefixed
+functions are the variants for async_views.py.
+"""
+from collections import defaultdict
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: {"hits": 0, "misses": 0, "errors": 0})
+
+
+def _count(kind, outcome):
+    with _lock:
+        _counters[kind][outcome] += 1
+
+
+def stats():
+    with _lock:
+        counters = {kind: dict(values) for kind, values in _counters.items()}
+    for values in counters.values():
+        lookups = values["hits"] + values["misses"]
+        values["hit_rate"] = values["hits"] / lookups if lookups else None
+    return {"backend": settings.CACHES["default"]["BACKEND"], "counters": counters}
+
+
+def _get(kind, key):
+    try:
+        value = cache.get(key)
+    except Exception as e:
+        print(f"Cache get failed for {key}: {e}")
+        _count(kind, "errors")
+        value = None
+    _count(kind, "misses" if value is None else "hits")
+    return value
+
+
+def _set(kind, key, value):
+    try:
+        cache.set(key, value)
+    except Exception as e:
+        print(f"Cache set failed for {key}: {e}")
+        _count(kind, "errors")
+
+
+def _list_version_key(user_id):
+    return f"chats:list-version:{user_id}"
+
+
+def _chat_list_version(user_id):
+    key = _list_version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, timeout=None):
+            version = cache.get(key) or version
+    return version
+
+
+def chat_list_key(user_id, version):
+    return f"chats:list:{user_id}:{version}"
+
+
+def history_key(user_id, chat_id, version):
+    return f"chats:history:{user_id}:{chat_id}:{version}"
+
+
+def get_chat_list(user_id):
+    """
+    Returns (content, version): the cached list or None, and the version
+    token to store a freshly read list with.
+    """
+    try:
+        version = _chat_list_version(user_id)
+    except Exception as e:
+        print(f"Cache get failed for the chat list of user {user_id}: {e}")
+        _count("chat_list", "errors")
+        _count("chat_list", "misses")
+        return None, None
+    return _get("chat_list", chat_list_key(user_id, version)), version
+
+
+def set_chat_list(user_id, version, content):
+    if version is not None:
+        _set("chat_list", chat_list_key(user_id, version), content)
+
+
+def invalidate_chat_list(user_id):
+    try:
+        cache.set(_list_version_key(user_id), uuid.uuid4().hex, timeout=None)
+    except Exception as e:
+        print(f"Cache invalidation failed for the chat list of user {user_id}: {e}")
+        _count("chat_list", "errors")
+
+
+def get_chat_history(user_id, chat_id, version):
+    return _get("chat_history", history_key(user_id, chat_id, version))
+
+
+class _HistoryCollector:
+    """Collects the chunks of a streamed history while it fits CHAT_HISTORY_CACHE_MAX_BYTES."""
+
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def add(self, chunk):
+        if self.parts is not None:
+            self.size += len(chunk)
+            if self.size > settings.CHAT_HISTORY_CACHE_MAX_BYTES:
+                self.parts = None
+            else:
+                self.parts.append(chunk)
+
+    @property
+    def content(self):
+        return "".join(self.parts) if self.parts is not None else None
+
+
+def cache_chat_history(chunks, user_id, chat_id, version):
+    """
+    Pass the chunks of a streamed history through and cache the whole
+    document once it has been sent, unless it is larger than
+    CHAT_HISTORY_CACHE_MAX_BYTES or the client went away mid-stream.
+    """
+    collector = _HistoryCollector()
+    for chunk in chunks:
+        collector.add(chunk)
+        yield chunk
+    if collector.content is not None:
+        _set("chat_history", history_key(user_id, chat_id, version), collector.content)
+
+
+async def acache_chat_history(chunks, user_id, chat_id, version):
+    collector = _HistoryCollector()
+    async for chunk in chunks:
+        collector.add(chunk)
+        yield chunk
+    if collector.content is not None:
+        await sync_to_async(_set)("chat_history", history_key(user_id, chat_id, version), collector.content)
+
+
+# The cache backends block, so their calls run in a thread
+aget_chat_list = sync_to_async(get_chat_list)
+aset_chat_list = sync_to_async(set_chat_list)
+ainvalidate_chat_list = sync_to_async(invalidate_chat_list)
+aget_chat_history = sync_to_async(get_chat_history)
@@ -0,0 +1,55 @@
+"""
+Per-chat message counters: `message_count`, `total_bytes` and
+`last_message_at` on Chats.
+
+They are adjusted by the statement that records a write to a chat's messages,
+inside the write's transaction, so they always agree with the messages table:
+saves add the new rows (and bump `history_version`, which invalidates the
+cached history, see chats/cache.py), the purge of deleted chats subtracts the
+rows it deletes. The routing backend's write-behind (message_writer.py) does
+the same in SQL. Sizes are those of the messages' JSON text as Postgres
+renders it, so every writer measures them the same way.
+"""
+from django.db.models import BigIntegerField, Count, F, Func, Max, OuterRef, Subquery, Sum, TextField, Value
+from django.db.models.functions import Cast, Coalesce, Greatest
+
+from .models import Chats
+
+
+class MessageBytes(Func):
+    """Size in bytes of a message's JSON text."""
+    function = "OCTET_LENGTH"
+    output_field = BigIntegerField()
+
+    def __init__(self, expression="message", **extra):
+        super().__init__(Cast(expression, TextField()), **extra)
+
+
+def _per_chat(messages, aggregate, default):
+    """Correlated subquery of `aggregate` over the rows of `messages` in the outer chat."""
+    rows = messages.filter(chat_id=OuterRef("chat_id")).order_by().values("chat_id")
+    return Coalesce(Subquery(rows.annotate(value=aggregate).values("value")), default)
+
+
+def add_messages(chat_ids, messages):
+    """
+    Add `messages`, a queryset of newly saved rows of the chats `chat_ids`,
+    to the chats' counters and bump their history_version, in one UPDATE.
+    """
+    return Chats.objects.filter(chat_id__in=chat_ids).update(
+        message_count=F("message_count") + _per_chat(messages, Count("*"), Value(0)),
+        total_bytes=F("total_bytes") + _per_chat(messages, Sum(MessageBytes()), Value(0)),
+        last_message_at=Greatest(F("last_message_at"), _per_chat(messages, Max("time_sent"), F("last_message_at"))),
+        history_version=F("history_version") + 1,
+    )
+
+
+def remove_messages(chat_ids, messages):
+    """
+    Subtract `messages`, rows of the chats `chat_ids` that are deleted in the
+    same transaction, from the chats' counters. last_message_at is kept.
+    """
+    return Chats.objects.filter(chat_id__in=chat_ids).update(
+        message_count=F("message_count") - _per_chat(messages, Count("*"), Value(0)),
+        total_bytes=F("total_bytes") - _per_chat(messages, Sum(MessageBytes()), Value(0)),
+    )
@@ -0,0 +1,80 @@
+from datetime import timedelta
+import time
+
+from django.core.management.base import BaseCommand
+
+from chats.purge import DEFAULT_BATCH_SIZE, pending_chats, purge_chat
+
+
+class Command(BaseCommand):
+    help = 'Delete the messages of deleted chats in batches (see chats/purge.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help='Messages deleted per statement',
+        )
+        parser.add_argument(
+            '--pause',
+            type=float,
+            default=0,
+            help='Seconds to sleep between batches, to leave the database room for requests',
+        )
+        parser.add_argument(
+            '--older-than',
+            type=float,
+            default=0,
+            help='Only purge chats deleted at least this many seconds ago',
+        )
+        parser.add_argument(
+            '--chat',
+            action='append',
+            dest='chat_ids',
+            help='Only purge this chat (can be repeated)',
+        )
+        parser.add_argument(
+            '--watch',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running, looking for newly deleted chats every SECONDS',
+        )
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if options['batch_size'] < 1:
+            self.stderr.write(self.style.ERROR('--batch-size must be at least 1'))
+            return
+
+        while True:
+            self.purge(options)
+            if options['watch'] is None:
+                break
+            time.sleep(options['watch'])
+
+    def purge(self, options):
+        chats = pending_chats(timedelta(seconds=options['older_than']), options['chat_ids'])
+        chat_count = 0
+        message_count = 0
+        start = time.monotonic()
+
+        for chat in list(chats):
+            purged = purge_chat(chat, options['batch_size'], options['pause'], self.progress)
+            chat_count += 1
+            message_count += purged
+            self.stdout.write(
+                self.style.SUCCESS(f'Purged chat {chat.chat_id} of user {chat.user_id}: {purged} messages')
+            )
+
+        if chat_count or options['watch'] is None:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'\nSummary: purged {message_count} messages of {chat_count} deleted chats '
+                    f'in {time.monotonic() - start:.1f}s'
+                )
+            )
+
+    def progress(self, chat, purged, total):
+        if self.verbosity >= 1:
+            self.stdout.write(f'  chat {chat.chat_id}: {purged}/{total} messages deleted')
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:34
+
+from django.conf import settings
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Build the indexes without locking the messages table for writes
+    atomic = False
+
+    dependencies = [
+        ('chats', '0007_alter_messages_message_id_chats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='messages',
+            index=models.Index(fields=['chat_id', 'time_sent'], name='messages_chat_time_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='messages',
+            index=models.Index(fields=['user', 'chat_id'], name='messages_user_chat_idx'),
+        ),
+    ]
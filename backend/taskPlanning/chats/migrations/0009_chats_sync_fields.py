@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0008_messages_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chats',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(fields=['user', 'created_at'], name='chats_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(fields=['user', 'updated_at'], name='chats_user_updated_idx'),
+        ),
+    ]
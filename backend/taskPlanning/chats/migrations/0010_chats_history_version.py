@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0009_chats_sync_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='history_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0010_chats_history_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='purged_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        # Chats deleted so far had their messages deleted with them
+        migrations.RunSQL(
+            "UPDATE chats_chats SET purged_at = deleted_at WHERE deleted_at IS NOT NULL",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', False), ('purged_at__isnull', True)), fields=['deleted_at'], name='chats_purge_pending_idx'),
+        ),
+    ]
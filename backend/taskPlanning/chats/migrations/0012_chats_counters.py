@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:57
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0011_chats_purged_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chats',
+            name='last_message_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='chats',
+            name='message_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chats',
+            name='total_bytes',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chats',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', '-last_message_at', '-id'], name='chats_user_activity_idx'),
+        ),
+    ]
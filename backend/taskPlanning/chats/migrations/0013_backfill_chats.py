@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Chats (or messages) handled per statement; every batch commits on its own
+BATCH_SIZE = 1000
+
+# Chat rows for messages saved before the chats table existed, owned by the
+# user of the chat's first message
+CREATE_MISSING_CHATS = """
+    INSERT INTO chats_chats (chat_id, user_id, chat_name, created_at, updated_at, history_version,
+                             message_count, total_bytes, last_message_at)
+    SELECT DISTINCT ON (m.chat_id) m.chat_id, m.user_id, NULL, m.time_sent, now(), 0, 0, 0, m.time_sent
+    FROM chats_messages AS m
+    WHERE m.chat_id IN (
+        SELECT DISTINCT o.chat_id FROM chats_messages AS o
+        WHERE NOT EXISTS (SELECT 1 FROM chats_chats AS c WHERE c.chat_id = o.chat_id)
+        LIMIT %s
+    )
+    ORDER BY m.chat_id, m.time_sent, m.id
+"""
+
+COUNT_MESSAGES = """
+    UPDATE chats_chats AS c SET
+        message_count = s.message_count,
+        total_bytes = s.total_bytes,
+        last_message_at = COALESCE(s.last_message_at, c.created_at)
+    FROM (
+        SELECT b.id, count(m.id) AS message_count,
+               COALESCE(sum(octet_length(m.message::text)), 0) AS total_bytes,
+               max(m.time_sent) AS last_message_at
+        FROM chats_chats AS b
+        LEFT JOIN chats_messages AS m ON m.chat_id = b.chat_id
+        WHERE b.id > %s AND b.id <= %s
+        GROUP BY b.id
+    ) AS s
+    WHERE c.id = s.id
+"""
+
+
+def create_missing_chats(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        while True:
+            cursor.execute(CREATE_MISSING_CHATS, [BATCH_SIZE])
+            if not cursor.rowcount:
+                break
+
+
+def count_messages(apps, schema_editor):
+    Chats = apps.get_model('chats', 'Chats')
+    last_id = Chats.objects.order_by('-id').values_list('id', flat=True).first() or 0
+    with schema_editor.connection.cursor() as cursor:
+        for start in range(0, last_id, BATCH_SIZE):
+            cursor.execute(COUNT_MESSAGES, [start, start + BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    # Backfill in batches instead of one transaction over the whole messages table
+    atomic = False
+
+    dependencies = [
+        ('chats', '0012_chats_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_chats, migrations.RunPython.noop),
+        migrations.RunPython(count_messages, migrations.RunPython.noop),
+    ]
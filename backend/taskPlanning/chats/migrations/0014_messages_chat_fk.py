@@ -0,0 +1,45 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+ADD_FOREIGN_KEY = """
+    ALTER TABLE chats_messages ADD CONSTRAINT chats_messages_chat_id_fk_chats_chats_chat_id
+    FOREIGN KEY (chat_id) REFERENCES chats_chats (chat_id) DEFERRABLE INITIALLY DEFERRED NOT VALID
+"""
+VALIDATE_FOREIGN_KEY = """
+    ALTER TABLE chats_messages VALIDATE CONSTRAINT chats_messages_chat_id_fk_chats_chats_chat_id
+"""
+DROP_FOREIGN_KEY = """
+    ALTER TABLE chats_messages DROP CONSTRAINT chats_messages_chat_id_fk_chats_chats_chat_id
+"""
+
+
+class Migration(migrations.Migration):
+    # The constraint is added without checking the existing rows, which only
+    # takes a brief lock, and validated afterwards without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('chats', '0013_backfill_chats'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            # The chat_id column stays as it is and becomes the foreign key's column
+            state_operations=[
+                migrations.RemoveField(
+                    model_name='messages',
+                    name='chat_id',
+                ),
+                migrations.AddField(
+                    model_name='messages',
+                    name='chat',
+                    field=models.ForeignKey(db_column='chat_id', db_index=False, default=None, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='chats.chats', to_field='chat_id'),
+                    preserve_default=False,
+                ),
+            ],
+            database_operations=[
+                migrations.RunSQL(ADD_FOREIGN_KEY, DROP_FOREIGN_KEY),
+                migrations.RunSQL(VALIDATE_FOREIGN_KEY, migrations.RunSQL.noop),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 import uuid
 
@@ -9,11 +10,29 @@ class Messages(models.Model):
     """
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
-    chat_id = models.UUIDField(editable=False)
+    # References Chats.chat_id through the chat_id column, which keeps its name
+    # and values; the (chat_id, time_sent) index below serves the foreign key
+    chat = models.ForeignKey(
+        "Chats",
+        on_delete=models.CASCADE,
+        to_field="chat_id",
+        db_column="chat_id",
+        db_index=False,
+        related_name="messages",
+        editable=False,
+    )
     message = models.JSONField()
     message_id = models.UUIDField(default=uuid.uuid4, null=True)
     time_sent = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # History of a chat in order
+            models.Index(fields=["chat_id", "time_sent"], name="messages_chat_time_idx"),
+            # A user's messages in a chat (ownership checks, deletes)
+            models.Index(fields=["user", "chat_id"], name="messages_user_chat_idx"),
+        ]
+
     def __str__(self):
         return f"Chat {self.message} for id:{self.chat_id}"
 
@@ -26,6 +45,38 @@ class Chats(models.Model):
     chat_id = models.UUIDField(unique=True)  # Store chat_id directly
     chat_name = models.CharField(max_length=255, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Watermark for incremental sync of the chat list
+    updated_at = models.DateTimeField(auto_now=True)
+    # Tombstone: deleted chats are kept so clients can sync the deletion
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Set once the messages of a deleted chat have been purged (see chats/purge.py)
+    purged_at = models.DateTimeField(null=True, blank=True)
+    # Bumped on every write to the chat's messages; part of its history cache key
+    history_version = models.PositiveIntegerField(default=0)
+    # Counters of the chat's messages, kept up to date by every write (see chats/counters.py)
+    message_count = models.PositiveIntegerField(default=0)
+    # Size of the messages' JSON text in bytes
+    total_bytes = models.PositiveBigIntegerField(default=0)
+    # Time of the latest message (the creation time until there is one)
+    last_message_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="chats_user_created_idx"),
+            models.Index(fields=["user", "updated_at"], name="chats_user_updated_idx"),
+            # Live chats by recent activity
+            models.Index(
+                fields=["user", "-last_message_at", "-id"],
+                name="chats_user_activity_idx",
+                condition=models.Q(deleted_at__isnull=True),
+            ),
+            # Deleted chats whose messages are still to be purged
+            models.Index(
+                fields=["deleted_at"],
+                name="chats_purge_pending_idx",
+                condition=models.Q(deleted_at__isnull=False, purged_at__isnull=True),
+            ),
+        ]
 
     def __str__(self):
         return f"Chat {self.chat_name or self.chat_id} for {self.user.username}"
\ No newline at end of file
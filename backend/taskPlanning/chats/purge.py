@@ -0,0 +1,66 @@
+"""
+Purge of the messages of deleted chats.
+
+Deleting a chat only tombstones its row (see views.soft_delete_chat), which
+hides the chat and its history at once. Its messages are deleted afterwards
+in batches of bounded size, each a short statement of its own, so a chat with
+tens of thousands of messages neither loads them into memory nor holds locks
+on them for long. Once none are left the chat is marked `purged_at`; the
+tombstone itself is kept for incremental sync.
+
+Run by `manage.py purge_deleted_chats`, once or as a worker with --watch.
+"""
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import counters as chat_counters
+from .models import Chats, Messages
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def pending_chats(older_than=None, chat_ids=None):
+    """Deleted chats whose messages have not been purged, oldest deletion first."""
+    chats = Chats.objects.filter(deleted_at__isnull=False, purged_at__isnull=True)
+    if older_than is not None:
+        chats = chats.filter(deleted_at__lte=timezone.now() - older_than)
+    if chat_ids:
+        chats = chats.filter(chat_id__in=chat_ids)
+    return chats.order_by('deleted_at')
+
+
+def purge_batch(chat_id, batch_size=DEFAULT_BATCH_SIZE):
+    """Delete up to batch_size messages of a chat, and uncount them; returns the number deleted."""
+    ids = list(Messages.objects.filter(chat_id=chat_id).values_list('id', flat=True)[:batch_size])
+    if not ids:
+        return 0
+    batch = Messages.objects.filter(id__in=ids)
+    with transaction.atomic():
+        chat_counters.remove_messages([chat_id], batch)
+        # Nothing depends on messages, so this is one DELETE ... WHERE id IN (...)
+        deleted, _ = batch.delete()
+    return deleted
+
+
+def purge_chat(chat, batch_size=DEFAULT_BATCH_SIZE, pause=0, progress=None):
+    """
+    Delete the messages of a deleted chat batch by batch, sleeping `pause`
+    seconds in between, and mark it purged. `progress(chat, purged, total)`
+    is called after every batch, `total` being the chat's message count.
+    Returns the number of messages deleted.
+    """
+    total = chat.message_count
+    purged = 0
+    while True:
+        deleted = purge_batch(chat.chat_id, batch_size)
+        purged += deleted
+        if progress is not None and deleted:
+            progress(chat, purged, total)
+        if deleted < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    Chats.objects.filter(pk=chat.pk).update(purged_at=timezone.now())
+    return purged
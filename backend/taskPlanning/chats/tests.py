@@ -1,3 +1,393 @@
+from io import StringIO
+import json
+import uuid
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .counters import add_messages
+from .models import Chats, Messages
+
+
+def row_queries(queries, column):
+    """The captured queries that read `column` ('"table"."column"'), i.e. load rows rather than aggregates."""
+    return [q for q in queries.captured_queries if column in q["sql"]]
+
+
+def save_messages(user, chat_id, contents):
+    """Save messages as the views do: into the user's chat, counted on the chat."""
+    Chats.objects.get_or_create(chat_id=chat_id, defaults={"user": user})
+    saved = Messages.objects.bulk_create([
+        Messages(user=user, chat_id=chat_id, message={"role": "user" if i % 2 == 0 else "assistant", "content": content})
+        for i, content in enumerate(contents)
+    ])
+    add_messages([chat_id], Messages.objects.filter(pk__in=[message.pk for message in saved]))
+
+
+class GetChatHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.chat_id = uuid.uuid4()
+        save_messages(self.user, self.chat_id, [f"message {i}" for i in range(5)])
+        self.url = f"/api/chats/get-chat-history/{self.chat_id}/"
+
+    def test_history_is_fetched_with_one_query(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        history = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([m["message"]["content"] for m in history], [f"message {i}" for i in range(5)])
+        # Session and user lookups aside, message rows are read by one query
+        self.assertEqual(len(row_queries(queries, '"chats_messages"."message"')), 1)
+
+    def test_other_users_cannot_read_the_chat(self):
+        other = User.objects.create_user(username="other", password="password")
+        self.client.force_login(other)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {"error": "You don't have access to this chat"})
+
+    def test_unknown_chat(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(f"/api/chats/get-chat-history/{uuid.uuid4()}/")
+
+        self.assertEqual(response.json(), {"error": "Chat doesn't exist or has no messages"})
+
+
+class GetChatHistoryPageTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.chat_id = uuid.uuid4()
+        save_messages(self.user, self.chat_id, [str(i) for i in range(7)])
+        self.url = f"/api/chats/get-chat-history/{self.chat_id}/"
+        self.client.force_login(self.user)
+
+    def contents(self, page):
+        return [m["message"]["content"] for m in page["messages"]]
+
+    def test_pages_backwards_from_the_most_recent_messages(self):
+        page = self.client.get(self.url, {"limit": 3}).json()
+        self.assertEqual(self.contents(page), ["4", "5", "6"])
+        self.assertTrue(page["has_more"])
+
+        page = self.client.get(self.url, {"limit": 3, "before": page["previous_cursor"]}).json()
+        self.assertEqual(self.contents(page), ["1", "2", "3"])
+
+        page = self.client.get(self.url, {"limit": 3, "before": page["previous_cursor"]}).json()
+        self.assertEqual(self.contents(page), ["0"])
+        self.assertFalse(page["has_more"])
+
+    def test_pages_forwards_after_a_cursor(self):
+        first = self.client.get(self.url, {"limit": 7}).json()
+        page = self.client.get(self.url, {"limit": 2, "after": first["previous_cursor"]}).json()
+        self.assertEqual(self.contents(page), ["1", "2"])
+        self.assertTrue(page["has_more"])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {"before": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ChatListSyncTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.chats = [Chats.objects.create(user=self.user, chat_id=uuid.uuid4(), chat_name=f"chat {i}") for i in range(3)]
+        self.url = "/api/chats/get-chat-ids/"
+        self.client.force_login(self.user)
+
+    def test_pages_most_recent_first(self):
+        page = self.client.get(self.url, {"limit": 2}).json()
+        self.assertEqual([c["chat_name"] for c in page["chats"]], ["chat 2", "chat 1"])
+        self.assertTrue(page["has_more"])
+
+        page = self.client.get(self.url, {"limit": 2, "cursor": page["next_cursor"]}).json()
+        self.assertEqual([c["chat_name"] for c in page["chats"]], ["chat 0"])
+        self.assertFalse(page["has_more"])
+
+    def test_changes_since_watermark_include_renames_and_deletions(self):
+        initial = self.client.get(self.url, {"since": ""}).json()
+        self.assertEqual(len(initial["changes"]), 3)
+
+        unchanged = self.client.get(self.url, {"since": initial["watermark"]}).json()
+        self.assertEqual(unchanged["changes"], [])
+        self.assertEqual(unchanged["watermark"], initial["watermark"])
+
+        self.client.put(f"/api/chats/save-chat-name/{self.chats[0].chat_id}/", {"chat_name": "renamed"},
+                        content_type="application/json")
+        self.client.delete(f"/api/chats/delete-chat/{self.chats[1].chat_id}/")
+
+        changes = self.client.get(self.url, {"since": initial["watermark"]}).json()["changes"]
+        self.assertEqual(
+            [(c["chat_id"], c["chat_name"], c["deleted"]) for c in changes],
+            [(str(self.chats[0].chat_id), "renamed", False), (str(self.chats[1].chat_id), None, True)],
+        )
+        # Deleted chats are no longer listed
+        self.assertEqual(len(self.client.get(self.url).json()), 2)
+
+
+class DeleteChatTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.chat = Chats.objects.create(user=self.user, chat_id=uuid.uuid4(), chat_name="long chat")
+        save_messages(self.user, self.chat.chat_id, [str(i) for i in range(25)])
+        self.kept = Chats.objects.create(user=self.user, chat_id=uuid.uuid4(), chat_name="kept")
+        save_messages(self.user, self.kept.chat_id, ["kept"])
+        self.client.force_login(self.user)
+
+    def test_delete_hides_the_chat_and_leaves_messages_to_the_purge(self):
+        response = self.client.delete(f"/api/chats/delete-chat/{self.chat.chat_id}/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Messages.objects.filter(chat_id=self.chat.chat_id).count(), 25)
+        self.assertEqual(self.client.get("/api/chats/get-chat-ids/").json(),
+                         [{"chat_id": str(self.kept.chat_id), "chat_name": "kept"}])
+        url = f"/api/chats/get-chat-history/{self.chat.chat_id}/"
+        self.assertEqual(self.client.get(url).json(), {"error": "Chat doesn't exist or has no messages"})
+        self.assertEqual(self.client.get(url, {"limit": 10}).json(), {"error": "Chat doesn't exist or has no messages"})
+        # Deleting twice finds nothing
+        self.assertEqual(self.client.delete(f"/api/chats/delete-chat/{self.chat.chat_id}/").status_code, 404)
+
+    def test_messages_are_not_saved_into_a_deleted_chat(self):
+        self.client.delete(f"/api/chats/delete-chat/{self.chat.chat_id}/")
+        message = {"role": "user", "content": "too late"}
+
+        response = self.client.post("/api/chats/save-chat/", {
+            "chat_id": str(self.chat.chat_id), "message": message,
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+        # Nothing of the batch is saved, not even for the live chat
+        response = self.client.post("/api/chats/save-chat-batch/", {"messages": [
+            {"chat_id": str(self.kept.chat_id), "message": message},
+            {"chat_id": str(self.chat.chat_id), "message": message},
+        ]}, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+
+        self.assertEqual(Messages.objects.filter(chat_id=self.chat.chat_id).count(), 25)
+        self.assertEqual(Messages.objects.filter(chat_id=self.kept.chat_id).count(), 1)
+        self.assertEqual(Chats.objects.get(chat_id=self.chat.chat_id).message_count, 25)
+
+    def test_purge_deletes_messages_in_batches(self):
+        self.client.delete(f"/api/chats/delete-chat/{self.chat.chat_id}/")
+        out = StringIO()
+
+        call_command("purge_deleted_chats", batch_size=10, stdout=out)
+
+        self.assertFalse(Messages.objects.filter(chat_id=self.chat.chat_id).exists())
+        self.assertEqual(Messages.objects.filter(chat_id=self.kept.chat_id).count(), 1)
+        self.assertIn("10/25", out.getvalue())
+        self.assertIn("25/25", out.getvalue())
+        self.chat.refresh_from_db()
+        self.assertIsNotNone(self.chat.purged_at)
+
+        # Purged chats are not visited again
+        out = StringIO()
+        call_command("purge_deleted_chats", stdout=out)
+        self.assertIn("purged 0 messages of 0 deleted chats", out.getvalue())
+
+    def test_purge_waits_for_older_than(self):
+        self.client.delete(f"/api/chats/delete-chat/{self.chat.chat_id}/")
+
+        call_command("purge_deleted_chats", older_than=3600, stdout=StringIO())
+
+        self.assertEqual(Messages.objects.filter(chat_id=self.chat.chat_id).count(), 25)
+
+
+class ChatCountersTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.client.force_login(self.user)
+
+    def save(self, chat_id, content):
+        self.client.post("/api/chats/save-chat/", {
+            "chat_id": str(chat_id), "message": {"role": "user", "content": content},
+        }, content_type="application/json")
+
+    def assert_counters_match_messages(self, chat_id):
+        chat = Chats.objects.get(chat_id=chat_id)
+        messages = list(Messages.objects.filter(chat_id=chat_id))
+        self.assertEqual(chat.message_count, len(messages))
+        self.assertEqual(chat.total_bytes, sum(len(json.dumps(m.message).encode()) for m in messages))
+        if messages:
+            self.assertEqual(chat.last_message_at, max(m.time_sent for m in messages))
+
+    def test_saves_and_purges_keep_the_counters(self):
+        chat_id = uuid.uuid4()
+        self.save(chat_id, "first")
+        self.client.post("/api/chats/save-chat-batch/", {"messages": [
+            {"chat_id": str(chat_id), "message": {"role": "assistant", "content": f"reply {i}"}} for i in range(3)
+        ]}, content_type="application/json")
+        self.assert_counters_match_messages(chat_id)
+        self.assertEqual(Chats.objects.get(chat_id=chat_id).message_count, 4)
+
+        self.client.delete(f"/api/chats/delete-chat/{chat_id}/")
+        call_command("purge_deleted_chats", batch_size=3, stdout=StringIO())
+        self.assert_counters_match_messages(chat_id)
+        self.assertEqual(Chats.objects.get(chat_id=chat_id).total_bytes, 0)
+
+    def test_chats_are_paged_by_recent_activity(self):
+        chat_ids = [uuid.uuid4() for _ in range(3)]
+        for chat_id in chat_ids:
+            self.save(chat_id, "hello")
+        # The oldest chat becomes the most recently active
+        self.save(chat_ids[0], "again")
+
+        url = "/api/chats/get-chat-ids/"
+        page = self.client.get(url, {"sort": "activity", "limit": 2}).json()
+        self.assertEqual([c["chat_id"] for c in page["chats"]], [str(chat_ids[0]), str(chat_ids[2])])
+        self.assertEqual(page["chats"][0]["message_count"], 2)
+        page = self.client.get(url, {"sort": "activity", "limit": 2, "cursor": page["next_cursor"]}).json()
+        self.assertEqual([c["chat_id"] for c in page["chats"]], [str(chat_ids[1])])
+        self.assertFalse(page["has_more"])
+
+        self.assertEqual(self.client.get(url, {"sort": "size"}).status_code, 400)
+
+
+class ChatCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.chat = Chats.objects.create(user=self.user, chat_id=uuid.uuid4(), chat_name="cached")
+        save_messages(self.user, self.chat.chat_id, ["hi"])
+        self.url = f"/api/chats/get-chat-history/{self.chat.chat_id}/"
+        self.client.force_login(self.user)
+
+    def history(self):
+        response = self.client.get(self.url)
+        content = b"".join(response.streaming_content) if response.streaming else response.content
+        return [m["message"]["content"] for m in json.loads(content)]
+
+    def test_history_is_cached_until_the_chat_is_written(self):
+        self.assertEqual(self.history(), ["hi"])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.history(), ["hi"])
+        self.assertFalse(row_queries(queries, '"chats_messages"."message"'))
+
+        self.client.post("/api/chats/save-chat/", {
+            "chat_id": str(self.chat.chat_id),
+            "message": {"role": "assistant", "content": "hello"},
+            "message_id": str(uuid.uuid4()),
+        }, content_type="application/json")
+        self.assertEqual(self.history(), ["hi", "hello"])
+
+    def test_other_users_cannot_read_a_cached_history(self):
+        self.history()
+        other = User.objects.create_user(username="other", password="password")
+        self.client.force_login(other)
+
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+
+    def test_chat_list_is_invalidated_by_renames(self):
+        url = "/api/chats/get-chat-ids/"
+        self.assertEqual(self.client.get(url).json()[0]["chat_name"], "cached")
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(row_queries(queries, '"chats_chats"."chat_name"'))
+
+        self.client.put(f"/api/chats/save-chat-name/{self.chat.chat_id}/", {"chat_name": "renamed"},
+                        content_type="application/json")
+        self.assertEqual(self.client.get(url).json()[0]["chat_name"], "renamed")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.chat = Chats.objects.create(user=self.user, chat_id=uuid.uuid4(), chat_name="chat")
+        save_messages(self.user, self.chat.chat_id, ["hi"])
+        self.client.force_login(self.user)
+
+    def get(self, url, **headers):
+        response = self.client.get(url, **headers)
+        if response.streaming:
+            # Finish the stream so its server-side cursor is closed
+            b"".join(response.streaming_content)
+        return response
+
+    def assert_revalidates(self, url, change):
+        response = self.get(url)
+        etag = response.headers["ETag"]
+        self.assertIn("Last-Modified", response.headers)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(row_queries(queries, '"chats_messages"."message"'))
+        self.assertFalse(row_queries(queries, '"chats_chats"."chat_name"'))
+
+        change()
+        response = self.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+
+    def test_chat_history(self):
+        self.assert_revalidates(
+            f"/api/chats/get-chat-history/{self.chat.chat_id}/",
+            lambda: save_messages(self.user, self.chat.chat_id, ["hello"]),
+        )
+
+    def test_chat_list(self):
+        self.assert_revalidates(
+            "/api/chats/get-chat-ids/",
+            lambda: self.client.put(f"/api/chats/save-chat-name/{self.chat.chat_id}/", {"chat_name": "renamed"},
+                                    content_type="application/json"),
+        )
+
+
+class AsyncViewsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="owner", password="password")
+        self.async_client.force_login(self.user)
+        self.chat_id = str(uuid.uuid4())
+        self.url = "/api/chats-async/"
+
+    async def history(self):
+        response = await self.async_client.get(f"{self.url}get-chat-history/{self.chat_id}/")
+        if response.streaming:
+            content = b"".join([chunk async for chunk in response.streaming_content])
+        else:
+            content = response.content
+        return [m["message"]["content"] for m in json.loads(content)]
+
+    async def test_saves_and_streams_the_history(self):
+        response = await self.async_client.post(f"{self.url}save-chat-batch/", {"messages": [
+            {"chat_id": self.chat_id, "message": {"role": "user", "content": str(i)}, "chat_name": "chat"}
+            for i in range(3)
+        ]}, content_type="application/json")
+        self.assertEqual(response.json()["saved"], 3)
+        await self.async_client.post(f"{self.url}save-chat/", {
+            "chat_id": self.chat_id, "message": {"role": "assistant", "content": "3"},
+        }, content_type="application/json")
+
+        self.assertEqual(await self.history(), ["0", "1", "2", "3"])
+        # Served from the cache the second time
+        self.assertEqual(await self.history(), ["0", "1", "2", "3"])
+
+        page = (await self.async_client.get(f"{self.url}get-chat-history/{self.chat_id}/", {"limit": 2})).json()
+        self.assertEqual([m["message"]["content"] for m in page["messages"]], ["2", "3"])
+
+    async def test_chat_list_rename_and_delete(self):
+        await Chats.objects.acreate(user=self.user, chat_id=self.chat_id, chat_name="chat")
+
+        response = await self.async_client.put(f"{self.url}save-chat-name/{self.chat_id}/", {"chat_name": "renamed"},
+                                               content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        chats = (await self.async_client.get(f"{self.url}get-chat-ids/")).json()
+        self.assertEqual(chats, [{"chat_id": self.chat_id, "chat_name": "renamed"}])
+
+        response = await self.async_client.delete(f"{self.url}delete-chat/{self.chat_id}/")
+        self.assertEqual(response.status_code, 200)
+        changes = (await self.async_client.get(f"{self.url}get-chat-ids/", {"since": ""})).json()
+        self.assertEqual(changes["changes"], [])
 
-# Create your tests here.
+    async def test_requires_login(self):
+        await self.async_client.alogout()
+        response = await self.async_client.get(f"{self.url}get-chat-ids/")
+        self.assertEqual(response.status_code, 403)
@@ -3,9 +3,11 @@ from . import views
 
 urlpatterns = [
     path('save-chat/', views.save_chat_history, name='register'),
+    path('save-chat-batch/', views.save_chat_history_batch, name='save_chat_history_batch'),
     path('get-chat-history/<str:chat_id>/', views.get_chat_history, name='get_chat_history'),
     path('get-chat-ids/', views.get_chat_ids, name='get_chat_ids'),
     path('delete-chat/<str:chat_id>/', views.delete_chat, name='delete_chat'),
     path('validate-json/', views.validate_json, name='validate_json'),
     path('save-chat-name/<str:chat_id>/', views.set_chat_name, name='set_chat_name'),
+    path('cache-stats/', views.cache_stats, name='cache_stats'),
 ]
\ No newline at end of file
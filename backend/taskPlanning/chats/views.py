@@ -2,16 +2,78 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework.response import Response
 from rest_framework import status
 from django.middleware.csrf import get_token
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout
 from .models import Messages, Chats
+from . import cache as chat_cache
+from . import counters as chat_counters
 from django.db.models import Max
+from django.db import transaction
 from pydantic import BaseModel, ValidationError, ConfigDict
 from typing import Dict, List, Optional
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from datetime import datetime
+import base64
+import itertools
+import uuid
+
+# Upper bound for the number of messages saved by one batch request
+MAX_BATCH_MESSAGES = 1000
+# Rows fetched per round trip while streaming a chat history
+HISTORY_CHUNK_SIZE = 200
+# Page sizes of the paginated chat history
+DEFAULT_HISTORY_PAGE = 50
+MAX_HISTORY_PAGE = 500
+# Page sizes of the chat list and its incremental sync
+DEFAULT_CHATS_PAGE = 100
+MAX_CHATS_PAGE = 1000
+
+
+def encode_cursor(time_sent, pk):
+    """Opaque cursor for a message's position (time_sent, id) in its chat."""
+    return base64.urlsafe_b64encode(f"{time_sent.isoformat()}|{pk}".encode()).decode()
+
+
+def decode_cursor(cursor):
+    time_sent, pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+    return datetime.fromisoformat(time_sent), int(pk)
+
+
+def page_limit(request, default, maximum):
+    return min(max(int(request.GET.get("limit", default)), 1), maximum)
+
+
+def make_validators(parts, last_modified):
+    """ETag built from the parts of a resource's state, and its Last-Modified timestamp."""
+    return '"' + "-".join(str(part) for part in parts) + '"', int(last_modified.timestamp())
+
+
+def not_modified(request, validators):
+    """The 304 response if the client's copy is current, else None."""
+    if validators is None:
+        return None
+    response = get_conditional_response(request, etag=validators[0], last_modified=validators[1])
+    return with_validators(response, validators) if response is not None else None
+
+
+def with_validators(response, validators):
+    """
+    Add ETag / Last-Modified, and ask browsers to revalidate every time so
+    unchanged resources come back as a 304.
+    """
+    if validators is not None:
+        response.headers["ETag"] = validators[0]
+        response.headers["Last-Modified"] = http_date(validators[1])
+        patch_cache_control(response, private=True, no_cache=True)
+    return response
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -30,13 +92,33 @@ def save_chat_history(request):
         return JsonResponse({"error": "Chat ID and message are required"}, status=400)
 
     try:
-        # Create or get the chat entry
-        chat_obj, created = Chats.objects.get_or_create(
+        created = save_message(user, chat_id, chat_name, message, message_id)
+    except Chats.DoesNotExist:
+        return JsonResponse({"error": "Chat not found or you don't have access"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if created:
+        chat_cache.invalidate_chat_list(user.id)
+
+    return JsonResponse({"message": "Chat history saved successfully"})
+
+def save_message(user, chat_id, chat_name, message, message_id):
+    """
+    Save one message and count it on its chat; returns whether the chat was
+    created. Raises Chats.DoesNotExist if the chat was deleted.
+    """
+    with transaction.atomic():
+        # Create or get the chat entry, locked so it can't be deleted meanwhile
+        chat_obj, created = Chats.objects.select_for_update().get_or_create(
             chat_id=chat_id,
             user=user,
             defaults={'chat_name': chat_name}
         )
-        
+        if chat_obj.deleted_at is not None:
+            # Messages of a deleted chat would never be shown nor purged
+            raise Chats.DoesNotExist(f"Chat {chat_id} was deleted")
+
         # Create the message
         message_obj = Messages.objects.create(
             chat_id=chat_id,
@@ -44,85 +126,487 @@ def save_chat_history(request):
             user=user,
             message_id=message_id
         )
-        # message_obj.save()  # Not needed - create() already saves
+        chat_counters.add_messages([chat_id], Messages.objects.filter(pk=message_obj.pk))
+    return created
+
+@api_view(["POST"])
+@permission_classes([IsAuthenticated])
+def save_chat_history_batch(request):
+    """
+    Save many messages, for one or more chats, in a single transaction.
+    Expects {"messages": [{"chat_id", "message", "message_id", "chat_name"?}, ...]}.
+    Chats are created with one statement for all chat_ids and the messages
+    are inserted with one bulk insert.
+    """
+    user = get_user(request)
+    try:
+        chat_names, messages = parse_message_batch(user, request.data.get("messages"))
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        if not save_message_batch(user, chat_names, messages):
+            return JsonResponse({"error": "You don't have access to this chat"}, status=400)
+    except Chats.DoesNotExist:
+        return JsonResponse({"error": "Chat not found or you don't have access"}, status=404)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
-    return JsonResponse({"message": "Chat history saved successfully"})
+    chat_cache.invalidate_chat_list(user.id)
+    return JsonResponse({"message": "Chat history saved successfully", "saved": len(messages)})
+
+def parse_message_batch(user, items):
+    """
+    The chats ({chat_id: chat_name}) and unsaved Messages of a batch save.
+    Raises ValueError with the message for the client if the batch is invalid.
+    """
+    if not isinstance(items, list) or not items:
+        raise ValueError("A non-empty list of messages is required")
+    if len(items) > MAX_BATCH_MESSAGES:
+        raise ValueError(f"At most {MAX_BATCH_MESSAGES} messages can be saved at once")
+
+    chat_names = {}
+    messages = []
+    for item in items:
+        if not isinstance(item, dict) or not item.get("chat_id") or not item.get("message"):
+            raise ValueError("Chat ID and message are required for every message")
+        try:
+            chat_id = uuid.UUID(str(item["chat_id"]))
+            message_id = uuid.UUID(str(item["message_id"])) if item.get("message_id") else None
+        except ValueError:
+            raise ValueError("Chat and message IDs must be UUIDs")
+        chat_names.setdefault(chat_id, item.get("chat_name"))
+        messages.append(Messages(chat_id=chat_id, message=item["message"], user=user, message_id=message_id))
+    return chat_names, messages
+
+def save_message_batch(user, chat_names, messages):
+    """
+    Save a parsed batch; returns False (and saves nothing) if a chat belongs
+    to someone else. Raises Chats.DoesNotExist (saving nothing) if a chat was
+    deleted.
+    """
+    with transaction.atomic():
+        # Create the chats that don't exist yet, then make sure none belongs to
+        # someone else or was deleted (locked so none can be deleted meanwhile)
+        Chats.objects.bulk_create(
+            [Chats(chat_id=chat_id, user=user, chat_name=name) for chat_id, name in chat_names.items()],
+            ignore_conflicts=True,
+        )
+        owners = set(
+            Chats.objects.select_for_update()
+            .filter(chat_id__in=chat_names)
+            .exclude(user=user, deleted_at__isnull=True)
+            .values_list('user_id', flat=True)
+        )
+        if owners - {user.id}:
+            transaction.set_rollback(True)
+            return False
+        if owners:
+            raise Chats.DoesNotExist("A chat of the batch was deleted")
+
+        Messages.objects.bulk_create(messages)
+        chat_counters.add_messages(chat_names, Messages.objects.filter(pk__in=[message.pk for message in messages]))
+    return True
     
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_chat_history(request, chat_id):
     """
     Retrieve all chat history from the database for a specific id.
+    Ownership is checked on the chat row, then the messages are fetched in
+    order by one indexed query and streamed to the client as they are read. With any of the `limit`, `before` or `after` parameters one page is
+    returned instead (see get_chat_history_page).
+    Full histories are served from the cache while the chat's history_version
+    is unchanged (see chats/cache.py). The ETag / Last-Modified validators come
+    from the chat row's history_version and message counters, read by the
+    ownership check, so a conditional request for an unchanged chat gets a
+    304 without reading any messages.
     """
     user = get_user(request)
 
-    if not Messages.objects.filter(chat_id=chat_id).exists():
+    if any(key in request.GET for key in ("limit", "before", "after")):
+        return get_chat_history_page(request, user, chat_id)
+
+    try:
+        chat = chat_history_state(chat_id).first()
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    if chat is None or not chat[2]:
         return JsonResponse({"error": "Chat doesn't exist or has no messages"})
 
     # Check if user has access to this chat
-    chat_messages = Messages.objects.filter(chat_id=chat_id)
-    if chat_messages.exists() and chat_messages.first().user != user:
+    if chat[0] != user.id:
         return JsonResponse({"error": "You don't have access to this chat"}, status=400)
 
+    validators = history_validators(user, chat)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+    cached = chat_cache.get_chat_history(user.id, chat_id, chat[1])
+    if cached is not None:
+        return with_validators(HttpResponse(cached, content_type="application/json"), validators)
+
     try:
-        chat_history = Messages.objects.filter(chat_id=chat_id).order_by('time_sent')
-        chat_list = []
-        for chat in chat_history:
-            chat_list.append({
-                "message": chat.message,
-                "message_id": str(chat.message_id),
-                "time_sent": chat.time_sent
-            })
-        return JsonResponse(chat_list, safe=False)
+        # Server-side cursor; rows are read in chunks while the response is written
+        rows = chat_history_rows(chat_id).iterator(chunk_size=HISTORY_CHUNK_SIZE)
+        first = next(rows, None)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+
+    if first is None:
+        return JsonResponse({"error": "Chat doesn't exist or has no messages"})
+
+    body = chat_cache.cache_chat_history(stream_chat_history(first, rows), user.id, chat_id, chat[1])
+    return with_validators(StreamingHttpResponse(body, content_type="application/json"), validators)
+
+def chat_history_state(chat_id):
+    """
+    Query for (owner, history_version, message_count, last_message_at) of a
+    chat, which has no row if the chat doesn't exist or was deleted.
+    """
+    return (
+        Chats.objects.filter(chat_id=chat_id, deleted_at__isnull=True)
+        .values_list('user_id', 'history_version', 'message_count', 'last_message_at')
+    )
+
+def history_validators(user, chat):
+    owner, version, message_count, last_message_at = chat
+    return make_validators((user.id, version, message_count), last_message_at)
+
+def live_messages(chat_id):
+    """
+    The messages of a chat unless it was deleted: they stay in the table
+    until they are purged (see chats/purge.py).
+    """
+    return Messages.objects.filter(chat_id=chat_id, chat__deleted_at__isnull=True)
+
+def chat_history_rows(chat_id, named=False):
+    # named=True for aiterator(): plain values_list() runs its query when the
+    # iterator is created, which is not allowed in an async context
+    return (
+        live_messages(chat_id)
+        .order_by('time_sent', 'id')
+        .values_list('message', 'message_id', 'time_sent', named=named)
+    )
+
+def encode_history_row(encode, row):
+    message, message_id, time_sent = row
+    return encode({
+        "message": message,
+        "message_id": str(message_id),
+        "time_sent": time_sent
+    })
+
+def stream_chat_history(first, rows):
+    """
+    Write the history as one JSON array, a chunk of rows at a time, so memory
+    stays flat however long the chat is.
+    """
+    encode = DjangoJSONEncoder().encode
+    parts = ["["]
+    for i, row in enumerate(itertools.chain([first], rows)):
+        if i:
+            parts.append(", ")
+        parts.append(encode_history_row(encode, row))
+        if len(parts) >= HISTORY_CHUNK_SIZE:
+            yield "".join(parts)
+            parts = []
+    parts.append("]")
+    yield "".join(parts)
+
+def get_chat_history_page(request, user, chat_id):
+    """
+    One page of a chat's history, using keyset pagination on (time_sent, id)
+    so every page costs the same however long the chat is.
+    Without a cursor the most recent `limit` messages are returned; `before`
+    pages towards older messages and `after` towards newer ones. Messages are
+    always in chronological order. `has_more` tells whether there are more
+    messages in the direction of travel; `previous_cursor` / `next_cursor`
+    are the cursors of the first / last message of the page.
+    """
+    try:
+        params = history_page_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        rows = list(history_page_rows(chat_id, *params))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return history_page_response(rows, user, *params)
+
+def history_page_params(request):
+    """(limit, before, after) of a history page; raises ValueError with the message for the client."""
+    try:
+        limit = page_limit(request, DEFAULT_HISTORY_PAGE, MAX_HISTORY_PAGE)
+        before = decode_cursor(request.GET["before"]) if request.GET.get("before") else None
+        after = decode_cursor(request.GET["after"]) if request.GET.get("after") else None
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid limit or cursor")
+    if before and after:
+        raise ValueError("Use either before or after, not both")
+    return limit, before, after
+
+def history_page_rows(chat_id, limit, before, after):
+    messages = live_messages(chat_id)
+    if after:
+        # The redundant time_sent bound lets the (chat_id, time_sent) index limit the scan
+        messages = messages.filter(
+            Q(time_sent__gt=after[0]) | Q(time_sent=after[0], id__gt=after[1]),
+            time_sent__gte=after[0],
+        ).order_by('time_sent', 'id')
+    else:
+        if before:
+            messages = messages.filter(
+                Q(time_sent__lt=before[0]) | Q(time_sent=before[0], id__lt=before[1]),
+                time_sent__lte=before[0],
+            )
+        messages = messages.order_by('-time_sent', '-id')
+    # One extra row tells whether there is another page
+    return messages.values_list('id', 'user_id', 'message', 'message_id', 'time_sent')[:limit + 1]
+
+def history_page_response(rows, user, limit, before, after):
+    if rows and rows[0][1] != user.id:
+        return JsonResponse({"error": "You don't have access to this chat"}, status=400)
+    if not rows and not (before or after):
+        return JsonResponse({"error": "Chat doesn't exist or has no messages"})
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if not after:
+        rows.reverse()
+
+    return JsonResponse({
+        "messages": [
+            {"message": message, "message_id": str(message_id), "time_sent": time_sent}
+            for _, _, message, message_id, time_sent in rows
+        ],
+        "has_more": has_more,
+        "previous_cursor": encode_cursor(rows[0][4], rows[0][0]) if rows else None,
+        "next_cursor": encode_cursor(rows[-1][4], rows[-1][0]) if rows else None,
+    })
     
 @api_view(["GET"])
 @permission_classes([IsAuthenticated])
 def get_chat_ids(request):
     """
     Retrieve all chats for a user with names, ordered by creation time (most recent first).
+    With `limit` / `cursor` / `sort` one page is returned instead, and with `since`
+    only the changes after a watermark (see get_chat_changes).
+    The full list is served from the cache until one of the user's chats
+    changes, and validated by the user's latest chat change and chat count
+    (a 304 for conditional requests when nothing changed).
     """
     user = get_user(request)
+    if "since" in request.GET:
+        return get_chat_changes(request, user)
+    if any(key in request.GET for key in ("limit", "cursor", "sort")):
+        return get_chat_ids_page(request, user)
+
     try:
-        chats = Chats.objects.filter(user=user).order_by('-created_at')
-        chat_list = []
-        for chat in chats:
-            chat_list.append({
-                "chat_id": str(chat.chat_id),
-                "chat_name": chat.chat_name,
-            })
-        return JsonResponse(chat_list, safe=False)
+        state = chat_list_state(user).aggregate(chat_count=Count('*'), last_change=Max('updated_at'))
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+
+    validators = chat_list_validators(user, state)
+    response = not_modified(request, validators)
+    if response is not None:
+        return response
+
+    cached, version = chat_cache.get_chat_list(user.id)
+    if cached is not None:
+        return with_validators(HttpResponse(cached, content_type="application/json"), validators)
+
+    try:
+        response = chat_list_response(list(chat_list_rows(user)))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+    chat_cache.set_chat_list(user.id, version, response.content.decode())
+    return with_validators(response, validators)
+
+def chat_list_state(user):
+    # Aggregated for the validators: renames and deletions move updated_at; purged chats change the count
+    return Chats.objects.filter(user=user)
+
+def chat_list_validators(user, state):
+    if not state["chat_count"]:
+        return None
+    return make_validators((user.id, state["chat_count"], state["last_change"].timestamp()), state["last_change"])
+
+def chat_list_rows(user):
+    return (
+        Chats.objects.filter(user=user, deleted_at__isnull=True)
+        .order_by('-created_at')
+        .values_list('chat_id', 'chat_name')
+    )
+
+def chat_list_response(rows):
+    chat_list = []
+    for chat_id, chat_name in rows:
+        chat_list.append({
+            "chat_id": str(chat_id),
+            "chat_name": chat_name,
+        })
+    return JsonResponse(chat_list, safe=False)
+
+def get_chat_ids_page(request, user):
+    """
+    One page of the chat list with the chats' message counters, using keyset
+    pagination. By default the most recently created chats come first
+    (keyset on (created_at, id)); with `sort=activity` the chats with the
+    most recent messages (keyset on (last_message_at, id), one scan of the
+    activity index). Pass `next_cursor` as `cursor` to get the next page.
+    """
+    try:
+        params = chat_ids_page_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        rows = list(chat_ids_page_rows(user, *params))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return chat_ids_page_response(rows, *params)
+
+# Sort orders of the chat list pages and the field they are keyed on
+CHATS_PAGE_SORTS = {"created": "created_at", "activity": "last_message_at"}
+
+def chat_ids_page_params(request):
+    """(limit, cursor, sort field) of a chat list page; raises ValueError with the message for the client."""
+    sort = request.GET.get("sort") or "created"
+    if sort not in CHATS_PAGE_SORTS:
+        raise ValueError(f"sort must be one of {', '.join(CHATS_PAGE_SORTS)}")
+    try:
+        limit = page_limit(request, DEFAULT_CHATS_PAGE, MAX_CHATS_PAGE)
+        cursor = decode_cursor(request.GET["cursor"]) if request.GET.get("cursor") else None
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid limit or cursor")
+    return limit, cursor, CHATS_PAGE_SORTS[sort]
+
+def chat_ids_page_rows(user, limit, cursor, field):
+    chats = Chats.objects.filter(user=user, deleted_at__isnull=True)
+    if cursor:
+        chats = chats.filter(
+            Q(**{f"{field}__lt": cursor[0]}) | Q(**{field: cursor[0], "id__lt": cursor[1]}),
+            **{f"{field}__lte": cursor[0]},
+        )
+    return (
+        chats.order_by(f'-{field}', '-id')
+        .values_list('id', 'chat_id', 'chat_name', field, 'message_count', 'last_message_at')[:limit + 1]
+    )
+
+def chat_ids_page_response(rows, limit, cursor, field):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return JsonResponse({
+        "chats": [
+            {
+                "chat_id": str(chat_id),
+                "chat_name": chat_name,
+                "message_count": message_count,
+                "last_message_at": last_message_at,
+            }
+            for _, chat_id, chat_name, _, message_count, last_message_at in rows
+        ],
+        "has_more": has_more,
+        "next_cursor": encode_cursor(rows[-1][3], rows[-1][0]) if has_more else None,
+    })
+
+def get_chat_changes(request, user):
+    """
+    Incremental sync of the chat list: the chats created, renamed or deleted
+    after the `since` watermark, oldest change first. An empty `since` starts
+    from scratch and returns every live chat. Deleted chats are returned as
+    tombstones ("deleted": true). Pass the returned `watermark` as the next
+    `since`; repeat while `has_more` is true.
+    """
+    try:
+        params = chat_changes_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        rows = list(chat_changes_rows(user, *params))
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+    return chat_changes_response(rows, request.GET["since"], *params)
+
+def chat_changes_params(request):
+    """(limit, since) of a chat list sync; raises ValueError with the message for the client."""
+    try:
+        limit = page_limit(request, MAX_CHATS_PAGE, MAX_CHATS_PAGE)
+        since = decode_cursor(request.GET["since"]) if request.GET["since"] else None
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid limit or watermark")
+    return limit, since
+
+def chat_changes_rows(user, limit, since):
+    chats = Chats.objects.filter(user=user)
+    if since:
+        chats = chats.filter(
+            Q(updated_at__gt=since[0]) | Q(updated_at=since[0], id__gt=since[1]),
+            updated_at__gte=since[0],
+        )
+    else:
+        # A fresh client has nothing to delete
+        chats = chats.filter(deleted_at__isnull=True)
+    return (
+        chats.order_by('updated_at', 'id')
+        .values_list('id', 'chat_id', 'chat_name', 'created_at', 'updated_at', 'deleted_at')[:limit + 1]
+    )
+
+def chat_changes_response(rows, since_param, limit, since):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    watermark = encode_cursor(rows[-1][4], rows[-1][0]) if rows else since_param
+    return JsonResponse({
+        "changes": [
+            {
+                "chat_id": str(chat_id),
+                "chat_name": chat_name,
+                "created_at": created_at,
+                "updated_at": updated_at,
+                "deleted": deleted_at is not None,
+            }
+            for _, chat_id, chat_name, created_at, updated_at, deleted_at in rows
+        ],
+        "watermark": watermark,
+        "has_more": has_more,
+    })
     
 @api_view(["DELETE"])
 @permission_classes([IsAuthenticated])
 def delete_chat(request, chat_id):
     """
     Delete a specific chat by ID.
+    The chat is soft-deleted, so it leaves the chat list and its history at
+    once however long it is; its messages are purged in batches afterwards
+    by `manage.py purge_deleted_chats`.
     """
     user = get_user(request)
 
     try:
-        # Delete from both Messages and Chats tables
-        messages = Messages.objects.filter(chat_id=chat_id, user=user)
-        chat = Chats.objects.filter(chat_id=chat_id, user=user)
-        
-        if not messages.exists() and not chat.exists():
+        if not soft_delete_chat(user, chat_id):
             return JsonResponse({"error": "Chat doesn't exist or you don't have access"}, status=404)
-
-        # Delete messages and chat metadata
-        messages.delete()
-        chat.delete()
+        chat_cache.invalidate_chat_list(user.id)
         
         return JsonResponse({"message": "Chat deleted successfully"}, status=200)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
+
+def soft_delete_chat(user, chat_id):
+    """Tombstone the chat, leaving its messages to the purge; returns False if there was nothing to delete."""
+    now = timezone.now()
+    # update() skips auto_now, so the watermark is set explicitly
+    deleted = Chats.objects.filter(chat_id=chat_id, user=user, deleted_at__isnull=True).update(
+        chat_name=None, deleted_at=now, updated_at=now, history_version=F('history_version') + 1
+    )
+    return bool(deleted)
     
 
+
 class JSONSchema(BaseModel):
     """
     Pydantic model for validating JSON schema.
@@ -179,11 +663,20 @@ def set_chat_name(request, chat_id):
         return JsonResponse({"error": "Chat name is required"}, status=400)
 
     try:
-        chat = Chats.objects.get(chat_id=chat_id, user=user)
+        chat = Chats.objects.get(chat_id=chat_id, user=user, deleted_at__isnull=True)
         chat.chat_name = chat_name
         chat.save()
+        chat_cache.invalidate_chat_list(user.id)
         return JsonResponse({"message": "Chat name updated successfully"}, status=200)
     except Chats.DoesNotExist:
         return JsonResponse({"error": "Chat not found or you don't have access"}, status=404)
     except Exception as e:
-        return JsonResponse({"error": str(e)}, status=500)
\ No newline at end of file
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def cache_stats(request):
+    """
+    Hit/miss counters of the chat list and history cache in this process.
+    """
+    return JsonResponse(chat_cache.stats())
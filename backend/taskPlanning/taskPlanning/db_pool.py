@@ -0,0 +1,59 @@
+"""
+Database connection statistics of this process, for comparing the DB_POOL
+modes (see settings.py).
+
+`connections_opened` counts the new database connections, whatever the mode
+(Django's connection_created signal also fires for connections taken from the
+pool, so in the pool mode the pool's count is used). In the pool mode the
+psycopg pool's own counters are included too: checkouts
+(`requests_num`), checkouts that had to wait for a free connection
+(`requests_queued`) and the total time they waited (`requests_wait_ms`),
+checkouts that timed out (`requests_errors`), connections found broken by the
+health check (`connections_lost`) and so on.
+"""
+import threading
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import JsonResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+
+_lock = threading.Lock()
+_connections_opened = 0
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+    global _connections_opened
+    with _lock:
+        _connections_opened += 1
+
+
+def stats(alias='default'):
+    connection = connections[alias]
+    pool = getattr(connection, 'pool', None)
+    result = {
+        "mode": settings.DB_POOL,
+        "transaction_pooler": bool(connection.settings_dict.get('DISABLE_SERVER_SIDE_CURSORS')),
+        "connections_opened": _connections_opened,
+        "pool": None,
+    }
+    if pool is not None:
+        pool_stats = pool.get_stats()
+        queued = pool_stats.get("requests_queued", 0)
+        pool_stats["average_wait_ms"] = pool_stats.get("requests_wait_ms", 0) / queued if queued else 0
+        result["connections_opened"] = pool_stats.get("connections_num", 0)
+        result["pool"] = pool_stats
+    return result
+
+
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def pool_stats(request):
+    """
+    Connection and pool statistics of the serving process.
+    """
+    return JsonResponse(stats())
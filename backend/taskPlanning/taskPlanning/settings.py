@@ -14,6 +14,7 @@ from pathlib import Path
 import socket
 import os
 import environ
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -133,6 +134,78 @@ DATABASES = {
     }
 }
 
+# Connection handling (see taskPlanning/db_pool.py for the stats endpoint):
+# DB_POOL is "none" (a new connection per request), "persistent" (each worker
+# thread keeps its connection for DB_CONN_MAX_AGE seconds) or "pool" (a
+# psycopg 3 pool shared by the threads of a process; needs psycopg[pool]).
+# Connections are health-checked before use in the persistent and pool modes:
+# with a pool, Django passes CONN_HEALTH_CHECKS on as the pool's check callback
+# (ConnectionPool.check_connection, run when a connection is handed out).
+# DB_TRANSACTION_POOLER=1 makes any mode work behind a transaction-mode pooler
+# such as PgBouncer, which can not keep server-side cursors between queries.
+
+DB_POOL = env('DB_POOL', default='none')
+
+if DB_POOL == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = env.int('DB_CONN_MAX_AGE', default=60)
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+elif DB_POOL == 'pool':
+    # Not 'check' in the pool options: Django sets it from this already
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': env.int('DB_POOL_MIN_SIZE', default=2),
+            'max_size': env.int('DB_POOL_MAX_SIZE', default=10),
+            # Seconds a request waits for a free connection before failing
+            'timeout': env.float('DB_POOL_TIMEOUT', default=10),
+            # Idle connections above min_size are closed after this many seconds
+            'max_idle': env.float('DB_POOL_MAX_IDLE', default=600),
+        },
+    }
+elif DB_POOL != 'none':
+    raise ImproperlyConfigured(f"DB_POOL must be none, persistent or pool, not {DB_POOL!r}")
+
+if env.bool('DB_TRANSACTION_POOLER', default=False):
+    # Streamed histories are then fetched in one go instead of through a cursor
+    DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = True
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Read-through cache of chat lists and histories (see chats/cache.py).
+# CACHE_BACKEND is "locmem" (per process), "file" (per node, CACHE_LOCATION is
+# a directory), "redis" (shared, CACHE_LOCATION is a redis:// URL and needs the
+# redis package) or the dotted path of any Django cache backend.
+# Entries are invalidated in the cache of the process that made the change
+# only, so deployments with several workers (or nodes) need a shared backend;
+# with locmem another worker can serve stale entries until they time out.
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+CACHE_BACKEND = env('CACHE_BACKEND', default='locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS.get(CACHE_BACKEND, CACHE_BACKEND),
+        'LOCATION': env('CACHE_LOCATION', default='') or (str(BASE_DIR / 'cache') if CACHE_BACKEND == 'file' else 'chats'),
+        'TIMEOUT': env.int('CACHE_TIMEOUT', default=300),
+        'KEY_PREFIX': 'taskplanning',
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': env.int('CACHE_MAX_ENTRIES', default=5000)}
+
+# Seconds a user's profile (role, userid) stays cached (see users/managers.py).
+# Kept short by default with the per-process locmem cache, where a role change
+# is only seen by other workers once their copy expires.
+PROFILE_CACHE_TIMEOUT = env.int('PROFILE_CACHE_TIMEOUT', default=30 if CACHE_BACKEND == 'locmem' else 300)
+
+# Histories longer than this (in characters of JSON) are streamed but not cached
+CHAT_HISTORY_CACHE_MAX_BYTES = env.int('CHAT_HISTORY_CACHE_MAX_BYTES', default=1024 * 1024)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -0,0 +1,31 @@
+import importlib
+import os
+from unittest import mock
+
+from django.db.backends.postgresql.base import DatabaseWrapper
+from django.test import SimpleTestCase
+from psycopg_pool import ConnectionPool
+
+from taskPlanning import settings
+
+
+class DbPoolSettingsTests(SimpleTestCase):
+    def load_settings(self, **environ):
+        with mock.patch.dict(os.environ, environ):
+            loaded = importlib.reload(settings)
+        self.addCleanup(importlib.reload, settings)
+        return loaded
+
+    def test_pool_checks_connections_on_checkout(self):
+        database = self.load_settings(DB_POOL='pool').DATABASES['default']
+        wrapper = DatabaseWrapper({'CONN_HEALTH_CHECKS': False, 'TIME_ZONE': None, **database}, 'pool_check')
+        # Built but not opened: no connection is made
+        pool = wrapper.pool
+        self.addCleanup(wrapper.close_pool)
+        self.assertEqual(pool._check, ConnectionPool.check_connection)
+        self.assertEqual(pool.max_size, database['OPTIONS']['pool']['max_size'])
+
+    def test_persistent_connections_are_health_checked(self):
+        database = self.load_settings(DB_POOL='persistent').DATABASES['default']
+        self.assertTrue(database['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('OPTIONS', database)
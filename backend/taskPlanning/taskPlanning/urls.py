@@ -17,8 +17,13 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import db_pool
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/chats/', include('chats.urls')),
+    # Async versions of the chats endpoints, for ASGI deployments
+    path('api/chats-async/', include('chats.async_urls')),
     path('api/users/', include('users.urls')),
+    path('api/db-pool-stats/', db_pool.pool_stats, name='db_pool_stats'),
 ]
@@ -1,11 +1,31 @@
 # managers.py
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate, login, logout
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from rest_framework import status
 from rest_framework.response import Response
 from .serializers import UserSerializer
 from .models import Profile
 
+# Rows fetched per round trip while streaming the user directory
+DIRECTORY_CHUNK_SIZE = 500
+
+
+def profile_cache_key(user_id):
+    return f"users:profile:{user_id}"
+
+
+def directory_entry(user):
+    profile = getattr(user, "profile", None)
+    return {
+        "name": f"{user.first_name} {user.last_name}",
+        "username": user.username,
+        "role": profile.role if profile else None,
+    }
+
+
 class UserManager:
     @staticmethod
     def register_user(data):
@@ -26,40 +46,104 @@ class UserManager:
         return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
     @staticmethod
-    def get_user_profile(user):
+    def get_cached_profile(user):
+        '''Returns {"userid", "role"} of the user's profile, or None if it has none'''
+        key = profile_cache_key(user.id)
         try:
-            profile = user.profile
-            if user.is_authenticated:
-                return Response({
-                    "name": f"{user.first_name} {user.last_name}",
-                    "username": user.username,
-                    "userid": profile.userid,
-                })
-            return Response({"name": "", "username": "", "id": ""})
-        except Profile.DoesNotExist:
+            profile = cache.get(key)
+        except Exception as e:
+            print(f"Cache get failed for {key}: {e}")
+            profile = None
+        if profile is None:
+            profile = Profile.objects.filter(user_id=user.id).values("userid", "role").first()
+            if profile is None:
+                return None
+            try:
+                cache.set(key, profile, settings.PROFILE_CACHE_TIMEOUT)
+            except Exception as e:
+                print(f"Cache set failed for {key}: {e}")
+        return profile
+
+    @staticmethod
+    def invalidate_profile(user_id):
+        try:
+            cache.delete(profile_cache_key(user_id))
+        except Exception as e:
+            print(f"Cache delete failed for the profile of user {user_id}: {e}")
+
+    @staticmethod
+    def get_user_profile(user):
+        profile = UserManager.get_cached_profile(user)
+        if profile is None:
             return Response({"error": "Profile not found"}, status=404)
+        if user.is_authenticated:
+            return Response({
+                "name": f"{user.first_name} {user.last_name}",
+                "username": user.username,
+                "userid": profile["userid"],
+            })
+        return Response({"name": "", "username": "", "id": ""})
 
     @staticmethod
     def update_user_profile(user, request):
         serializer = UserSerializer(user, data=request.data, partial=True)
         if serializer.is_valid():
+            # Saving the profile invalidates its cached copy (see signals.py)
             serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=400)
 
     @staticmethod
     def fetch_all_users():
-        users = User.objects.all().order_by('id')
-        user_data = [
-            {
-                "name": f"{user.first_name} {user.last_name}",
-                "username": user.username,
-                # "userid": user.profile.userid,
-                "role": user.profile.role,
-            }
-            for user in users
-        ]
+        # Profiles are joined in, not fetched one query per user
+        users = User.objects.select_related('profile').order_by('id')
+        user_data = [directory_entry(user) for user in users]
         return user_data
+
+    @staticmethod
+    def directory_users(role=None, username=None):
+        '''
+        The users ordered by id with their profiles joined in, optionally only
+        those with `role` and / or whose username starts with `username`
+        (served by the username index's pattern-matching variant).
+        '''
+        users = User.objects.select_related('profile').only(
+            'id', 'username', 'first_name', 'last_name', 'profile__role'
+        )
+        if role:
+            users = users.filter(profile__role=role)
+        if username:
+            users = users.filter(username__startswith=username)
+        return users.order_by('id')
+
+    @staticmethod
+    def directory_page(users, limit, cursor=None):
+        '''One page of the directory after the user id `cursor` (keyset pagination)'''
+        if cursor is not None:
+            users = users.filter(id__gt=cursor)
+        rows = list(users[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "users": [directory_entry(user) for user in rows],
+            "has_more": has_more,
+            "next_cursor": str(rows[-1].id) if has_more else None,
+        }
+
+    @staticmethod
+    def stream_directory(users):
+        '''The whole directory as one JSON array, read and written a chunk of rows at a time'''
+        encode = DjangoJSONEncoder().encode
+        parts = ["["]
+        for i, user in enumerate(users.iterator(chunk_size=DIRECTORY_CHUNK_SIZE)):
+            if i:
+                parts.append(", ")
+            parts.append(encode(directory_entry(user)))
+            if len(parts) >= DIRECTORY_CHUNK_SIZE:
+                yield "".join(parts)
+                parts = []
+        parts.append("]")
+        yield "".join(parts)
     
     @staticmethod
     def delete_user(user_name):
@@ -74,7 +158,7 @@ class UserManager:
     @staticmethod
     def get_role(user):
         '''Returns the role of the user'''
-        try:
-            return Response({"role": user.profile.role}, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        profile = UserManager.get_cached_profile(user)
+        if profile is None:
+            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response({"role": profile["role"]}, status=status.HTTP_200_OK)
\ No newline at end of file
@@ -12,6 +12,12 @@ class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     userid = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default='ADMIN')
+
+    class Meta:
+        indexes = [
+            # User directory filtered by role, in user order
+            models.Index(fields=["role", "user"], name="profile_role_user_idx"),
+        ]
     
     def __str__(self):
         return f"{self.user.username}'s profile"
\ No newline at end of file
@@ -0,0 +1,15 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .managers import UserManager
+from .models import Profile
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    # Whatever changed the profile (views, admin, shell, a cascade); after the
+    # commit, so a concurrent read cannot cache the old row again
+    user_id = instance.user_id
+    transaction.on_commit(lambda: UserManager.invalidate_profile(user_id))
@@ -1,3 +1,77 @@
+import json
+
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from .managers import UserManager
+from .models import Profile
+
+
+class UserDirectoryTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            user = User.objects.create_user(username=f"user{i}", password="password", first_name=f"First{i}")
+            Profile.objects.create(user=user, role="ADMIN" if i == 0 else "PEASANT")
+        self.user = User.objects.get(username="user0")
+        self.client.force_login(self.user)
+
+    def test_streams_every_user_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/users/directory/")
+            users = json.loads(b"".join(response.streaming_content))
+
+        self.assertEqual([u["username"] for u in users], [f"user{i}" for i in range(5)])
+        self.assertEqual(users[0]["role"], "ADMIN")
+        self.assertEqual(len([q for q in queries.captured_queries if "users_profile" in q["sql"]]), 1)
+
+    def test_pages_and_filters(self):
+        page = self.client.get("/api/users/directory/", {"role": "PEASANT", "limit": 3}).json()
+        self.assertEqual([u["username"] for u in page["users"]], ["user1", "user2", "user3"])
+        self.assertTrue(page["has_more"])
+
+        page = self.client.get("/api/users/directory/",
+                               {"role": "PEASANT", "limit": 3, "cursor": page["next_cursor"]}).json()
+        self.assertEqual([u["username"] for u in page["users"]], ["user4"])
+        self.assertFalse(page["has_more"])
+
+        page = self.client.get("/api/users/directory/", {"username": "user3", "limit": 10}).json()
+        self.assertEqual([u["username"] for u in page["users"]], ["user3"])
+
+    def test_fetch_users_does_not_query_profiles_per_user(self):
+        with CaptureQueriesContext(connection) as queries:
+            users = self.client.get("/api/users/fetch-users/").json()
+
+        self.assertEqual(len(users), 5)
+        self.assertEqual(len([q for q in queries.captured_queries if "users_profile" in q["sql"]]), 1)
+
+    def test_role_is_served_from_the_cached_profile(self):
+        self.assertEqual(self.client.get("/api/users/get-role/").json(), {"role": "ADMIN"})
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get("/api/users/get-role/").json(), {"role": "ADMIN"})
+        self.assertFalse([q for q in queries.captured_queries if "users_profile" in q["sql"]])
+
+    def test_role_change_outside_the_views_invalidates_the_cached_profile(self):
+        self.assertEqual(self.client.get("/api/users/get-role/").json(), {"role": "ADMIN"})
+        # As the admin site does it
+        with self.captureOnCommitCallbacks(execute=True):
+            profile = Profile.objects.get(user=self.user)
+            profile.role = "SAHELI"
+            profile.save()
+        self.assertEqual(self.client.get("/api/users/get-role/").json(), {"role": "SAHELI"})
+
+    def test_deleted_profile_is_not_served_from_the_cache(self):
+        self.client.get("/api/users/get-role/")
+        with self.captureOnCommitCallbacks(execute=True):
+            Profile.objects.filter(user=self.user).delete()
+        self.assertIsNone(UserManager.get_cached_profile(self.user))
+
 
-# Create your tests here.
+class SessionCheckTests(TestCase):
+    def test_identifies_the_user_to_the_routing_backend(self):
+        user = User.objects.create_user(username="owner", password="password")
+        self.assertEqual(self.client.get("/api/users/session-check/").status_code, 401)
+        self.client.force_login(user)
+        response = self.client.get("/api/users/session-check/")
+        self.assertEqual(response.json(), {"authenticated": True, "username": "owner", "user_id": user.id})
@@ -9,6 +9,7 @@ urlpatterns = [
     path('logout/', views.user_logout, name='logout'),
     path('profile/', views.profile, name='profile'),
     path('fetch-users/', views.fetch_users, name='fetch_users'),
+    path('directory/', views.user_directory, name='user_directory'),
     path('update/<str:username>/', views.update_user, name='update_user'),
     path('delete/<str:user_name>', views.delete_user, name='delete_user'),
     path('get-role/', views.get_role, name='get_role'),
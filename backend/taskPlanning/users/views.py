@@ -2,14 +2,19 @@
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from django.contrib.auth import get_user
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 from rest_framework.response import Response
 from rest_framework import status
 from django.middleware.csrf import get_token
 from .managers import UserManager
+from .models import Profile
 from django.contrib.auth.models import User
 from django.contrib.auth import login, logout
 
+# Page sizes of the user directory
+DEFAULT_DIRECTORY_PAGE = 100
+MAX_DIRECTORY_PAGE = 1000
+
 def csrf_token(request):
     return JsonResponse({'csrfToken': get_token(request)})
 
@@ -35,7 +40,8 @@ def images(request):
 def check_session(request):
     user = get_user(request)
     if user.is_authenticated:
-        return Response({"authenticated": True, "username": user.username}, status=200)
+        # user_id identifies the user to the routing backend (backend/chat_access.py)
+        return Response({"authenticated": True, "username": user.username, "user_id": user.id}, status=200)
     return Response({"authenticated": False}, status=401)
 
 @api_view(['POST'])
@@ -66,6 +72,30 @@ def fetch_users(request):
     user_data = UserManager.fetch_all_users()
     return JsonResponse(user_data, safe=False)
 
+@api_view(["GET"])
+@permission_classes([IsAuthenticated])
+def user_directory(request):
+    """
+    The user directory, ordered by user id, optionally filtered by `role` and
+    by a `username` prefix. With `limit` / `cursor` one page is returned as
+    {"users", "has_more", "next_cursor"}; otherwise every matching user is
+    streamed as one JSON array.
+    """
+    role = request.GET.get("role")
+    if role and role not in dict(Profile.ROLE_CHOICES):
+        return JsonResponse({"error": "Unknown role"}, status=400)
+    users = UserManager.directory_users(role=role, username=request.GET.get("username"))
+
+    if "limit" in request.GET or "cursor" in request.GET:
+        try:
+            limit = min(max(int(request.GET.get("limit", DEFAULT_DIRECTORY_PAGE)), 1), MAX_DIRECTORY_PAGE)
+            cursor = int(request.GET["cursor"]) if request.GET.get("cursor") else None
+        except ValueError:
+            return JsonResponse({"error": "Invalid limit or cursor"}, status=400)
+        return JsonResponse(UserManager.directory_page(users, limit, cursor))
+
+    return StreamingHttpResponse(UserManager.stream_directory(users), content_type="application/json")
+
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_user(request, user_name):
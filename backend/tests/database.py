@@ -0,0 +1,78 @@
+"""
+Rows in the Django database for tests of the modules that use it directly.
+These tests are skipped unless the DB_* settings point at a migrated database.
+"""
+import json
+import unittest
+import uuid
+
+from history_hydration import database_settings, psycopg2
+
+requires_database = unittest.skipUnless(
+    psycopg2 is not None and database_settings()["dbname"],
+    "needs the Django database (DB_NAME and the other DB_* settings)",
+)
+
+
+class DatabaseFixture:
+    """Creates users, chats and messages, and deletes them again on close()."""
+
+    def __init__(self):
+        self.settings = {k: v for k, v in database_settings().items() if v}
+        self.connection = psycopg2.connect(**self.settings)
+        self.connection.autocommit = True
+        self.users = []
+
+    def execute(self, sql, params=()):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall() if cursor.description else None
+
+    def user(self):
+        (user_id,), = self.execute(
+            """
+            INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email,
+                                   is_staff, is_active, date_joined)
+            VALUES ('!', false, %s, '', '', '', false, true, now())
+            RETURNING id
+            """,
+            (f"test-{uuid.uuid4()}",),
+        )
+        self.users.append(user_id)
+        return user_id
+
+    def chat(self, user_id, deleted=False):
+        chat_id = str(uuid.uuid4())
+        self.execute(
+            """
+            INSERT INTO chats_chats (chat_id, chat_name, created_at, updated_at, user_id, deleted_at,
+                                     history_version, last_message_at, message_count, total_bytes)
+            VALUES (%s, 'test', now(), now(), %s, CASE WHEN %s THEN now() END, 0, now(), 0, 0)
+            """,
+            (chat_id, user_id, deleted),
+        )
+        return chat_id
+
+    def message(self, chat_id, user_id, content, message_id=None):
+        message_id = message_id or str(uuid.uuid4())
+        self.execute(
+            """
+            INSERT INTO chats_messages (chat_id, user_id, message, message_id, time_sent)
+            VALUES (%s, %s, %s, %s, clock_timestamp())
+            """,
+            (chat_id, user_id, json.dumps({"role": "user", "content": content}), message_id),
+        )
+        return message_id
+
+    def contents(self, chat_id):
+        rows = self.execute(
+            "SELECT message->>'content' FROM chats_messages WHERE chat_id = %s ORDER BY time_sent, id", (chat_id,))
+        return [content for content, in rows]
+
+    def close(self):
+        if self.users:
+            users = (tuple(self.users),)
+            self.execute("DELETE FROM chats_messages WHERE user_id IN %s", users)
+            self.execute("DELETE FROM chats_chats WHERE user_id IN %s", users)
+            self.execute("DELETE FROM auth_user WHERE id IN %s", users)
+        self.connection.close()
@@ -0,0 +1,147 @@
+import os
+import unittest
+import uuid
+from unittest import mock
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+try:
+    from starlette.testclient import TestClient
+except ImportError:
+    # The test client needs httpx, which the backend itself does not
+    TestClient = None
+
+import chat_access  # noqa: E402
+from chat_access import ChatAccess, SessionAuth  # noqa: E402
+import deep  # noqa: E402
+import deep_asgi  # noqa: E402
+
+OWNER = 1
+OTHER = 2
+SESSIONS = {"owner-session": OWNER, "other-session": OTHER}
+
+
+class FakeResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class SessionAuthTests(unittest.TestCase):
+    def test_session_is_checked_once_and_cached(self):
+        auth = SessionAuth(url="http://django")
+        with mock.patch("requests.get", return_value=FakeResponse(200, {"authenticated": True, "user_id": 7})) as get:
+            self.assertEqual(auth.user_id("key"), 7)
+            self.assertEqual(auth.user_id("key"), 7)
+        get.assert_called_once()
+        self.assertEqual(get.call_args.kwargs["cookies"], {chat_access.SESSION_COOKIE: "key"})
+
+    def test_logged_out_session_has_no_user(self):
+        auth = SessionAuth(url="http://django")
+        with mock.patch("requests.get", return_value=FakeResponse(401, {"authenticated": False})):
+            self.assertIsNone(auth.user_id("key"))
+        self.assertIsNone(auth.user_id(None))
+
+    def test_expired_entry_is_checked_again(self):
+        auth = SessionAuth(url="http://django", ttl=-1)
+        with mock.patch("requests.get", return_value=FakeResponse(200, {"user_id": 7})) as get:
+            auth.user_id("key")
+            auth.user_id("key")
+        self.assertEqual(get.call_count, 2)
+
+
+class ChatAccessTests(unittest.TestCase):
+    def test_saved_chat_belongs_to_its_owner(self):
+        chat_id = str(uuid.uuid4())
+        access = ChatAccess(owner={chat_id: OWNER}.get)
+        self.assertTrue(access.allowed(chat_id, OWNER))
+        self.assertFalse(access.allowed(chat_id, OTHER))
+
+    def test_unsaved_chat_belongs_to_its_first_user(self):
+        access = ChatAccess(owner=lambda chat_id: None)
+        created, used = str(uuid.uuid4()), str(uuid.uuid4())
+        access.claim(created, OWNER)
+        self.assertFalse(access.allowed(created, OTHER))
+        self.assertTrue(access.allowed(used, OTHER))
+        self.assertFalse(access.allowed(used, OWNER))
+
+    def test_invalid_chat_id_and_failed_lookup_are_refused(self):
+        def broken(chat_id):
+            raise RuntimeError("database is down")
+
+        self.assertFalse(ChatAccess().allowed("not-a-uuid", OWNER))
+        self.assertFalse(ChatAccess(owner=broken).allowed(str(uuid.uuid4()), OWNER))
+
+
+class ChatRouteTests(unittest.TestCase):
+    def setUp(self):
+        self.chat_id = str(uuid.uuid4())
+        patches = [
+            mock.patch.object(chat_access, "ENABLED", True),
+            mock.patch.object(deep.sessions, "user_id", SESSIONS.get),
+            mock.patch.object(deep, "chat_owners", ChatAccess(owner={self.chat_id: OWNER}.get)),
+            mock.patch.object(deep.history_hydrator, "enabled", False),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        deep.conversations.replace(self.chat_id, [{"role": "user", "content": "secret"}])
+        self.client = deep.app.test_client()
+
+    def request(self, method, url, session=None, json=None):
+        """Returns (status, body) of a request with the given session cookie."""
+        if session:
+            self.client.set_cookie(chat_access.SESSION_COOKIE, session)
+        response = self.client.open(url, method=method, json=json)
+        return response.status_code, response.get_json()
+
+    def test_owner_can_switch_to_and_read_the_chat(self):
+        status, body = self.request("POST", "/switch-chat", "owner-session", json={"chat_id": self.chat_id})
+        self.assertEqual(status, 200)
+        self.assertTrue(body["cached"])
+        status, body = self.request("GET", f"/fetch-messages/{self.chat_id}")
+        self.assertEqual(body["messages"], [{"role": "user", "content": "secret"}])
+
+    def test_other_user_is_refused(self):
+        for method, url, body in (
+            ("POST", "/switch-chat", {"chat_id": self.chat_id}),
+            ("GET", f"/fetch-messages/{self.chat_id}", None),
+            ("POST", "/send-chat-history", {"chat_id": self.chat_id, "messages": []}),
+            ("POST", "/chat", {"chat_id": self.chat_id, "message": "hi", "model": [{"value": deep.TITLE_MODEL}]}),
+        ):
+            with self.subTest(url=url):
+                status, _ = self.request(method, url, "other-session", json=body)
+                self.assertEqual(status, 403)
+        self.assertEqual(deep.conversations.messages(self.chat_id), [{"role": "user", "content": "secret"}])
+
+    def test_anonymous_request_is_refused(self):
+        self.assertEqual(self.request("GET", f"/fetch-messages/{self.chat_id}")[0], 401)
+        self.assertEqual(self.request("POST", "/new-chat", json={"model": deep.TITLE_MODEL})[0], 401)
+
+    def test_new_chat_belongs_to_its_creator(self):
+        _, body = self.request("POST", "/new-chat", "owner-session", json={"model": deep.TITLE_MODEL})
+        chat_id = body["chat_id"]
+        self.assertEqual(self.request("POST", "/switch-chat", "other-session", json={"chat_id": chat_id})[0], 403)
+        self.assertEqual(self.request("POST", "/switch-chat", "owner-session", json={"chat_id": chat_id})[0], 200)
+
+
+@unittest.skipIf(TestClient is None, "starlette's test client needs httpx")
+class AsgiChatRouteTests(ChatRouteTests):
+    """The same checks on the ASGI entry point."""
+
+    def setUp(self):
+        super().setUp()
+        self.client = TestClient(deep_asgi.app)
+
+    def request(self, method, url, session=None, json=None):
+        if session:
+            self.client.cookies.set(chat_access.SESSION_COOKIE, session)
+        response = self.client.request(method, url, json=json)
+        return response.status_code, response.json()
+
+
+if __name__ == "__main__":
+    unittest.main()
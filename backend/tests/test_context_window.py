@@ -0,0 +1,141 @@
+import asyncio
+import tempfile
+import unittest
+
+from context_window import (
+    SUMMARY_PREFIX, ContextManager, SummaryCache, estimate_tokens, message_tokens, prompt_budget,
+)
+
+MODEL = "deepseek-ai/DeepSeek-R1-0528-Qwen3-8B"
+# Leaves the 1024-token minimum budget for the prompt
+MAX_TOKENS = 32768
+
+
+def turns(count, words=50):
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * words}
+        for i in range(count)
+    ]
+
+
+class RecordingSummarizer:
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    async def __call__(self, previous, messages):
+        self.calls.append((previous, [m["content"] for m in messages]))
+        if self.fail:
+            raise RuntimeError("summary model is down")
+        return f"{previous}+{len(messages)}" if previous else f"summary of {len(messages)}"
+
+
+def fit(manager, chat_id, messages):
+    return asyncio.run(manager.fit(chat_id, messages, MODEL, MAX_TOKENS))
+
+
+class EstimateTests(unittest.TestCase):
+    def test_ascii_and_non_ascii_text(self):
+        self.assertEqual(estimate_tokens(""), 0)
+        self.assertEqual(estimate_tokens("abcd"), 1)
+        self.assertEqual(estimate_tokens("abcde"), 2)
+        self.assertEqual(estimate_tokens("日本語"), 3)
+
+    def test_budget_leaves_room_for_the_answer(self):
+        self.assertEqual(prompt_budget(MODEL, 1000), 31768)
+        self.assertEqual(prompt_budget(MODEL, MAX_TOKENS), 1024)
+        self.assertEqual(prompt_budget("unknown", 0), 32000)
+
+
+class FitTests(unittest.TestCase):
+    def test_short_history_is_sent_unchanged(self):
+        manager = ContextManager(summarize=RecordingSummarizer(), cache=SummaryCache())
+        messages = turns(4)
+        self.assertIs(fit(manager, "chat", messages), messages)
+        self.assertEqual(manager.stats()["trimmed_requests"], 0)
+
+    def test_older_turns_are_summarized_and_recent_ones_kept(self):
+        summarize = RecordingSummarizer()
+        manager = ContextManager(summarize=summarize, cache=SummaryCache())
+        messages = [{"role": "system", "content": "Be brief."}] + turns(40)
+        fitted = fit(manager, "chat", messages)
+
+        self.assertEqual(fitted[0], messages[0])
+        self.assertEqual(fitted[1]["role"], "system")
+        self.assertTrue(fitted[1]["content"].startswith(SUMMARY_PREFIX))
+        # The newest turns are kept verbatim and in order
+        self.assertEqual(fitted[-1], messages[-1])
+        self.assertEqual(fitted[2:], messages[-len(fitted[2:]):])
+        self.assertLessEqual(sum(message_tokens(m) for m in fitted), 1024)
+        self.assertEqual(len(summarize.calls), 1)
+        self.assertEqual(manager.stats()["summaries_built"], 1)
+
+    def test_minimum_recent_messages_are_kept_even_over_budget(self):
+        manager = ContextManager(summarize=None, cache=SummaryCache())
+        messages = turns(10, words=200)
+        fitted = fit(manager, "chat", messages)
+        # Without a summarizer the older turns are dropped; at least one turn is always sent
+        self.assertGreaterEqual(len(fitted), 1)
+        self.assertEqual(fitted[-1], messages[-1])
+        self.assertLess(len(fitted), len(messages))
+
+    def test_cached_summary_is_reused_while_new_turns_fit(self):
+        summarize = RecordingSummarizer()
+        manager = ContextManager(summarize=summarize, cache=SummaryCache())
+        messages = turns(40)
+        fit(manager, "chat", messages)
+        fit(manager, "chat", messages + turns(2, words=1))
+        self.assertEqual(len(summarize.calls), 1)
+        self.assertEqual(manager.stats()["summary_cache_hits"], 1)
+
+    def test_summary_rolls_over_with_only_the_uncovered_turns(self):
+        summarize = RecordingSummarizer()
+        manager = ContextManager(summarize=summarize, cache=SummaryCache())
+        messages = turns(40)
+        fit(manager, "chat", messages)
+        covered = len(summarize.calls[0][1])
+
+        fit(manager, "chat", messages + turns(30))
+        self.assertEqual(len(summarize.calls), 2)
+        previous, summarized = summarize.calls[1]
+        self.assertEqual(previous, f"summary of {covered}")
+        # Turns already in the summary are not sent to the summarizer again
+        self.assertEqual(summarized[0], messages[covered]["content"])
+
+    def test_edited_history_invalidates_the_cached_summary(self):
+        summarize = RecordingSummarizer()
+        manager = ContextManager(summarize=summarize, cache=SummaryCache())
+        messages = turns(40)
+        fit(manager, "chat", messages)
+        edited = [{"role": "user", "content": "edited"}] + messages[1:]
+        fit(manager, "chat", edited)
+        self.assertEqual(summarize.calls[1][0], "")
+        self.assertEqual(summarize.calls[1][1][0], "edited")
+
+    def test_failed_summary_falls_back_to_truncation(self):
+        manager = ContextManager(summarize=RecordingSummarizer(fail=True), cache=SummaryCache())
+        messages = turns(40)
+        fitted = fit(manager, "chat", messages)
+        self.assertFalse(any(m["role"] == "system" for m in fitted))
+        self.assertEqual(fitted[-1], messages[-1])
+        self.assertLessEqual(sum(message_tokens(m) for m in fitted), 1024)
+
+
+class SummaryCacheTests(unittest.TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = SummaryCache(max_entries=2, directory="")
+        cache.set("a", {"covered": 1})
+        cache.set("b", {"covered": 2})
+        cache.get("a")
+        cache.set("c", {"covered": 3})
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+
+    def test_entries_survive_in_the_directory(self):
+        with tempfile.TemporaryDirectory() as directory:
+            SummaryCache(directory=directory).set("chat", {"covered": 4, "summary": "s"})
+            self.assertEqual(SummaryCache(directory=directory).get("chat"), {"covered": 4, "summary": "s"})
+
+
+if __name__ == "__main__":
+    unittest.main()
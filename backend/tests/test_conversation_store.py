@@ -0,0 +1,118 @@
+import threading
+import unittest
+
+from conversation_store import ConversationStore
+
+
+def message(content, role="user"):
+    return {"role": role, "content": content}
+
+
+class ConversationStoreTests(unittest.TestCase):
+    def test_chats_are_kept_apart(self):
+        store = ConversationStore()
+        store.append("a", message("hello from a"))
+        store.append("b", message("hello from b"))
+        self.assertEqual(store.get("a"), [message("hello from a")])
+        self.assertEqual(store.get("b"), [message("hello from b")])
+
+    def test_get_returns_a_copy(self):
+        store = ConversationStore()
+        store.append("a", message("one"))
+        store.get("a").append(message("two"))
+        self.assertEqual(store.messages("a"), [message("one")])
+
+    def test_unknown_chat_is_a_miss(self):
+        store = ConversationStore()
+        self.assertIsNone(store.get("missing"))
+        self.assertEqual(store.messages("missing"), [])
+        self.assertIsNone(store.revision("missing"))
+        self.assertFalse(store.touch("missing"))
+        self.assertEqual(store.stats()["misses"], 3)
+
+    def test_least_recently_used_chat_is_evicted(self):
+        store = ConversationStore(max_chats=2)
+        store.append("a", message("a"))
+        store.append("b", message("b"))
+        # Using "a" makes "b" the least recently used chat
+        store.touch("a")
+        store.append("c", message("c"))
+        self.assertIn("a", store)
+        self.assertNotIn("b", store)
+        self.assertIn("c", store)
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_message_budget_evicts_until_it_fits(self):
+        store = ConversationStore(max_messages=4)
+        store.extend("a", [message("1"), message("2")])
+        store.extend("b", [message("3"), message("4")])
+        store.extend("c", [message("5"), message("6"), message("7")])
+        self.assertNotIn("a", store)
+        self.assertNotIn("b", store)
+        stats = store.stats()
+        self.assertEqual(stats["chats"], 1)
+        self.assertEqual(stats["messages"], 3)
+
+    def test_byte_budget_counts_utf8_bytes(self):
+        store = ConversationStore(max_bytes=10)
+        store.append("a", message("12345"))
+        store.append("b", message("ééé"))
+        # 5 + 6 bytes do not fit: "a" goes, "ééé" alone is 6 bytes
+        self.assertNotIn("a", store)
+        self.assertEqual(store.stats()["bytes"], 6)
+
+    def test_chat_being_written_is_never_evicted(self):
+        store = ConversationStore(max_messages=2)
+        store.append("a", message("1"))
+        store.extend("b", [message("2"), message("3"), message("4")])
+        # Over budget on its own, but the chat that was just written is kept
+        self.assertEqual(len(store.messages("b")), 3)
+        self.assertNotIn("a", store)
+
+    def test_replace_resets_the_history_and_the_budget(self):
+        store = ConversationStore()
+        store.extend("a", [message("one"), message("two")])
+        store.replace("a", [message("three")])
+        self.assertEqual(store.messages("a"), [message("three")])
+        stats = store.stats()
+        self.assertEqual(stats["messages"], 1)
+        self.assertEqual(stats["bytes"], 5)
+
+    def test_discard_releases_the_budget(self):
+        store = ConversationStore()
+        store.extend("a", [message("one"), message("two")])
+        store.discard("a")
+        store.discard("a")
+        stats = store.stats()
+        self.assertEqual((stats["chats"], stats["messages"], stats["bytes"]), (0, 0, 0))
+
+    def test_revision_changes_on_every_write(self):
+        store = ConversationStore()
+        store.append("a", message("one"))
+        first = store.revision("a")
+        second = store.extend("a", [message("two")])
+        self.assertGreater(second, first)
+        self.assertEqual(store.revision("a"), second)
+        self.assertEqual(store.last_message("a"), message("two"))
+
+    def test_concurrent_writers_keep_the_counters_consistent(self):
+        store = ConversationStore(max_messages=500)
+
+        def write(worker):
+            for i in range(200):
+                store.append(f"chat-{worker}-{i % 5}", message("x"))
+
+        threads = [threading.Thread(target=write, args=(worker,)) for worker in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = store.stats()
+        self.assertLessEqual(stats["messages"], 500)
+        self.assertEqual(stats["messages"], sum(len(store.messages(f"chat-{w}-{i}")) for w in range(8) for i in range(5)))
+        self.assertEqual(stats["bytes"], stats["messages"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import unittest
+
+from frame_coalescer import MAX_BYTES_LIMIT, MAX_WINDOW_MS, coalesce_frames, coalesce_options
+
+
+async def source(frames):
+    # Floats in the list are pauses, in seconds
+    for frame in frames:
+        if isinstance(frame, float):
+            await asyncio.sleep(frame)
+            continue
+        yield frame
+
+
+def coalesce(frames, **options):
+    async def collect():
+        return [frame async for frame in coalesce_frames(source(frames), **options)]
+    return asyncio.run(collect())
+
+
+def content(*parts):
+    return [{"content": part} for part in parts]
+
+
+class CoalesceFramesTests(unittest.TestCase):
+    def test_first_frame_is_sent_alone_and_the_rest_merged(self):
+        frames = coalesce(content("a", "b", "c", "d"), window_ms=1000, max_bytes=1000)
+        self.assertEqual(frames, [{"content": "a"}, {"content": "bcd"}])
+
+    def test_flush_on_size(self):
+        frames = coalesce(content("a", "bb", "cc", "dd", "e"), window_ms=1000, max_bytes=4)
+        self.assertEqual(frames, content("a", "bbcc", "dde"))
+
+    def test_flush_on_time(self):
+        # 50 ms pause with a 10 ms window: "b" is flushed before "c" arrives
+        frames = coalesce(content("a", "b") + [0.05] + content("c"), window_ms=10, max_bytes=1000)
+        self.assertEqual(frames, content("a", "b", "c"))
+
+    def test_other_frames_flush_first_and_keep_their_order(self):
+        frames = coalesce(
+            content("a", "b", "c") + [{"content": "\n---\n", "separator": True}] + content("d", "e") + [{"done": True}],
+            window_ms=1000,
+            max_bytes=1000,
+        )
+        self.assertEqual(frames, [
+            {"content": "a"},
+            {"content": "bc"},
+            {"content": "\n---\n", "separator": True},
+            # The next response's first token is not delayed
+            {"content": "d"},
+            {"content": "e"},
+            {"done": True},
+        ])
+
+    def test_parallel_streams_are_merged_separately(self):
+        def frame(index, text):
+            return {"model_index": index, "model": f"m{index}", "content": text}
+
+        frames = coalesce(
+            [frame(0, "a"), frame(1, "x"), frame(0, "b"), frame(1, "y"), frame(0, "c"), frame(1, "z")],
+            window_ms=1000,
+            max_bytes=1000,
+        )
+        for index, expected in ((0, ["a", "bc"]), (1, ["x", "yz"])):
+            self.assertEqual([f["content"] for f in frames if f["model_index"] == index], expected)
+            self.assertTrue(all(f["model"] == f"m{index}" for f in frames if f["model_index"] == index))
+
+    def test_zero_window_passes_frames_through(self):
+        frames = content("a", "b", "c")
+        self.assertEqual(coalesce(frames, window_ms=0), frames)
+
+    def test_buffered_content_is_flushed_before_a_source_error(self):
+        async def failing():
+            yield {"content": "a"}
+            yield {"content": "b"}
+            raise RuntimeError("stream broke")
+
+        async def collect(frames):
+            async for frame in coalesce_frames(failing(), window_ms=1000, max_bytes=1000):
+                frames.append(frame)
+
+        frames = []
+        with self.assertRaises(RuntimeError):
+            asyncio.run(collect(frames))
+        self.assertEqual(frames, content("a", "b"))
+
+
+class CoalesceOptionsTests(unittest.TestCase):
+    def test_options_are_clamped(self):
+        self.assertEqual(
+            coalesce_options({"coalesce_ms": 10 ** 6, "coalesce_bytes": -5}),
+            {"window_ms": MAX_WINDOW_MS, "max_bytes": 0},
+        )
+        self.assertEqual(coalesce_options({"coalesce_bytes": 10 ** 9})["max_bytes"], MAX_BYTES_LIMIT)
+
+    def test_invalid_options_use_the_defaults(self):
+        self.assertEqual(coalesce_options({"coalesce_ms": "soon"}), coalesce_options({}))
+
+
+if __name__ == "__main__":
+    unittest.main()
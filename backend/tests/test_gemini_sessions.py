@@ -0,0 +1,95 @@
+import unittest
+from unittest import mock
+
+from google import genai
+from google.genai import chats, types
+
+from gemini_sessions import GeminiSessionCache
+
+MODEL = "gemini-2.5-flash-preview-05-20"
+
+
+def turn(i):
+    return {"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"}
+
+
+class GeminiSessionCacheTests(unittest.TestCase):
+    def setUp(self):
+        # Chats are only created, never sent, so no request is made
+        self.client = genai.Client(api_key="test")
+        self.cache = GeminiSessionCache()
+        self.converted = []
+        self.created = 0
+
+    def create_chat(self, history):
+        self.created += 1
+        return self.client.aio.chats.create(model=MODEL, history=history)
+
+    def convert(self, messages):
+        # Like deep.to_gemini_history: system messages are not part of the history
+        self.converted.extend(messages)
+        return [
+            types.Content(role="user" if m["role"] == "user" else "model", parts=[types.Part(text=m["content"])])
+            for m in messages
+            if m["role"] != "system"
+        ]
+
+    def texts(self, session):
+        return [content.parts[0].text for content in session.chat.get_history()]
+
+    def turn_on(self, history):
+        """One completed turn on `history`; returns the history after it."""
+        session = self.cache.checkout("chat", history, self.create_chat, self.convert)
+        message, reply = turn(len(history)), turn(len(history) + 1)
+        # What sending the message does to the chat's history
+        session.chat = self.create_chat(session.chat.get_history() + self.convert([message, reply]))
+        self.cache.commit(session, history + [message], reply)
+        self.converted.clear()
+        self.created = 0
+        return history + [message, reply]
+
+    def test_plain_follow_up_reuses_the_cached_chat(self):
+        system = {"role": "system", "content": "Be brief."}
+        history = self.turn_on([system, turn(0), turn(1)])
+        chat = self.cache.checkout("chat", history, self.create_chat, self.convert).chat
+        self.cache.commit(self.cache._sessions["chat"], history + [turn(4)], turn(5))
+
+        # The next turn's history: the system prompt is repeated before the user message
+        history = history + [turn(4), turn(5), system]
+        session = self.cache.checkout("chat", history, self.create_chat, self.convert)
+        self.assertIs(session.chat, chat)
+        self.assertEqual(self.created, 0)
+        self.assertEqual(self.cache.stats()["hits"], 2)
+
+    def test_reused_session_converts_only_new_messages(self):
+        history = self.turn_on([turn(i) for i in range(4)]) + [turn(6), turn(7)]
+        session = self.cache.checkout("chat", history, self.create_chat, self.convert)
+        # The message and reply of the last turn are already in the session
+        self.assertEqual(self.converted, [turn(6), turn(7)])
+        self.assertEqual(self.texts(session), [f"message {i}" for i in range(8)])
+        self.assertEqual(self.cache.stats()["hits"], 1)
+
+    def test_history_does_not_depend_on_get_history_returning_the_chat_list(self):
+        # A library version that hands out copies must not lose appended messages
+        original = chats.AsyncChat.get_history
+
+        def copied_history(chat, curated=False):
+            return list(original(chat, curated))
+
+        history = self.turn_on([turn(0), turn(1)]) + [turn(4), turn(5)]
+        with mock.patch.object(chats.AsyncChat, "get_history", copied_history):
+            session = self.cache.checkout("chat", history, self.create_chat, self.convert)
+            self.assertEqual(self.texts(session), [f"message {i}" for i in range(6)])
+            self.assertEqual(len(session.chat.get_history(curated=True)), 6)
+
+    def test_diverged_history_rebuilds_the_session(self):
+        history = self.turn_on([turn(i) for i in range(4)])
+        edited = [{"role": "user", "content": "edited"}] + history[1:]
+        session = self.cache.checkout("chat", edited, self.create_chat, self.convert)
+        self.assertEqual(self.converted, edited)
+        self.assertEqual(self.texts(session)[0], "edited")
+        self.assertEqual(self.cache.stats()["rebuilds"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import threading
+import time
+import unittest
+import uuid
+
+from conversation_store import ConversationStore
+from history_hydration import HistoryHydrator, MessageLoader
+
+from tests.database import DatabaseFixture, requires_database
+
+
+class SlowLoader:
+    """Stands in for MessageLoader; records how many loads of a chat overlap."""
+    available = True
+
+    def __init__(self, delay=0.01):
+        self.delay = delay
+        self.loads = 0
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def load(self, chat_id, user_id, after=None):
+        with self._lock:
+            self.loads += 1
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        if after is None:
+            return [{"role": "user", "content": "hello"}], (1, 1)
+        return [], after
+
+
+class HistoryHydratorTests(unittest.TestCase):
+    def test_cold_chat_is_loaded_once(self):
+        loader = SlowLoader()
+        hydrator = HistoryHydrator(ConversationStore(), loader, refresh_interval=60, enabled=True)
+        self.assertEqual(hydrator.hydrate("chat", 1), "database")
+        self.assertEqual(hydrator.hydrate("chat", 1), "memory")
+        self.assertEqual(loader.loads, 1)
+
+    def test_anonymous_requests_are_not_hydrated(self):
+        loader = SlowLoader()
+        hydrator = HistoryHydrator(ConversationStore(), loader, refresh_interval=60, enabled=True)
+        self.assertIsNone(hydrator.hydrate("chat", None))
+        self.assertEqual(loader.loads, 0)
+
+    def test_locally_changed_chat_is_not_queried(self):
+        loader = SlowLoader()
+        store = ConversationStore()
+        hydrator = HistoryHydrator(store, loader, refresh_interval=0, enabled=True)
+        hydrator.hydrate("chat", 1)
+        store.append("chat", {"role": "assistant", "content": "hi"})
+        self.assertEqual(hydrator.hydrate("chat", 1), "memory")
+        self.assertEqual(loader.loads, 1)
+
+    def test_concurrent_switches_never_load_a_chat_twice_at_once(self):
+        loader = SlowLoader(delay=0.005)
+        # Every switch tops the chat up, so every switch takes the chat's lock and loads
+        hydrator = HistoryHydrator(ConversationStore(), loader, refresh_interval=0, enabled=True)
+        start = threading.Barrier(16)
+
+        def switch():
+            start.wait()
+            for _ in range(10):
+                hydrator.hydrate("chat", 1)
+
+        threads = [threading.Thread(target=switch) for _ in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(loader.max_running, 1)
+        self.assertEqual(loader.loads, 160)
+        # Locks are dropped once nobody holds or waits on them
+        self.assertEqual(len(hydrator._chat_locks), 0)
+
+
+@requires_database
+class MessageLoaderTests(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture()
+        self.addCleanup(self.db.close)
+        self.owner = self.db.user()
+        self.other = self.db.user()
+        self.chat_id = self.db.chat(self.owner)
+        for i in range(5):
+            self.db.message(self.chat_id, self.owner, f"message {i}")
+        self.loader = MessageLoader(page_size=2)
+        self.addCleanup(self.loader.close)
+
+    def test_owner_reads_every_page(self):
+        messages, watermark = self.loader.load(self.chat_id, self.owner)
+        self.assertEqual([m["content"] for m in messages], [f"message {i}" for i in range(5)])
+        self.db.message(self.chat_id, self.owner, "later")
+        messages, _ = self.loader.load(self.chat_id, self.owner, watermark)
+        self.assertEqual(messages, [{"role": "user", "content": "later"}])
+
+    def test_other_user_reads_nothing(self):
+        self.assertEqual(self.loader.load(self.chat_id, self.other), ([], None))
+        hydrator = HistoryHydrator(ConversationStore(), self.loader, enabled=True)
+        hydrator.hydrate(self.chat_id, self.other)
+        self.assertEqual(hydrator.store.messages(self.chat_id), [])
+
+    def test_deleted_chat_reads_nothing(self):
+        chat_id = self.db.chat(self.owner, deleted=True)
+        self.db.message(chat_id, self.owner, "gone")
+        self.assertEqual(self.loader.load(chat_id, self.owner), ([], None))
+
+    def test_owner(self):
+        self.assertEqual(self.loader.owner(self.chat_id), self.owner)
+        self.assertIsNone(self.loader.owner(str(uuid.uuid4())))
+
+
+if __name__ == "__main__":
+    unittest.main()
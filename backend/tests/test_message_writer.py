@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+import uuid
+
+from message_writer import MessageWriter, persist_response
+from tests.database import DatabaseFixture, requires_database
+
+
+class RecordingWriter:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, chat_id, user_id, message_id, message):
+        self.submitted.append((chat_id, user_id, message_id, message["content"]))
+
+
+class PersistResponseTests(unittest.TestCase):
+    def test_final_response_is_submitted_for_the_user(self):
+        async def frames():
+            yield {"content": "Hel"}
+            yield {"content": "\n---\n", "separator": True}
+            yield {"content": "lo"}
+
+        async def consume(writer):
+            return [frame async for frame in persist_response(frames(), writer, "chat", 7, "id", prefix="**M:**\n")]
+
+        writer = RecordingWriter()
+        self.assertEqual(len(asyncio.run(consume(writer))), 3)
+        self.assertEqual(writer.submitted, [("chat", 7, "id", "**M:**\nHello")])
+
+    def test_anonymous_messages_are_not_queued(self):
+        writer = MessageWriter(settings={"dbname": "unused"}, enabled=True)
+        self.assertFalse(writer.submit("chat", None, "id", {"role": "assistant", "content": "x"}))
+
+
+@requires_database
+class MessageWriterTests(unittest.TestCase):
+    def setUp(self):
+        self.db = DatabaseFixture()
+        self.addCleanup(self.db.close)
+        self.owner = self.db.user()
+        self.other = self.db.user()
+        self.chat_id = self.db.chat(self.owner)
+        self.other_chat_id = self.db.chat(self.other)
+        self.message_id = self.db.message(self.chat_id, self.owner, "original")
+
+    def write(self, *messages):
+        writer = MessageWriter(max_retries=0, flush_interval=0.05)
+        for chat_id, user_id, message_id, content in messages:
+            self.assertTrue(writer.submit(chat_id, user_id, message_id, {"role": "assistant", "content": content}))
+        # Flushes the queue
+        writer.close()
+
+    def test_owner_inserts_and_updates_messages(self):
+        new_id = str(uuid.uuid4())
+        self.write((self.chat_id, self.owner, new_id, "partial"))
+        self.write((self.chat_id, self.owner, new_id, "final"), (self.chat_id, self.owner, self.message_id, "edited"))
+        self.assertEqual(self.db.contents(self.chat_id), ["edited", "final"])
+        (count,), = self.db.execute("SELECT message_count FROM chats_chats WHERE chat_id = %s", (self.chat_id,))
+        self.assertEqual(count, 1)
+
+    def test_foreign_chat_and_message_ids_write_nothing(self):
+        self.write(
+            # Another user's chat
+            (self.chat_id, self.other, str(uuid.uuid4()), "injected"),
+            # Another user's message, in its chat
+            (self.chat_id, self.other, self.message_id, "overwritten"),
+        )
+        self.assertEqual(self.db.contents(self.chat_id), ["original"])
+        (count, version), = self.db.execute(
+            "SELECT message_count, history_version FROM chats_chats WHERE chat_id = %s", (self.chat_id,))
+        self.assertEqual((count, version), (0, 0))
+
+    def test_foreign_message_id_in_own_chat_leaves_the_original_alone(self):
+        self.write((self.other_chat_id, self.other, self.message_id, "mine"))
+        self.assertEqual(self.db.contents(self.chat_id), ["original"])
+        self.assertEqual(self.db.contents(self.other_chat_id), ["mine"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+# The Gemini client refuses to be created without a key; no request is made
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import deep  # noqa: E402
+
+MODELS = [
+    {"value": "deepseek-ai/DeepSeek-R1", "name": "R1"},
+    {"value": "deepseek-ai/DeepSeek-V3-0324", "name": "V3"},
+]
+
+
+async def fake_chute(user_message, model, chat_id, config, record=True):
+    yield {"content": f"{model} says hi"}
+    if model == MODELS[0]["value"]:
+        raise RuntimeError("upstream went away")
+    yield {"content": " and bye"}
+
+
+async def collect(frames):
+    return [frame async for frame in frames]
+
+
+class GenerateParallelTests(unittest.TestCase):
+    def run_parallel(self, chat_id):
+        with mock.patch.object(deep, "invoke_chute", fake_chute), \
+                mock.patch.object(deep.message_writer, "enabled", False):
+            return asyncio.run(collect(deep.generate_parallel("hi", MODELS, chat_id, None, ["a", "b"])))
+
+    def test_failed_model_gets_an_error_frame_before_done(self):
+        frames = self.run_parallel("parallel-error")
+        failed = [frame for frame in frames if frame["model_index"] == 0]
+        self.assertEqual(failed[0]["content"], "deepseek-ai/DeepSeek-R1 says hi")
+        self.assertEqual(failed[-2], {"model_index": 0, "model": MODELS[0]["value"], "error": "upstream went away"})
+        self.assertEqual(failed[-1], {"model_index": 0, "model": MODELS[0]["value"], "done": True})
+
+    def test_other_models_are_not_affected(self):
+        frames = self.run_parallel("parallel-other")
+        other = [frame for frame in frames if frame["model_index"] == 1]
+        self.assertEqual("".join(frame.get("content", "") for frame in other), "deepseek-ai/DeepSeek-V3-0324 says hi and bye")
+        self.assertFalse(any("error" in frame for frame in other))
+        self.assertTrue(other[-1]["done"])
+        # Both partial responses are kept in the history
+        self.assertEqual(len(deep.conversations.messages("parallel-other")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
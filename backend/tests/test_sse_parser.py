@@ -0,0 +1,97 @@
+import importlib.util
+import json
+import os
+import unittest
+from unittest import mock
+
+import sse_parser
+from sse_parser import SSEParseError, SSEParser
+
+
+def event(content, key="content"):
+    return b"data: " + json.dumps({"choices": [{"delta": {key: content}}]}).encode("utf-8") + b"\n\n"
+
+
+def stdlib_backend():
+    """A separate copy of the module that uses the standard library json."""
+    spec = importlib.util.spec_from_file_location("sse_parser_stdlib", sse_parser.__file__)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, {"SSE_JSON_BACKEND": "json"}):
+        spec.loader.exec_module(module)
+    return module
+
+
+class SSEParserTests(unittest.TestCase):
+    parser_class = SSEParser
+
+    def test_complete_events(self):
+        parser = self.parser_class()
+        self.assertEqual(parser.feed(event("Hel") + event("lo")), ["Hel", "lo"])
+
+    def test_event_split_across_chunks(self):
+        data = event("héllo wörld")
+        parser = self.parser_class()
+        items = []
+        # Split at every byte, including inside multi-byte characters
+        for i in range(len(data)):
+            items += parser.feed(data[i:i + 1])
+        self.assertEqual(items, ["héllo wörld"])
+
+    def test_crlf_line_endings(self):
+        parser = self.parser_class()
+        data = event("a").replace(b"\n", b"\r\n") + b": ping\r\n\r\n" + event("b").replace(b"\n", b"\r\n")
+        self.assertEqual(parser.feed(data[:7]) + parser.feed(data[7:]), ["a", "b"])
+
+    def test_ndjson_stream(self):
+        parser = self.parser_class()
+        line = json.dumps({"choices": [{"delta": {"content": "x"}}]}).encode("utf-8")
+        self.assertEqual(parser.feed(line + b"\n" + line + b"\n"), ["x", "x"])
+
+    def test_events_without_content_are_skipped(self):
+        parser = self.parser_class()
+        data = event("assistant", key="role") + b"event: ping\n" + event("") + event("ok")
+        self.assertEqual(parser.feed(data), ["ok"])
+
+    def test_done_stops_the_stream(self):
+        parser = self.parser_class()
+        self.assertEqual(parser.feed(event("a") + b"data: [DONE]\n\n" + event("b")), ["a"])
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.feed(event("c")), [])
+
+    def test_malformed_event_is_reported_in_place(self):
+        parser = self.parser_class()
+        items = parser.feed(event("a") + b'data: {"content": oops}\n\n' + event("b"))
+        self.assertEqual(items[0], "a")
+        self.assertIsInstance(items[1], SSEParseError)
+        self.assertEqual(items[2], "b")
+
+    def test_flush_parses_an_unterminated_event(self):
+        parser = self.parser_class()
+        self.assertEqual(parser.feed(event("tail").rstrip(b"\n")), [])
+        self.assertEqual(parser.flush(), ["tail"])
+        self.assertEqual(parser.flush(), [])
+
+
+class StdlibSSEParserTests(SSEParserTests):
+    """The same cases with the standard library backend (orjson not installed)."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.module = stdlib_backend()
+        cls.parser_class = cls.module.SSEParser
+
+    def test_backend(self):
+        self.assertEqual(self.module.JSON_BACKEND, "json")
+        self.assertEqual(self.module.loads(b'{"a": "\\u00e9"}'), {"a": "é"})
+        # str is accepted as well, like orjson.loads
+        self.assertEqual(self.module.loads('{"a": "é"}'), {"a": "é"})
+        self.assertEqual(json.loads(self.module.dumps({"a": "é"})), {"a": "é"})
+
+    def test_malformed_event_is_reported_in_place(self):
+        parser = self.parser_class()
+        items = parser.feed(event("a") + b'data: {"content": oops}\n\n')
+        self.assertIsInstance(items[1], self.module.SSEParseError)
+
+
+if __name__ == "__main__":
+    unittest.main()
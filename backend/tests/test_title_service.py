@@ -0,0 +1,97 @@
+import asyncio
+import importlib.util
+import os
+import unittest
+from unittest import mock
+
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+import deep  # noqa: E402
+import sse_parser  # noqa: E402
+from title_service import TitleService  # noqa: E402
+
+
+def stdlib_loads():
+    """sse_parser.loads as it is when orjson is not installed."""
+    spec = importlib.util.spec_from_file_location("sse_parser_stdlib", sse_parser.__file__)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, {"SSE_JSON_BACKEND": "json"}):
+        spec.loader.exec_module(module)
+    return module.loads
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+async def titles(service, prompts):
+    return await asyncio.gather(*(service.title(prompt) for prompt in prompts))
+
+
+class TitleBatchingTests(unittest.TestCase):
+    prompts = ["plan a trip", "fix my bike", "learn french"]
+
+    async def generate_one(self, prompt):
+        return f"single: {prompt}"
+
+    def test_batched_gemini_titles_without_orjson(self):
+        generate_content = mock.AsyncMock(return_value=FakeResponse('["Trip", "Bike", "French"]'))
+        service = TitleService(self.generate_one, deep.generate_chat_names, batch_window_ms=20)
+        with mock.patch.object(deep, "loads", stdlib_loads()), \
+                mock.patch.object(deep.gemini_client.aio.models, "generate_content", generate_content):
+            result = asyncio.run(titles(service, self.prompts))
+
+        self.assertEqual(result, ["Trip", "Bike", "French"])
+        stats = service.stats()
+        self.assertEqual((stats["upstream_calls"], stats["batches"], stats["batched_prompts"]), (1, 1, 3))
+        self.assertEqual(stats["failed_batches"], 0)
+
+    def test_failed_batch_is_not_counted_as_batched(self):
+        async def broken_batch(prompts):
+            return ["only one title"]
+
+        service = TitleService(self.generate_one, broken_batch, batch_window_ms=20)
+        result = asyncio.run(titles(service, self.prompts))
+
+        self.assertEqual(result, [f"single: {prompt}" for prompt in self.prompts])
+        stats = service.stats()
+        self.assertEqual((stats["batches"], stats["batched_prompts"], stats["failed_batches"]), (0, 0, 1))
+        # The failed batch call plus one call per prompt
+        self.assertEqual(stats["upstream_calls"], 4)
+
+    def test_waiting_caller_survives_the_cancelled_owner(self):
+        started = []
+
+        async def generate_one(prompt):
+            started.append(prompt)
+            if len(started) == 1:
+                # The first generation never finishes on its own
+                await asyncio.Event().wait()
+            return "Trip"
+
+        async def scenario():
+            service = TitleService(generate_one)
+            owner = asyncio.create_task(service.title("plan a trip"))
+            await asyncio.sleep(0)
+            waiter = asyncio.create_task(service.title("plan a trip"))
+            await asyncio.sleep(0)
+            owner.cancel()
+            title = await asyncio.wait_for(waiter, 1)
+            self.assertTrue(owner.cancelled())
+            return title, service.stats()
+
+        title, stats = asyncio.run(scenario())
+        self.assertEqual(title, "Trip")
+        self.assertEqual(stats["coalesced"], 1)
+        self.assertEqual(len(started), 2)
+
+    def test_repeated_prompt_is_served_from_the_cache(self):
+        service = TitleService(self.generate_one)
+        asyncio.run(titles(service, ["Plan a trip"]))
+        self.assertEqual(asyncio.run(titles(service, ["  plan a   TRIP "])), ["single: Plan a trip"])
+        self.assertEqual(service.stats()["hits"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
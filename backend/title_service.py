@@ -0,0 +1,190 @@
+"""
+Chat title generation with caching, single-flight and micro-batching.
+
+Many chats open with near-identical prompts, so titles are cached by their
+normalized prompt (LRU with a TTL). Identical prompts that are requested while
+a title is already being generated wait for that result instead of calling the
+model again. Optionally, prompts requested within a short window are sent to
+the model as one batch and the results are split back to their callers.
+"""
+import asyncio
+from collections import OrderedDict
+import os
+import re
+import threading
+import time
+
+CACHE_SIZE = int(os.environ.get("TITLE_CACHE_SIZE", 2048))
+CACHE_TTL = float(os.environ.get("TITLE_CACHE_TTL", 24 * 60 * 60))
+# 0 disables micro-batching
+BATCH_WINDOW_MS = float(os.environ.get("TITLE_BATCH_WINDOW_MS", 0))
+MAX_BATCH = int(os.environ.get("TITLE_MAX_BATCH", 16))
+# Only the opening of a prompt matters for its title
+NORMALIZED_PROMPT_LENGTH = 500
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt):
+    return _WHITESPACE.sub(" ", str(prompt or "")).strip().lower()[:NORMALIZED_PROMPT_LENGTH]
+
+
+class TitleService:
+    """
+    `generate_one(prompt)` is a coroutine returning one title.
+    `generate_batch(prompts)` (optional) returns a list of titles in order.
+    """
+
+    def __init__(self, generate_one, generate_batch=None, cache_size=CACHE_SIZE, ttl=CACHE_TTL,
+                 batch_window_ms=BATCH_WINDOW_MS, max_batch=MAX_BATCH):
+        self.generate_one = generate_one
+        self.generate_batch = generate_batch
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.batch_window = batch_window_ms / 1000 if generate_batch else 0
+        self.max_batch = max_batch
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._batch = []
+        self._batch_timer = None
+        self.counters = {
+            "hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "upstream_calls": 0,
+            "batches": 0,
+            "batched_prompts": 0,
+            "failed_batches": 0,
+            "errors": 0,
+        }
+
+    async def title(self, prompt):
+        key = normalize_prompt(prompt)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self._count("hits")
+            return cached
+        self._count("misses")
+
+        # Single-flight: join a generation that is already running for this prompt
+        future = self._inflight.get(key)
+        if future is not None:
+            self._count("coalesced")
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # The caller generating it was cancelled, not this one: start over
+                return await self.title(prompt)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            if self.batch_window > 0:
+                title = await self._enqueue(prompt)
+            else:
+                self._count("upstream_calls")
+                title = await self.generate_one(prompt)
+            title = (title or "").strip()
+            if title:
+                self._cache_set(key, title)
+            future.set_result(title)
+            return title
+        except asyncio.CancelledError:
+            # Waiting callers must not hang on a result that never comes
+            future.cancel()
+            raise
+        except Exception as e:
+            self._count("errors")
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _enqueue(self, prompt):
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._batch.append((prompt, waiter))
+        if len(self._batch) >= self.max_batch:
+            self._flush_batch()
+        elif self._batch_timer is None:
+            self._batch_timer = loop.call_later(self.batch_window, self._flush_batch)
+        return await waiter
+
+    def _flush_batch(self):
+        if self._batch_timer is not None:
+            self._batch_timer.cancel()
+            self._batch_timer = None
+        batch, self._batch = self._batch, []
+        if batch:
+            asyncio.ensure_future(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        prompts = [prompt for prompt, _ in batch]
+        titles = None
+        if len(batch) > 1:
+            self._count("upstream_calls")
+            try:
+                titles = await self.generate_batch(prompts)
+                if not isinstance(titles, list) or len(titles) != len(batch):
+                    print(f"Batched title response could not be split, falling back to single calls: {titles!r:.200}")
+                    titles = None
+            except Exception as e:
+                print(f"Batched title generation failed, falling back to single calls: {e}")
+                titles = None
+            # Only batches whose titles were used count as batched
+            if titles is None:
+                self._count("failed_batches")
+            else:
+                self._count("batches")
+                self._count("batched_prompts", len(batch))
+
+        if titles is None:
+            # Single prompt, or the batch response could not be split
+            async def one(prompt):
+                self._count("upstream_calls")
+                return await self.generate_one(prompt)
+            titles = await asyncio.gather(*(one(p) for p in prompts), return_exceptions=True)
+
+        for (_, waiter), title in zip(batch, titles):
+            if waiter.done():
+                continue
+            if isinstance(title, Exception):
+                waiter.set_exception(title)
+            else:
+                waiter.set_result(str(title))
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, title = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return title
+
+    def _cache_set(self, key, title):
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.ttl, title)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self.counters,
+                "cached_titles": len(self._cache),
+                "batch_window_ms": self.batch_window * 1000,
+            }
@@ -53,8 +53,9 @@ function AppContent() {
   }, [csrfToken, fetchCsrfToken, setAuthentication, setRole]); // Add dependency array
 
   const handleNewChat = async () => {
-    const response = await fetch("http://127.0.0.1:5000/new-chat", {
+    const response = await fetch("http://localhost:5000/new-chat", {
       method: "POST",
+      credentials: "include", // sends the Django session cookie
       headers: {
         "Content-Type": "application/json"
       },
@@ -68,20 +68,25 @@ function ChatPage({ onNewChat }) {
     setIsSwitchingChat(true);
     
     try {
-      const response = await fetch('http://127.0.0.1:5000/switch-chat', {
+      // The routing backend loads the chat's history itself (from memory or the database),
+      // so this runs alongside fetching the messages for display
+      const switchRequest = fetch('http://localhost:5000/switch-chat', {
         method: 'POST',
+        credentials: 'include', // sends the Django session cookie
         headers: {
           'Content-Type': 'application/json'
         },
         body: JSON.stringify({
           chat_id: chatId,
         })
-      });
+      }).then(response => response.json());
 
 
       try {
         const response2 = await apiService.get(`chats/get-chat-history/${chatId}/`);
         const data2 = response2.data;
+        // Only upload the history if the routing backend could not load it
+        const switchData = await switchRequest;
         // console.log(data2);
         // data2.forEach((msg, index) => {
         //   addMessage({
@@ -104,17 +109,20 @@ function ChatPage({ onNewChat }) {
           }
         }
 
-        try {
-          const sendingHistory = await fetch('http://127.0.0.1:5000/send-chat-history', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({messages: flaskHistory})
-          });
-        } catch (error) {
-          console.error("Error sending chat history to Flask:", error);
-          throw new Error("Failed to send chat history to Flask: " + error.message);
+        if (!switchData.cached) {
+          try {
+            const sendingHistory = await fetch('http://localhost:5000/send-chat-history', {
+              method: 'POST',
+              credentials: 'include', // sends the Django session cookie
+              headers: {
+                'Content-Type': 'application/json'
+              },
+              body: JSON.stringify({chat_id: chatId, messages: flaskHistory})
+            });
+          } catch (error) {
+            console.error("Error sending chat history to Flask:", error);
+            throw new Error("Failed to send chat history to Flask: " + error.message);
+          }
         }
 
         if (response2.data.error && response2.data.error === "Chat doesn't exist or has no messages") {
@@ -186,7 +194,7 @@ function ChatPage({ onNewChat }) {
         return; // Chat already has a proper name
       }
 
-      const response = await fetch(`http://127.0.0.1:5000/get-chat-name`, {
+      const response = await fetch(`http://localhost:5000/get-chat-name`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
@@ -290,8 +298,10 @@ function ChatPage({ onNewChat }) {
       await new Promise(resolve => setTimeout(resolve, 100));
 
       // Create only the first bot message initially
+      // Ids of every model's response, also used by the routing backend when it saves them
+      const responseIds = models.map(() => crypto.randomUUID());
       const botMessageIds = [];
-      const firstBotResponseId = crypto.randomUUID();
+      const firstBotResponseId = responseIds[0];
       botMessageIds.push(firstBotResponseId);
       
       const firstModelName = models[0]?.name || 'Model 1';
@@ -304,15 +314,17 @@ function ChatPage({ onNewChat }) {
       });
 
       // Use fetch for streaming - with the activeChatID
-      const response = await fetch('http://127.0.0.1:5000/chat', {
+      const response = await fetch('http://localhost:5000/chat', {
         method: 'POST',
+        credentials: 'include', // sends the Django session cookie
         headers: {
           'Content-Type': 'application/json'
         },
         body: JSON.stringify({
           message: message,
           model: models,
-          chat_id: activeChatID
+          chat_id: activeChatID,
+          message_ids: responseIds
         })
       });
       
@@ -324,6 +336,8 @@ function ChatPage({ onNewChat }) {
       const reader = response.body.getReader();
       const decoder = new TextDecoder('utf-8');
       let currentModelIndex = 0;
+      // Set when the routing backend saved the responses itself
+      let responsesPersisted = false;
       let accumulatedTexts = new Array(numberOfModels).fill('');
       
       // Initialize the first bot message content with model name
@@ -337,19 +351,21 @@ function ChatPage({ onNewChat }) {
         if (done) {
           console.log("Stream complete");
           
-          // Save all bot responses that were created
-          for (let i = 0; i < botMessageIds.length; i++) {
+          // Save all bot responses that were created in one request
+          if (!responsesPersisted) {
             try {
-              const response = await apiService.post('chats/save-chat/', {
-                chat_id: activeChatID,
-                message: {
-                  role: 'assistant',
-                  content: accumulatedTexts[i]
-                },
-                message_id: botMessageIds[i]
+              const response = await apiService.post('chats/save-chat-batch/', {
+                messages: botMessageIds.map((messageId, i) => ({
+                  chat_id: activeChatID,
+                  message: {
+                    role: 'assistant',
+                    content: accumulatedTexts[i]
+                  },
+                  message_id: messageId
+                }))
               });
             } catch (error) {
-              console.error(`Error saving bot response ${i}:`, error);
+              console.error("Error saving bot responses:", error);
             }
           }
 
@@ -374,7 +390,9 @@ function ChatPage({ onNewChat }) {
           try {
             const parsedData = JSON.parse(line);
             
-            if (parsedData.error) {
+            if (parsedData.persisted) {
+              responsesPersisted = true;
+            } else if (parsedData.error) {
               console.error("Error from server:", parsedData.error);
               if (currentModelIndex < botMessageIds.length) {
                 updateMessage(botMessageIds[currentModelIndex], { 
@@ -401,7 +419,7 @@ function ChatPage({ onNewChat }) {
                   console.log(`Switching to model ${currentModelIndex}`);
                   
                   // Create the next bot message
-                  const nextBotResponseId = crypto.randomUUID();
+                  const nextBotResponseId = responseIds[currentModelIndex];
                   botMessageIds.push(nextBotResponseId);
                   
                   const nextModelName = models[currentModelIndex]?.name || `Model ${currentModelIndex + 1}`;
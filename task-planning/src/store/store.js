@@ -3,9 +3,11 @@ import { immer } from "zustand/middleware/immer";
 import apiService from "../utils/api";
 
 const useStore = create(
-  immer((set) => ({
+  immer((set, get) => ({
     messages: [],
     chats: [],
+    // Watermark of the last chat list sync (see fetchChatIDs)
+    chatsWatermark: null,
     activeChatID: null,
     isAuthenticated: null,
     role: null,
@@ -101,8 +103,9 @@ const useStore = create(
     },
 
     fetchMessagesForID: async (chatID) => {
-      const response = await fetch(`http://127.0.01:5000/fetch-messages/${chatID}`, {
+      const response = await fetch(`http://localhost:5000/fetch-messages/${chatID}`, {
         method: "GET",
+        credentials: "include", // sends the Django session cookie
         headers: {
           "Content-Type": "application/json"
         },
@@ -120,6 +123,11 @@ const useStore = create(
     setAuthentication: (isAuthenticated) => {
       set((state) => {
         state.isAuthenticated = isAuthenticated;
+        if (!isAuthenticated) {
+          // The next user syncs their chat list from scratch
+          state.chats = [];
+          state.chatsWatermark = null;
+        }
       });
     },
 
@@ -144,11 +152,36 @@ const useStore = create(
     },
 
     fetchChatIDs: async () => {
+      // Only fetch the chats created, renamed or deleted since the last sync
       try {
-        const response = await apiService.get('/chats/get-chat-ids/');
-        set((state) => {
-          state.chats = response.data.map(id => ({id: id.chat_id, title: id.chat_name || 'Untitled Chat'}));
-        });
+        let hasMore = true;
+        while (hasMore) {
+          const response = await apiService.get('/chats/get-chat-ids/', {
+            params: { since: get().chatsWatermark || '' }
+          });
+          const { changes, watermark, has_more } = response.data;
+          set((state) => {
+            for (const change of changes) {
+              const index = state.chats.findIndex(chat => chat.id === change.chat_id);
+              if (change.deleted) {
+                if (index !== -1) state.chats.splice(index, 1);
+                continue;
+              }
+              const chat = {id: change.chat_id, title: change.chat_name || 'Untitled Chat', createdAt: change.created_at};
+              if (index === -1) {
+                state.chats.push(chat);
+              } else {
+                state.chats[index] = chat;
+              }
+            }
+            // Most recent first; chats created locally and not synced yet stay on top
+            state.chats.sort((a, b) =>
+              (a.createdAt ? 1 : 0) - (b.createdAt ? 1 : 0) ||
+              (a.createdAt > b.createdAt ? -1 : a.createdAt < b.createdAt ? 1 : 0));
+            state.chatsWatermark = watermark;
+          });
+          hasMore = has_more;
+        }
       } catch (error) {
         console.error("Failed to fetch chat IDs:", error);
       }